@@ -17,6 +17,7 @@ As of 9/22/2024 this framework has handlers for 11 different data sources.
 from file_processor_and_scripts_manager import ScriptManager, FileProcessor
 from directory_watcher import monitor_download_directory
 from FetchEmailClassModularized import EmailFetcher
+#from FetchEmailAsyncio import AsyncEmailFetcher, EmailAccount
 #from FetchEmailFunctionally import fetch_emails_last_24_hours
 from loguru import logger
 from pathlib import Path
@@ -47,8 +48,23 @@ SECRETS = dotenv_values(SECRETS_DIRECTORY)  # load secrets from '.env' file
 IMAP_SERVER = "imap.gmail.com"
 # initiate the email watcher class  (has optional flag 'mark_as_read' that defaults to False)
 # email_fetcher_instance = EmailFetcher(IMAP_SERVER, SECRETS["EMAIL_USER"], SECRETS["EMAIL_PASSWORD"], interval=180, dld=DIRECTORY_FOR_EMAILS)
+# or keep one connection open and let the server push new mail with IMAP IDLE
+# email_fetcher_instance = EmailFetcher(IMAP_SERVER, SECRETS["EMAIL_USER"], SECRETS["EMAIL_PASSWORD"], dld=DIRECTORY_FOR_EMAILS, use_idle=True)
+# adding watermark_store=UIDWatermarkStore() (from generic_imap_functions) fetches only mail newer than the last processed UID
+# adding headers_first=True, attachment_matcher=scripts_manager_instance.get_script_name_for_file downloads only mail a handler wants
+# adding handoff_queue=handoff_queue, with handoff_queue = queue.Queue() also given to monitor_download_directory() below,
+#   processes each saved attachment straight away instead of waiting for the next directory check
+# adding mail_archive=MailArchive() (from generic_mail_archive) keeps each email in an indexed SQLite archive instead of a JSON file in Downloads
+#   together with email_rules=EmailRuleEngine(...) (from generic_email_rules), the rules then run on the fetch thread
+# or watch several accounts and folders from one asyncio loop, each account with its own connection and login limits
+# email_fetcher_instance = AsyncEmailFetcher([
+#     EmailAccount(IMAP_SERVER, SECRETS["EMAIL_USER"], SECRETS["EMAIL_PASSWORD"], folders=["INBOX", "Reports"], interval=180, dld=DIRECTORY_FOR_EMAILS),
+# ])
+# email_fetcher_instance.start() / email_fetcher_instance.stop() replace start_fetching() / stop_fetching() below
 # alternately activate an email fetecher functionally
 # fetch_emails_last_24_hours(IMAP_SERVER, SECRETS["EMAIL_USER"], SECRETS["EMAIL_PASSWORD"], DIRECTORY_FOR_EMAILS, "./Emails_seen.history")
+# or incrementally, remembering the last processed UID instead of every UID seen
+# fetch_emails_last_24_hours(IMAP_SERVER, SECRETS["EMAIL_USER"], SECRETS["EMAIL_PASSWORD"], DIRECTORY_FOR_EMAILS, None, watermark_database="./imap_uid_watermarks.sqlite")
 # start fetcher
 # email_fetcher_instance.start_fetching()
 # fetcher will download each email and it's attachments as it arrives
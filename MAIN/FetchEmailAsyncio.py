@@ -0,0 +1,215 @@
+"""
+Watch several email accounts and folders from one asyncio event loop.
+
+Each (account, folder) pair is an asyncio task that polls with its own EmailFetcher. The blocking
+imap_tools calls run in the default thread pool, so a slow server only holds up its own folder. Every
+account has its own connection limit and minimum time between logins, which keeps several folders of one
+account from tripping the provider's rate limits. A single cancellation Event stops every task.
+
+    fetcher = AsyncEmailFetcher([
+        EmailAccount(IMAP_SERVER, user, password, folders=["INBOX", "Reports"], dld=DIRECTORY_FOR_EMAILS),
+        EmailAccount("imap.example.com", other_user, other_password, interval=300, dld=DIRECTORY_FOR_EMAILS),
+    ])
+    fetcher.start()  # runs the event loop in a background thread
+    ...
+    fetcher.stop()
+"""
+
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from loguru import logger
+from FetchEmailClassModularized import EmailFetcher, RECONNECT_BACKOFF_INITIAL, RECONNECT_BACKOFF_MAX
+
+DEFAULT_POLL_INTERVAL = 600  # seconds between checks of each folder
+ACCOUNT_MAX_CONNECTIONS = 2  # Gmail allows 15 connections per account, leave room for phones and mail clients
+ACCOUNT_MIN_LOGIN_INTERVAL = 5  # seconds between two logins to the same account
+
+
+async def wait_or_cancelled(cancel, seconds):
+    """
+    Sleep unless cancelled first.
+
+    :param cancel: The shared cancellation token
+    :type cancel: asyncio.Event
+    :return: True when cancelled
+    :rtype: bool
+    """
+    try:
+        await asyncio.wait_for(cancel.wait(), timeout=seconds)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+class AccountRateLimiter:
+    """
+    Bound the connections open to one account and space out its logins.
+
+    :param max_connections: Connections open at the same time
+    :type max_connections: int
+    :param min_interval: Seconds between two logins
+    :type min_interval: float
+    """
+
+    def __init__(self, max_connections=ACCOUNT_MAX_CONNECTIONS, min_interval=ACCOUNT_MIN_LOGIN_INTERVAL):
+        self.min_interval = min_interval
+        self._connections = asyncio.Semaphore(max_connections)
+        self._login_lock = asyncio.Lock()
+        self._last_login = None
+
+    @asynccontextmanager
+    async def connection(self, cancel):
+        """Hold one of the account's connections, yields True when cancelled while waiting for it."""
+        async with self._connections:
+            async with self._login_lock:
+                loop = asyncio.get_running_loop()
+                if self._last_login is not None:
+                    wait = self.min_interval - (loop.time() - self._last_login)
+                    if wait > 0 and await wait_or_cancelled(cancel, wait):
+                        yield True
+                        return
+                self._last_login = loop.time()
+            yield cancel.is_set()
+
+
+class EmailAccount:
+    """
+    One account to watch.
+
+    :param imap_server: The IMAP server address
+    :type imap_server: str
+    :param username: The username to log in with
+    :type username: str
+    :param password: The password to log in with
+    :type password: str
+    :param folders: Folders to watch, each polled by its own task
+    :type folders: list of str
+    :param interval: Seconds between checks of each folder
+    :type interval: float
+    :param max_connections: Connections open to this account at the same time
+    :type max_connections: int
+    :param min_login_interval: Seconds between two logins to this account
+    :type min_login_interval: float
+    :param fetcher_options: Passed on to the EmailFetcher of every folder, for example dld, watermark_store or
+        headers_first. Folders poll at the same time from worker threads, so objects given here are shared
+        between threads: UIDWatermarkStore, MailArchive and queue.Queue are safe to share.
+    """
+
+    def __init__(self, imap_server, username, password, folders=("INBOX",), interval=DEFAULT_POLL_INTERVAL,
+                 max_connections=ACCOUNT_MAX_CONNECTIONS, min_login_interval=ACCOUNT_MIN_LOGIN_INTERVAL,
+                 **fetcher_options):
+        self.imap_server = imap_server
+        self.username = username
+        self.folders = list(folders)
+        self.interval = interval
+        # one fetcher per folder, so folders polled at the same time never share a fetcher's state
+        self.fetchers = {
+            folder: EmailFetcher(imap_server, username, password, interval=interval, **fetcher_options)
+            for folder in self.folders
+        }
+        self.limiter = AccountRateLimiter(max_connections, min_login_interval)
+
+    def __repr__(self):
+        return f"EmailAccount({self.username!r} on {self.imap_server!r}, {self.folders})"
+
+
+def poll_folder(fetcher, folder, last_uid=None):
+    """
+    Runs in a worker thread: log in to one folder and process its new mail.
+
+    :return: Highest UID processed, see EmailFetcher.process_new_emails()
+    :rtype: int or None
+    """
+    with fetcher.mailbox_factory(fetcher.imap_server).login(fetcher.username, fetcher.password,
+                                                            initial_folder=folder) as mailbox:
+        return fetcher.process_new_emails(mailbox, last_uid)
+
+
+async def watch_folder(account, folder, cancel):
+    """
+    Poll one folder of one account until cancelled. Failed polls are retried with exponential backoff.
+
+    :type account: EmailAccount
+    :type folder: str
+    :type cancel: asyncio.Event
+    """
+    backoff = RECONNECT_BACKOFF_INITIAL
+    last_uid = None  # UIDs are per folder, so each task keeps its own
+    fetcher = account.fetchers[folder]
+    logger.info(f"Watching {folder} of {account.username}")
+    while not cancel.is_set():
+        try:
+            async with account.limiter.connection(cancel) as cancelled:
+                if cancelled:
+                    break
+                last_uid = await asyncio.to_thread(poll_folder, fetcher, folder, last_uid)
+            delay, backoff = account.interval, RECONNECT_BACKOFF_INITIAL
+        except Exception as e:
+            logger.warning(f"Checking {folder} of {account.username} failed: {e}. Retrying in {backoff} seconds.")
+            delay, backoff = backoff, min(backoff * 2, RECONNECT_BACKOFF_MAX)
+        if await wait_or_cancelled(cancel, delay):
+            break
+    logger.info(f"Stopped watching {folder} of {account.username}")
+
+
+class AsyncEmailFetcher:
+    """
+    Watch every folder of every account concurrently in one event loop.
+
+    :param accounts: The accounts to watch
+    :type accounts: list of EmailAccount
+    """
+
+    def __init__(self, accounts):
+        self.accounts = list(accounts)
+        self.cancel = None
+        self.loop = None
+        self.thread = None
+        self._running = threading.Event()
+
+    async def run(self):
+        """Watch until stop() is called. Can also be awaited directly from other asyncio code."""
+        self.loop = asyncio.get_running_loop()
+        self.cancel = asyncio.Event()
+        tasks = [
+            asyncio.create_task(watch_folder(account, folder, self.cancel), name=f"{account.username}/{folder}")
+            for account in self.accounts
+            for folder in account.folders
+        ]
+        self._running.set()
+        try:
+            await self.cancel.wait()
+        finally:
+            for account in self.accounts:
+                for fetcher in account.fetchers.values():
+                    fetcher.stop_thread.set()  # a poll in progress stops after its current message
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._running.clear()
+
+    def start(self):
+        """Run the event loop in a background thread."""
+        if self.thread is not None and self.thread.is_alive():
+            logger.warning("Email fetching loop is already running.")
+            return
+        for account in self.accounts:
+            for fetcher in account.fetchers.values():
+                fetcher.stop_thread.clear()
+        self.thread = threading.Thread(target=asyncio.run, args=(self.run(),), name="email-asyncio", daemon=True)
+        self.thread.start()
+        self._running.wait()
+        logger.info(f"Watching {sum(len(account.folders) for account in self.accounts)} folders of {len(self.accounts)} accounts.")
+
+    def stop(self, timeout=None):
+        """
+        Cancel every task and wait for the loop to finish.
+
+        :param timeout: Seconds to wait for polls in progress, None waits until they finish
+        :type timeout: float or None
+        """
+        if self.thread is None:
+            return
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.cancel.set)
+        self.thread.join(timeout)
+        logger.info("Email fetching loop has exited.")
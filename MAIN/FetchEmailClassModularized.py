@@ -1,6 +1,6 @@
 """A modularized class for monitoring email and saving JSON objects of email content."""
 
-from imap_tools import MailBox, AND
+from imap_tools import MailBox, AND, U
 import json
 from pathlib import Path
 from dotenv import dotenv_values
@@ -9,6 +9,15 @@ from loguru import logger
 from generic_pathlib_file_methods import sanitize_filename
 import threading
 from datetime import datetime
+from generic_imap_functions import fetch_new_messages, fetch_message_summaries, select_relevant_parts, fetch_parts, StreamedAttachment
+from generic_attachment_functions import write_attachment, AttachmentTooLarge, ATTACHMENT_MAX_BYTES
+from generic_email_rules import SavedAttachment
+
+IDLE_TIMEOUT_SECONDS = 5 * 60  # IDLE is re-issued this often, RFC 2177 asks for less than 29 minutes
+IDLE_POLL_SECONDS = 1  # an IDLE in progress checks for stop_fetching() this often
+RECONNECT_BACKOFF_INITIAL = 1  # seconds before the first reconnect attempt
+RECONNECT_BACKOFF_MAX = 300  # reconnect attempts back off exponentially up to this many seconds
+HANDOFF_STAGING_DIRECTORY_NAME = ".handoff"  # inside the download directory, the directory watcher does not scan it
 
 
 class EmailFetcher:
@@ -27,11 +36,47 @@ class EmailFetcher:
     :type delay: int
     :param ignore_file_types: A list of file SUFFIXs to ignore when downloading attachments.
     :type ignore_file_types: list
+    :param use_idle: Keep one connection open and wait for IMAP IDLE notifications instead of polling every interval.
+    :type use_idle: bool
+    :param mailbox_factory: Called with the server address, returns an object with imap_tools' MailBox interface.
+    :type mailbox_factory: callable
+    :param idle_timeout: Seconds each IDLE waits before it is re-issued.
+    :type idle_timeout: float
+    :param reconnect_backoff: Initial and maximum seconds to wait before reconnecting after a connection error.
+    :type reconnect_backoff: tuple
+    :param watermark_store: Remembers the last processed UID between runs so each poll fetches only new mail.
+    :type watermark_store: generic_imap_functions.UIDWatermarkStore or None
+    :param headers_first: Fetch headers and structure first and download only the parts of relevant messages.
+    :type headers_first: bool
+    :param attachment_matcher: Called with an attachment filename, truthy when a handler wants the file.
+    :type attachment_matcher: callable or None
+    :param message_rules: Sender and subject rules for relevant mail, see generic_imap_functions.DEFAULT_MESSAGE_RULES
+    :type message_rules: list of dict or None
+    :param max_attachment_bytes: Attachments larger than this are not saved, None for no limit.
+    :type max_attachment_bytes: int or None
+    :param handoff_queue: Saved attachments are put here as (path, content_hash) for monitor_download_directory().
+        They are saved into the HANDOFF_STAGING_DIRECTORY_NAME folder so only the handoff dispatches them.
+    :type handoff_queue: queue.Queue or None
+    :param mail_archive: Append each email to this archive instead of writing a JSON file into the download directory.
+        Needs email_rules, without the JSON files Handler_email_json_files never sees the mail to apply them.
+    :type mail_archive: generic_mail_archive.MailArchive or None
+    :param email_rules: Run the actions of the matching routing rules on each email. Required with mail_archive,
+        Handler_email_json_files already applies the rules to the JSON files. Rules that route to a handler need
+        handoff_queue, the handlers then run on the directory watcher's thread.
+    :type email_rules: generic_email_rules.EmailRuleEngine or None
     """
 
-    def __init__(self, imap_server, username, password, mark_as_seen=False, interval=600, ignore_file_types=None, dld=""):
+    def __init__(self, imap_server, username, password, mark_as_seen=False, interval=600, ignore_file_types=None, dld="",
+                 use_idle=False, mailbox_factory=MailBox, idle_timeout=IDLE_TIMEOUT_SECONDS,
+                 reconnect_backoff=(RECONNECT_BACKOFF_INITIAL, RECONNECT_BACKOFF_MAX), watermark_store=None,
+                 headers_first=False, attachment_matcher=None, message_rules=None, max_attachment_bytes=ATTACHMENT_MAX_BYTES,
+                 handoff_queue=None, mail_archive=None, email_rules=None):
         if ignore_file_types is None:
             ignore_file_types = ["gif"]
+        if mail_archive is not None and email_rules is None:
+            raise ValueError("A mail_archive needs email_rules, no JSON file is written for Handler_email_json_files to act on")
+        if email_rules is not None and email_rules.routes_to_handlers and handoff_queue is None:
+            raise ValueError("Email rules that route to a handler need a handoff_queue, handlers must not run on the fetch thread")
         
         self.imap_server = imap_server
         self.username = username
@@ -40,6 +85,18 @@ class EmailFetcher:
         self.mark_as_seen = mark_as_seen
         self.email_download_directory = dld
         self.ignore_file_types = ignore_file_types if ignore_file_types else []
+        self.use_idle = use_idle
+        self.mailbox_factory = mailbox_factory
+        self.idle_timeout = idle_timeout
+        self.reconnect_backoff = reconnect_backoff
+        self.watermark_store = watermark_store
+        self.headers_first = headers_first
+        self.attachment_matcher = attachment_matcher
+        self.message_rules = message_rules
+        self.max_attachment_bytes = max_attachment_bytes
+        self.handoff_queue = handoff_queue
+        self.mail_archive = mail_archive
+        self.email_rules = email_rules
         self.thread = None
         self.stop_thread = threading.Event()
 
@@ -53,21 +110,8 @@ class EmailFetcher:
             while not self.stop_thread.is_set():
                 logger.info('Checking eMail provider...')
                 # self.username = 'crash'  # introduce a code exception
-                with MailBox(self.imap_server).login(self.username, self.password) as mailbox:
-                    criteria = AND(seen=self.mark_as_seen)
-                    logger.debug(f"Fetching emails with criteria: {criteria}")
-                    # Fetch all emails matching the criteria
-                    emails = list(mailbox.fetch(criteria))
-                    logger.info(f"Total emails fetched: {len(emails)}")                    
-                    for msg in emails:
-                        logger.debug(
-                            f"Fetched email | Subject: {msg.subject} | Sender: {msg.from_} | Date: {msg.date} | Message ID: {msg.uid}"
-                        )                            
-                        self.process_email(msg)
-                        logger.info(f"Successfully processed email with Message ID: {msg.uid}")
-                        # Check frequently if stop_thread is set 
-                        if self.stop_thread.is_set():
-                            break                                 
+                with self.mailbox_factory(self.imap_server).login(self.username, self.password) as mailbox:
+                    self.process_new_emails(mailbox)
                     logger.debug('IMAP connection closed.')
 
                 loop = self.delay
@@ -83,6 +127,110 @@ class EmailFetcher:
         finally:
             logger.info("Email fetching thread has exited.")
 
+    def fetch_emails_idle(self):
+        """
+        Keep one connection open and process new mail as soon as the server announces it with IMAP IDLE.
+        A dropped connection is re-established with exponential backoff.
+        """
+        backoff = self.reconnect_backoff[0]
+        last_uid = None  # kept across reconnects so a dropped connection does not reprocess mail
+        try:
+            while not self.stop_thread.is_set():
+                try:
+                    logger.info('Connecting to eMail provider for IDLE push...')
+                    with self.mailbox_factory(self.imap_server).login(self.username, self.password) as mailbox:
+                        backoff = self.reconnect_backoff[0]  # connected, the next failure starts over
+                        last_uid = self.process_new_emails(mailbox, last_uid)
+                        while not self.stop_thread.is_set():
+                            responses = self.wait_for_push(mailbox)
+                            if responses and not self.stop_thread.is_set():
+                                logger.debug(f"IDLE notification: {responses}")
+                                last_uid = self.process_new_emails(mailbox, last_uid)
+                    logger.debug('IMAP connection closed.')
+                except Exception as e:
+                    if self.stop_thread.is_set():
+                        break
+                    logger.warning(f"IMAP connection lost: {e}. Reconnecting in {backoff} seconds.")
+                    self.stop_thread.wait(backoff)
+                    backoff = min(backoff * 2, self.reconnect_backoff[1])
+        finally:
+            logger.info("Email fetching thread has exited.")
+
+    def wait_for_push(self, mailbox):
+        """
+        Run one IDLE of up to idle_timeout seconds. The server is polled in IDLE_POLL_SECONDS slices so a
+        stop_fetching() call ends the wait within a second instead of at the end of the timeout.
+
+        :param mailbox: A logged in imap_tools MailBox
+        :return: The untagged responses the server pushed, empty when the timeout passed or the fetcher is stopping
+        :rtype: list of bytes
+        """
+        deadline = time.monotonic() + self.idle_timeout
+        with mailbox.idle as idle:
+            while not self.stop_thread.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                responses = idle.poll(timeout=min(IDLE_POLL_SECONDS, remaining))
+                if responses:
+                    return responses
+        return []
+
+    def process_new_emails(self, mailbox, last_uid=None):
+        """
+        Process the messages matching the fetch criteria with a UID above last_uid.
+        With a watermark store the stored UID is used instead of last_uid.
+
+        :param mailbox: A logged in mailbox
+        :param last_uid: Highest UID already processed on this connection, None processes every match.
+        :type last_uid: int or None
+        :return: Highest UID processed so far
+        :rtype: int or None
+        """
+        already_processed = last_uid
+        criteria = AND(seen=self.mark_as_seen)
+        fetcher = (lambda search: fetch_message_summaries(mailbox, search)) if self.headers_first else mailbox.fetch
+        if self.watermark_store is not None:
+            messages = fetch_new_messages(mailbox, self.watermark_store, self.username, criteria, fetcher=fetcher)
+            already_processed = None  # fetch_new_messages() already filtered them
+        else:
+            if already_processed is not None:
+                criteria = AND(criteria, uid=U(already_processed + 1, "*"))  # the server only searches the new messages
+            logger.debug(f"Fetching emails with criteria: {criteria}")
+            messages = fetcher(criteria)
+        for msg in messages:
+            if self.stop_thread.is_set():
+                break  # checked before processing so the watermark of the previous message is stored
+            uid = int(msg.uid)
+            if already_processed is not None and uid <= already_processed:
+                continue  # 'n:*' always matches the newest message even when it is older than n
+            last_uid = uid if last_uid is None else max(last_uid, uid)
+            logger.debug(
+                f"Fetched email | Subject: {msg.subject} | Sender: {msg.from_} | Date: {msg.date} | Message ID: {msg.uid}"
+            )
+            if self.headers_first:
+                msg = self.fetch_relevant_parts(mailbox, msg)
+                if msg is None:
+                    continue
+            self.process_email(msg)
+            logger.info(f"Successfully processed email with Message ID: {msg.uid}")
+        return last_uid
+
+    def fetch_relevant_parts(self, mailbox, summary):
+        """
+        Download the parts of a message that matter to the handlers.
+
+        :param summary: Headers and structure of the message
+        :type summary: generic_imap_functions.MessageSummary
+        :return: The message with its relevant parts, None when nothing in it is relevant
+        :rtype: generic_imap_functions.FetchedMessage or None
+        """
+        parts = select_relevant_parts(summary, self.attachment_matcher, self.message_rules, self.ignore_file_types)
+        if not parts:
+            logger.debug(f"Skipping irrelevant email {summary.uid} from {summary.from_}: {summary.subject}")
+            return None
+        return fetch_parts(mailbox, summary, parts, stream_attachments=True)
+
     def process_email(self, msg):
         """
         Process an individual email.
@@ -105,21 +253,50 @@ class EmailFetcher:
             return  # Stop processing if email data can't be constructed
 
         # Process attachments
-        if len(attachments) > 0:
+        if len(msg.attachments) > 0:
             try:
                 self.process_attachments(msg.attachments, email_sender, attachments)
             except Exception as e:
                 logger.error(f"Error processing attachments for {email_subject}: {e}", exc_info=True)
 
-         # Save email content to JSON
+        if self.email_rules is not None:
+            try:
+                self.apply_email_rules(msg, attachments)
+            except Exception as e:
+                logger.error(f"Error applying email rules to {email_subject}: {e}", exc_info=True)
+
+         # Save email content to the archive or to JSON
         try:
-            self.save_email_content(email_subject, email_data)
+            if self.mail_archive is not None:
+                self.mail_archive.append(email_data[0], account=self.username, uid=msg.uid)
+            else:
+                self.save_email_content(email_subject, email_data)
         except Exception as e:
             logger.error(f"Error saving email content for {email_subject}: {e}", exc_info=True)
             return  # Stop processing if saving email content fails           
 
         logger.info(f"Processed and saved email: {email_subject}")
 
+    def apply_email_rules(self, msg, attachments):
+        """
+        Run the routing rules on the attachments process_attachments() saved, so none is downloaded or written twice.
+        Attachments a rule routes to a handler are handed over with the handler's name, the rest as usual. They are
+        staged in attachment_directory until then, so a directory check can not send them to another handler first.
+
+        :param attachments: The 'attachments' list of the email data
+        :type attachments: list of dict
+        :return: (rule name, action, result) for every action taken
+        :rtype: list of tuple
+        """
+        saved = [SavedAttachment(a["filename"], a["saved_to"], a["content_hash"]) for a in attachments]
+        results = self.email_rules.route(msg.from_, msg.subject, msg.text or msg.html or "", saved, self.handoff_queue)
+        routed = {path for name, action, result in results if action == "route_to_handler" for path in result}
+        if self.handoff_queue is not None:
+            for attachment in saved:
+                if attachment.path not in routed:
+                    self.handoff_queue.put((attachment.path, attachment.content_hash))
+        return results
+
     def sanitize_email_details(self, msg):
         """
         Sanitize email details like subject and sender.
@@ -171,13 +348,19 @@ class EmailFetcher:
 
             if att_SUFFIX not in self.ignore_file_types:
                 sanitized_filename = self.sanitize_attachment_filename(email_sender, att.filename)
-                self.save_attachment(att, sanitized_filename)
+                saved = self.save_attachment(att, sanitized_filename)
+                if saved is None:
+                    continue
                 attachments.append({
                     "filename": sanitized_filename,
                     "content_type": att.content_type,
-                    "size": att.size,
-                    "saved_to": str(Path(self.email_download_directory) / sanitized_filename)
+                    "size": saved.size,
+                    "content_hash": saved.content_hash,
+                    "saved_to": str(self.attachment_directory / sanitized_filename)
                 })
+                # with routing rules the attachments are handed over once the rules have picked their handlers
+                if self.handoff_queue is not None and self.email_rules is None:
+                    self.handoff_queue.put((saved.destination, saved.content_hash))
             else:
                 logger.debug(f"Ignored attachment with SUFFIX '{att_SUFFIX}': {att.filename}")
 
@@ -188,21 +371,38 @@ class EmailFetcher:
         logger.debug(f'Sanitizing attachment filename: "{filename}"')
         return f"{email_sender}_{sanitize_filename(filename[:50])}"
 
+    @property
+    def attachment_directory(self):
+        """
+        Where attachments are saved. Handed over attachments are staged in a folder the directory watcher does not
+        scan, otherwise a directory check could dispatch a file before, or as well as, its handoff.
+        """
+        if self.handoff_queue is None:
+            return Path(self.email_download_directory)
+        return Path(self.email_download_directory) / HANDOFF_STAGING_DIRECTORY_NAME
+
     def save_attachment(self, att, sanitized_filename):
         """
         Save an individual attachment to disk.
+        It is written to a '.part' file first and renamed when complete, so the directory watcher never sees half a file.
+        Attachments left on the server by headers-first fetching are downloaded and decoded in chunks.
+
+        :return: The writer holding the size and content hash, None when the attachment is too large
+        :rtype: generic_attachment_functions.AttachmentWriter or None
         """
-        # Ensure the directory exists before saving the file
-        attachment_destination = Path(self.email_download_directory) / sanitized_filename
+        attachment_destination = self.attachment_directory / sanitized_filename
         try:
-            logger.debug(f'Creating directory if it does not exist: "{attachment_destination.parent}"')
-            attachment_destination.parent.mkdir(parents=True, exist_ok=True)
-
             logger.debug(f'Saving attachment to: "{attachment_destination}"')
-            with attachment_destination.open('wb') as f:
-                f.write(att.payload)
+            if isinstance(att, StreamedAttachment):
+                saved = write_attachment(att.chunks(), attachment_destination, att.encoding, self.max_attachment_bytes)
+            else:
+                saved = write_attachment([att.payload], attachment_destination, None, self.max_attachment_bytes)
             logger.debug(f"Processed and downloaded attachment: {attachment_destination}")
-        
+            return saved
+
+        except AttachmentTooLarge as e:
+            logger.warning(f"Skipped attachment {sanitized_filename}: {e}")
+            return None
         except Exception as e:
             logger.error(f"Failed to save attachment {sanitized_filename} at {attachment_destination}: {e}", exc_info=True)
             raise
@@ -211,7 +411,7 @@ class EmailFetcher:
         """Start the email fetching process in a separate thread."""
         if self.thread is None or not self.thread.is_alive():
             logger.info("Starting email fetching thread.")
-            self.thread = threading.Thread(target=self.fetch_emails)
+            self.thread = threading.Thread(target=self.fetch_emails_idle if self.use_idle else self.fetch_emails)
             self.thread.start()
 
             # Start the monitoring in a separate thread
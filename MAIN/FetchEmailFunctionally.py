@@ -3,8 +3,11 @@ from datetime import datetime, timedelta
 import json
 from pathlib import Path
 from loguru import logger
+from generic_imap_functions import UIDWatermarkStore, fetch_new_messages
+from generic_attachment_functions import write_attachment, AttachmentTooLarge
 
-def fetch_emails_last_24_hours(imap_server, username, password, download_dir, seen_emails_file, ignore_file_types=None):
+def fetch_emails_last_24_hours(imap_server, username, password, download_dir, seen_emails_file, ignore_file_types=None,
+                               watermark_database=None):
     """
     Fetch and process emails from the last 24 hours that have not been previously processed.
 
@@ -20,6 +23,9 @@ def fetch_emails_last_24_hours(imap_server, username, password, download_dir, se
     :type seen_emails_file: str or Path
     :param ignore_file_types: A list of file suffixes to ignore when downloading attachments. Default is None.
     :type ignore_file_types: list
+    :param watermark_database: SQLite file of the last processed UID per folder. When given only mail newer than
+        that UID is fetched and seen_emails_file is not used.
+    :type watermark_database: str or Path or None
     """
     if ignore_file_types is None:
         ignore_file_types = ["gif"]
@@ -28,6 +34,10 @@ def fetch_emails_last_24_hours(imap_server, username, password, download_dir, se
     download_dir = Path(download_dir)
     download_dir.mkdir(parents=True, exist_ok=True)
 
+    if watermark_database is not None:
+        fetch_emails_since_watermark(imap_server, username, password, download_dir, watermark_database, ignore_file_types)
+        return
+
     # Read the UIDs of previously processed emails
     seen_uids = set()
     if Path(seen_emails_file).exists():
@@ -80,6 +90,35 @@ def fetch_emails_last_24_hours(imap_server, username, password, download_dir, se
 
 
 
+def fetch_emails_since_watermark(imap_server, username, password, download_dir, watermark_database, ignore_file_types):
+    """
+    Fetch only the mail that arrived after the last processed UID, the first run looks back 24 hours.
+    Processing stops at the first message that fails so the watermark never skips past it.
+    """
+    store = UIDWatermarkStore(watermark_database)
+    first_sync_start = (datetime.now() - timedelta(days=1)).date()
+    try:
+        logger.info("Connecting to the email server...")
+        with MailBox(imap_server).login(username, password) as mailbox:
+            processed = 0
+            # later runs take every UID past the watermark, a date limit would lose mail dated before a long outage
+            first_sync = store.get(username, mailbox.folder.get()) is None
+            criteria = AND(date_gte=first_sync_start) if first_sync else None
+            for msg in fetch_new_messages(mailbox, store, username, criteria=criteria):
+                try:
+                    process_email(msg, download_dir, ignore_file_types)
+                except Exception as e:
+                    logger.error(f"Error processing email UID {msg.uid}: {str(e)}, it will be retried on the next run.")
+                    break
+                processed += 1
+                logger.info(f"Successfully processed email UID {msg.uid}.")
+            logger.info(f"{processed} new emails processed.")
+    except Exception as e:
+        logger.error(f"Critical error occurred while handling emails: {str(e)}")
+    finally:
+        store.close()
+
+
 def process_email(msg, download_dir, ignore_file_types):
     """
     Process the email message, save its content or attachments if needed.
@@ -100,8 +139,11 @@ def process_email(msg, download_dir, ignore_file_types):
             continue
         
         attachment_path = download_dir / att.filename
-        with open(attachment_path, 'wb') as f:
-            f.write(att.payload)
+        try:
+            write_attachment([att.payload], attachment_path)  # renamed into place once complete
+        except AttachmentTooLarge as e:
+            logger.warning(f"Skipped attachment {att.filename}: {e}")
+            continue
         logger.info(f"Saved attachment: {attachment_path}")
 
     # You can extend the logic to save email content or JSON as needed.
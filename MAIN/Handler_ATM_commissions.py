@@ -7,16 +7,19 @@ data in csv is:
 import pandas as panda
 from loguru import logger
 from pathlib import Path
-from generic_munge_functions import extract_date_from_filename
 from generic_dataframe_functions import save_dataframe_as_csv_and_print
 from generic_dataframe_functions import load_csv_to_dataframe
 from generic_dataframe_functions import verify_dataframe_contains
+from generic_dataframe_functions import parse_money_columns
+from generic_munge_functions import find_report_dates, DATE_HINT_SINGLE, NO_DATE_STRING
+from generic_history_store import append_history, frame_to_history_rows
 
 # standardized declaration for CFSIV_Data_Munge_Extensible project
 INPUT_DATA_FILE_SUFFIX = ".csv"
 OUTPUT_FILE_SUFFIX = ".xlsx"
 FILENAME_STRINGS_TO_MATCH = ["ATMActivityReportforcommissions", "dummy place holder"]
 ARCHIVE_DIRECTORY_NAME = "QuarterlyCommission"
+HISTORY_VENDOR = "ATM"  # vendor name used in the revenue history store
 FORMATTING_FILE = Path.cwd() / "MAIN" / "ColumnFormatting.json"
 VALUE_FILE = (
     Path.cwd() / "MAIN" / "Terminal_Details.json"
@@ -61,7 +64,8 @@ def data_handler_process(file_path: Path):
         return False
 
     logger.debug(f"Looking for date string in: {file_path.stem}")
-    filedate = extract_date_from_filename(file_path.stem)  # filename without SUFFIX
+    filedates = find_report_dates(file_path.stem, hint=DATE_HINT_SINGLE)
+    filedate = filedates[0].strftime("%Y%m%d") if filedates else NO_DATE_STRING
     logger.debug(f"Found Date: {filedate}")
     output_file = Path(f"{ARCHIVE_DIRECTORY_NAME}{OUTPUT_FILE_SUFFIX}")
     logger.debug(f"Output filename: {output_file}")
@@ -74,6 +78,7 @@ def data_handler_process(file_path: Path):
         return False
     else:
         if len(result) > 0:
+            append_history(HISTORY_VENDOR, file_path, history_rows_from_frame(result, filedates))
             save_dataframe_as_csv_and_print(output_file, result, file_path)
         else:
             logger.error(f"No data found to process")
@@ -82,6 +87,36 @@ def data_handler_process(file_path: Path):
     return True
 
 
+@logger.catch
+def extract_history_rows(file_path: Path):
+    """
+    Side effect free: each location's commission as revenue history rows.
+
+    :param file_path: The ATM activity report CSV file
+    :type file_path: Path
+    :return: Rows for generic_history_store
+    :rtype: list of dict
+    """
+    filedates = find_report_dates(file_path.stem, hint=DATE_HINT_SINGLE)
+    if not filedates:
+        logger.warning(f"No report date in {file_path.name}, nothing added to history.")
+        return []
+    result = process_commission_report(file_path, filedates[0].strftime("%Y%m%d"))
+    return history_rows_from_frame(result, filedates)
+
+
+def history_rows_from_frame(result, filedates):
+    """Commission and withdrawal counts per location, the totals row is left out."""
+    if not filedates or result is None or len(result) == 0:
+        return []
+    return frame_to_history_rows(
+        result[result["Location"].notna() & ~result["Location"].astype(str).str.startswith("Report ran")],
+        ["Commission_Due", "WD Trxs"],
+        report_date=filedates[0],
+        location_column="Location",
+    )
+
+
 @logger.catch
 def process_commission_report(input_file, runday):
     """Scan file and compute sums for 2 columns.
@@ -128,8 +163,7 @@ def process_commission_report(input_file, runday):
 
     # Strip out undesirable characters from "Settlement" column and convert to float
     try:
-        df["Settlement"] = df["Settlement"].replace("[\$,)]", "", regex=True)
-        df["Settlement"] = df["Settlement"].astype(float)
+        parse_money_columns(df, ["Settlement"], errors="raise")
     except KeyError as e:
         logger.error(f"KeyError in 'Settlement' column: {e}")
         return panda.DataFrame()  # empty dataframe
@@ -139,8 +173,7 @@ def process_commission_report(input_file, runday):
 
     # Process "WD Trxs" column
     try:
-        df["WD Trxs"] = df["WD Trxs"].replace("[\$,)]", "", regex=True)
-        df["WD Trxs"] = panda.to_numeric(df["WD Trxs"], errors="coerce")
+        parse_money_columns(df, ["WD Trxs"])
     except KeyError as e:
         logger.error(f"KeyError in 'WD Trxs' column: {e}")
         return panda.DataFrame()  # empty dataframe
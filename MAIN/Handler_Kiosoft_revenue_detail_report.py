@@ -1,9 +1,11 @@
 import pandas as pd
 from loguru import logger
 from pathlib import Path
-from generic_munge_functions import extract_dates
+from generic_munge_functions import find_report_dates, DATE_HINT_RANGE
 from generic_excel_functions import convert_dataframe_to_excel_with_formatting_and_save
 from generic_pathlib_file_methods import move_file_with_check
+from generic_dataframe_functions import load_csv_with_schema, iter_csv_with_schema
+from generic_history_store import append_history, frame_to_history_rows
 
 
 # standardized declaration for CFSIV_Data_Munge_Extensible project
@@ -14,6 +16,33 @@ FILENAME_STRINGS_TO_MATCH = [
     "dummy place holder",
 ]
 ARCHIVE_DIRECTORY_NAME = "KioSoft_History"
+HISTORY_VENDOR = "Kiosoft"  # vendor name used in the revenue history store
+FILENAME_DATE_HINT = DATE_HINT_RANGE  # how find_report_dates() should read dates from our filenames
+# Only these columns of the pay_at_machine_log are read, see load_csv_with_schema()
+CSV_SCHEMA = {
+    "columns": {
+        "Date Time": "string",
+        "Machine ID": "string",
+        "Location": "string",
+        "Total Amount ($)": "string",
+        "Response Code": "string",
+    },
+    "money": ["Total Amount ($)"],
+    "dates": ["Date Time"],
+    "strip": ["Machine ID", "Location", "Response Code"],
+}
+STREAM_THRESHOLD_BYTES = 50 * 1024 * 1024  # logs larger than this are aggregated chunk by chunk
+CSV_CHUNK_ROWS = 100_000
+AMOUNT_LABEL = 'Total Amount ($)'
+DECLINED_AMOUNT = 'Declined Amount ($)'  # AMOUNT_LABEL where the response was declined, 0 otherwise
+TOTAL_LABEL = 'Total Transactions Amount ($)'
+DECLINED_LABEL = 'Declined Transactions Amount ($)'
+NET_LABEL = 'Net Transactions Amount ($)'
+BREAKDOWN_KEYS = {  # optional totals summarize_kiosoft_log() can produce and what each is grouped by
+    "machine": ["Machine ID"],
+    "location": ["Location"],
+    "day": ["Day"],
+}
 
 
 class FileMatcher:
@@ -51,14 +80,16 @@ def data_handler_process(original_file_path: Path):
         return False
 
     logger.debug(f"Looking for date string(s) in: {original_file_path.stem}")
-    filedate_list = extract_dates(original_file_path.stem)  # filename without SUFFIX
+    filedate_list = find_report_dates(original_file_path.stem, hint=FILENAME_DATE_HINT)  # filename without SUFFIX
     logger.debug(f"Found Date: {filedate_list}")
     archive_input_file_destination = original_file_path.parent / ARCHIVE_DIRECTORY_NAME / Path(f"{original_file_path.name}")
     logger.debug(f"Archive for processed file path is: {archive_input_file_destination}")
 
     # launch the processing function
-    df_processed = process_kiosoft_csv(original_file_path)
+    summaries, Location_name = summarize_kiosoft_log(original_file_path)
+    df_processed = format_kiosoft_totals(summaries["machine"].reset_index(), Location_name)
     logger.debug(f'Data processing returned:\n{df_processed=}')
+    append_history(HISTORY_VENDOR, original_file_path, history_rows_from_summary(summaries, Location_name, filedate_list))
 
     # Add a new row using .loc[] with the same value for all columns
     num_columns = df_processed.shape[1]  # Number of columns in the DataFrame
@@ -77,48 +108,130 @@ def data_handler_process(original_file_path: Path):
     return True
 
 @logger.catch()
-def process_kiosoft_csv(filename):
+def process_kiosoft_csv(filename, chunksize=None):
     """This function written with ChatGPT as a pair programmer.
-    """
-    # Load the CSV file
-    logger.info(f'Loading the CSV file {filename}')
-    file_path = Path(filename)
-    df = pd.read_csv(file_path)
-
-    # Clean the data by stripping leading/trailing spaces from all columns
-    df = df.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
-
-    # Extract the value at row 0 of a specific column, e.g., 'Machine ID'
-    value = df.iloc[0]['Location']  # Extract the name of the Business where this data came from
-
-    # Convert the value to a string
-    Location_name = str(value)
 
-    logger.debug(f'Data loaded and cleaned for location: {Location_name}.')
+    :param filename: The pay_at_machine_log CSV file
+    :type filename: str or Path
+    :param chunksize: Rows per chunk for streaming aggregation. None streams only files over STREAM_THRESHOLD_BYTES.
+    :type chunksize: int or None
+    """
+    summaries, Location_name = summarize_kiosoft_log(filename, chunksize)
+    df_final = summaries["machine"].reset_index()
+    return format_kiosoft_totals(df_final, Location_name)
 
-    # Create two separate dataframes for total and declined transactions
-    df_total = df.groupby('Machine ID')['Total Amount ($)'].sum().reset_index()
 
-    # Filter out only rows where 'Transaction Type' contains 'DECLINED' for the declined subtotal
-    df_declined = df[df['Response Code'].str.contains("declined", case=False, na=False)]
-    df_declined_total = df_declined.groupby('Machine ID')['Total Amount ($)'].sum().reset_index()
-    logger.debug(f'Data has been divided into "all xacts" and "declined xacts".')
+@logger.catch()
+def extract_history_rows(file_path: Path):
+    """
+    Side effect free: the per-machine totals of a log as revenue history rows.
 
-    # Rename the columns for clarity  NOTE: this idea to rename was completely ChatGPT
-    df_total.rename(columns={'Total Amount ($)': 'Total Transactions Amount ($)'}, inplace=True)
-    df_declined_total.rename(columns={'Total Amount ($)': 'Declined Transactions Amount ($)'}, inplace=True)
+    :param file_path: The pay_at_machine_log CSV file
+    :type file_path: Path
+    :return: Rows for generic_history_store
+    :rtype: list of dict
+    """
+    summaries, Location_name = summarize_kiosoft_log(file_path)
+    filedate_list = find_report_dates(Path(file_path).stem, hint=FILENAME_DATE_HINT)
+    return history_rows_from_summary(summaries, Location_name, filedate_list)
+
+
+def history_rows_from_summary(summaries, Location_name, filedate_list):
+    """Per-machine total, declined and net amounts dated by the start of the report's date range."""
+    if not filedate_list:
+        logger.warning(f"No report dates for {Location_name}, nothing added to history.")
+        return []
+    return frame_to_history_rows(
+        summaries["machine"].reset_index(),
+        [TOTAL_LABEL, DECLINED_LABEL, NET_LABEL],
+        report_date=filedate_list[0],
+        period_end=filedate_list[-1],
+        location=Location_name,
+        entity_column="Machine ID",
+    )
 
-    # Merge the two subtotals by 'Machine ID'
-    df_final = pd.merge(df_total, df_declined_total, on='Machine ID', how='left')
-    logger.debug(f'Data has been merged into final report.')
 
-    # Fill any NaN values in the declined amount column with 0 (in case there are no declined transactions for some machines)
-    #  NOTE: This edge case was also suggested by ChatGPT
-    df_final['Declined Transactions Amount ($)'] = df_final['Declined Transactions Amount ($)'].fillna(0)
+@logger.catch()
+def summarize_kiosoft_log(filename, chunksize=None, breakdowns=("machine",)):
+    """
+    Total, declined and net amounts from a pay_at_machine_log.
+    Large logs, or any log when chunksize is given, are read chunk by chunk and only running totals are kept.
+
+    :param filename: The pay_at_machine_log CSV file
+    :type filename: str or Path
+    :param chunksize: Rows per chunk. None streams only files over STREAM_THRESHOLD_BYTES.
+    :type chunksize: int or None
+    :param breakdowns: Which of BREAKDOWN_KEYS to compute, per machine by default
+    :type breakdowns: tuple of str
+    :return: {breakdown: totals indexed by its key} and the location name from the first row
+    :rtype: tuple(dict, str)
+    """
+    logger.info(f'Loading the CSV file {filename}')
+    file_path = Path(filename)
+    if chunksize is None and file_path.stat().st_size > STREAM_THRESHOLD_BYTES:
+        chunksize = CSV_CHUNK_ROWS
+    if chunksize:
+        chunks = iter_csv_with_schema(file_path, CSV_SCHEMA, chunksize)
+    else:
+        # only the declared columns are read, key columns come back stripped and amounts as float
+        chunks = [load_csv_with_schema(file_path, CSV_SCHEMA)]
+
+    running = {}
+    Location_name = ""
+    rows = 0
+    for chunk in chunks:
+        if not running and len(chunk):
+            Location_name = str(chunk.iloc[0]['Location'])  # the name of the Business where this data came from
+        rows += len(chunk)
+        for name, totals in summarize_transactions(chunk, breakdowns).items():
+            running[name] = totals if name not in running else running[name].add(totals, fill_value=0)
+        logger.debug(f'{rows} rows aggregated for location: {Location_name}.')
+
+    summaries = {}
+    for name in breakdowns:
+        totals = running.get(name, pd.DataFrame(columns=[TOTAL_LABEL, DECLINED_LABEL]))
+        totals[NET_LABEL] = totals[TOTAL_LABEL] - totals[DECLINED_LABEL]
+        summaries[name] = totals
+    return summaries, Location_name
+
+
+def summarize_transactions(df, breakdowns=("machine",)):
+    """
+    Total and declined amounts in a single grouped pass per breakdown, no filtered copy and no merge.
+    The frame gets a declined mask column that zeroes every approved amount, so one groupby.agg sums both.
+
+    :param df: Transactions read with CSV_SCHEMA, modified in place
+    :type df: pd.DataFrame
+    :param breakdowns: Which of BREAKDOWN_KEYS to compute
+    :type breakdowns: tuple of str
+    :return: {breakdown: total and declined amounts indexed by its key}
+    :rtype: dict
+    """
+    declined = df['Response Code'].str.contains("declined", case=False, na=False)
+    df[DECLINED_AMOUNT] = df[AMOUNT_LABEL].where(declined, 0)
+    if "day" in breakdowns:
+        df["Day"] = df["Date Time"].dt.date
+    return {
+        name: df.groupby(BREAKDOWN_KEYS[name]).agg(**{
+            TOTAL_LABEL: (AMOUNT_LABEL, "sum"),
+            DECLINED_LABEL: (DECLINED_AMOUNT, "sum"),
+        })
+        for name in breakdowns
+    }
 
-    # Subtract the Declined Transactions from the Total Transactions to get the Net Amount
-    df_final['Net Transactions Amount ($)'] = df_final['Total Transactions Amount ($)'] - df_final['Declined Transactions Amount ($)']
 
+@logger.catch()
+def format_kiosoft_totals(df_final, Location_name):
+    """
+    Turn the per-machine totals into the printed layout, one column per machine.
+
+    :param df_final: 'Machine ID' and the total, declined and net amount columns
+    :type df_final: pd.DataFrame
+    :param Location_name: Name of the business printed at the bottom
+    :type Location_name: str
+    :return: The report
+    :rtype: pd.DataFrame
+    """
     # Set 'Machine ID' as the index to make it part of the rows
     #df_final = df_final.reset_index()
     df_final = df_final.set_index('Machine ID')    
@@ -135,7 +248,8 @@ def process_kiosoft_csv(filename):
 
     # return the final dataframe
     logger.debug(f'Data processing complete.')
-    return df_transposed.drop(columns=['01'])  # I don't know where I introduced the '01' column
+    # every column besides 'index' is a Machine ID, the '01' column once dropped here was machine '01'
+    return df_transposed
   
 """
 @logger.catch
@@ -8,8 +8,12 @@ import zipfile
 import json
 from pathlib import Path
 import os
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
 from datetime import datetime
-from generic_munge_functions import extract_dates
+from generic_munge_functions import find_report_dates
 from generic_munge_functions import archive_original_file
 from generic_json_functions import prettify_json
 
@@ -26,6 +30,15 @@ ARCHIVE_DIRECTORY_NAME = (
     "nayax_sales_history"
 )
 
+# Limits applied while streaming members out of the ZIP. Counted on the bytes actually
+# decompressed so a member that lies about its size in the ZIP directory is still stopped.
+MAX_FILE_SIZE = 100 * 1024 * 1024  # per member
+MAX_ARCHIVE_SIZE = 300 * 1024 * 1024  # all members together
+STREAM_READ_SIZE = 1024 * 1024  # bytes read from a member at a time
+CSV_CHUNK_ROWS = 50_000  # rows parsed per chunk
+MAX_MEMBER_WORKERS = 4  # members parsed in parallel
+TABULAR_MEMBER_SUFFIXES = (".csv", ".xlsx")
+
 # This handler processes the zip file provided by nayax credit card processing company
 
 class FileMatcher:
@@ -69,13 +82,17 @@ def data_handler_process(file_path: Path):
     logger.info(f'ZIP Handler launched on file {file_path}')
 
     logger.debug(f"Looking for date string in: {file_path.stem}")
-    filedates_list = extract_dates(file_path.stem)  # filename without SUFFIX or directory tree
+    filedates_list = find_report_dates(file_path.stem)  # filename without SUFFIX or directory tree
     logger.debug(f"Found Date(s): {filedates_list}")
 
     json_data = get_data_from(file_path)
     logger.debug(f'{json_data=}')
     logger.debug(f'{prettify_json(json_data)}')
 
+    member_summaries = stream_zip_members(file_path)
+    for member_name, summary in member_summaries.items():
+        logger.info(f"ZIP member {member_name} parsed: {summary.rows} rows, columns {summary.columns}")
+
     # build output path
     output_filepath = Path(f"{ARCHIVE_DIRECTORY_NAME}\{file_path.stem}{OUTPUT_FILE_SUFFIX}")
     logger.debug(f'{output_filepath=}')
@@ -83,7 +100,7 @@ def data_handler_process(file_path: Path):
     archive_directory_path = file_path.parent / ARCHIVE_DIRECTORY_NAME
     logger.debug(f"Archive for processed file path is: {archive_directory_path}")    
 
-    processed_json = process_json(json_data, filedates_list, output_filepath)
+    processed_json = process_json(json_data, filedates_list, output_filepath, member_summaries)
     logger.debug(f"{prettify_json(processed_json)}")
 
     # save data
@@ -98,14 +115,20 @@ def data_handler_process(file_path: Path):
     return True
 
 
-def process_json(raw_json, filedates_list, output_filepath):
+def process_json(raw_json, filedates_list, output_filepath, member_summaries=None):
     # return a JSON object ready to use such as print or save.
     logger.debug(f'Begin processing JSON data.')
     if len(raw_json) < 1:
         logger.error(f"No data found to process for output: {output_filepath}")
         return {}
     # add any modification of data desired here such as adding data from filedates_list and output_filepath
-    return raw_json
+    file_list = json.loads(raw_json)
+    for file_info in file_list.values():
+        summary = (member_summaries or {}).get(file_info["file_name"])
+        if summary is not None:
+            file_info["rows"] = summary.rows
+            file_info["columns"] = summary.columns
+    return file_list
 
 
 def get_data_from(input_file):
@@ -127,22 +150,17 @@ def get_data_from(input_file):
 def sanitize_zip(zip_file):
     # Check the contents list of ZIP file in as safe a manner as reasonable
     logger.debug(f'Attempting safe opening of ZIP file: {zip_file}')
-    # Define a size limit for files (e.g., 100 MB)
-    MAX_FILE_SIZE = 100 * 1024 * 1024
-    # Set the extraction directory
-    safe_base_path = Path("/safe/directory/for/extraction")
     file_list = {}
     try:
         with zipfile.ZipFile(zip_file, 'r') as zf:
             for index, info in enumerate(zf.infolist()):
                 file_info = {}
                 logger.debug(f'{index=},{info=}')
-                # Prevent zip bombs by checking uncompressed file size
+                # Early rejection using the declared size. The real limit is enforced while streaming.
                 if info.file_size > MAX_FILE_SIZE:
                     raise ValueError(f"File {info.filename} exceeds the maximum allowed size.")
                 # Avoid directory traversal attacks
-                extracted_path = safe_base_path / Path(info.filename)
-                if not extracted_path.resolve().is_relative_to(safe_base_path.resolve()):
+                if not is_safe_member_name(info.filename):
                     raise ValueError(f"Path traversal detected in file {info.filename}.")
                 # Gather file metadata
                 file_info["file_name"] = info.filename
@@ -157,6 +175,157 @@ def sanitize_zip(zip_file):
     return json_output
 
 
+def is_safe_member_name(member_name):
+    """
+    Check that a ZIP member name stays inside the archive root.
+
+    :param member_name: Name of the member as stored in the ZIP directory.
+    :type member_name: str
+    :return: False for absolute names, drive letters or any '..' component.
+    :rtype: bool
+    """
+    member_path = PurePosixPath(member_name.replace("\\", "/"))
+    if member_path.is_absolute():
+        return False
+    if member_path.parts and ":" in member_path.parts[0]:  # windows drive letter such as C:
+        return False
+    return ".." not in member_path.parts
+
+
+class ByteLimitedReader(io.RawIOBase):
+    """
+    Read-only stream that raises ValueError once more than max_bytes have been read.
+
+    The count is shared through 'budget' so several members can also be held to an archive-wide limit.
+
+    :param raw: The stream returned by ZipFile.open().
+    :param name: Member name used in error messages.
+    :param max_bytes: Limit for this member.
+    :param budget: Shared archive-wide byte budget.
+    :type budget: StreamBudget
+    """
+
+    def __init__(self, raw, name, max_bytes, budget):
+        self.raw = raw
+        self.name = name
+        self.max_bytes = max_bytes
+        self.budget = budget
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.raw.read(len(buffer))
+        self.bytes_read += len(data)
+        if self.bytes_read > self.max_bytes:
+            raise ValueError(f"File {self.name} exceeds the maximum allowed size of {self.max_bytes} bytes.")
+        self.budget.spend(len(data))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class StreamBudget:
+    """Thread-safe count of bytes decompressed from one archive."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        self._lock = threading.Lock()
+
+    def spend(self, count):
+        with self._lock:
+            self.bytes_read += count
+            if self.bytes_read > self.max_bytes:
+                raise ValueError(f"Archive exceeds the maximum allowed total size of {self.max_bytes} bytes.")
+
+
+class MemberSummary:
+    """Row count and column names of one tabular ZIP member."""
+
+    __slots__ = ("rows", "columns")
+
+    def __init__(self, rows=0, columns=None):
+        self.rows = rows
+        self.columns = columns or []
+
+    def add(self, frame):
+        """Count one parsed chunk, the columns are taken from the first."""
+        if not self.columns:
+            self.columns = frame.columns.tolist()
+        self.rows += len(frame)
+
+    def __repr__(self):
+        return f"MemberSummary({self.rows} rows, {self.columns})"
+
+
+def read_zip_member(zip_file, member_name, budget):
+    """
+    Parse one CSV or XLSX member straight out of the ZIP without extracting it to disk.
+
+    CSV members are parsed chunk by chunk and each chunk is dropped once it is counted, so memory
+    stays at one chunk however large the member is. XLSX needs random access so it is read into
+    memory, still through the byte limit.
+
+    :param zip_file: Path to the ZIP file.
+    :param member_name: Name of the member to parse.
+    :param budget: Shared archive-wide byte budget.
+    :type budget: StreamBudget
+    :return: Row count and columns of the member.
+    :rtype: MemberSummary
+    """
+    summary = MemberSummary()
+    # each worker opens its own handle so members can be read in parallel safely
+    with zipfile.ZipFile(zip_file, 'r') as zf:
+        with zf.open(member_name) as raw:
+            limited = io.BufferedReader(ByteLimitedReader(raw, member_name, MAX_FILE_SIZE, budget), STREAM_READ_SIZE)
+            if member_name.lower().endswith(".csv"):
+                for chunk in panda.read_csv(limited, chunksize=CSV_CHUNK_ROWS):
+                    summary.add(chunk)
+            else:
+                summary.add(panda.read_excel(io.BytesIO(limited.read())))
+    logger.debug(f"Member {member_name} streamed from ZIP: {summary.rows} rows.")
+    return summary
+
+
+def stream_zip_members(zip_file, max_workers=MAX_MEMBER_WORKERS):
+    """
+    Parse every CSV and XLSX member of a ZIP in parallel, directly from the archive.
+
+    :param zip_file: Path to the ZIP file.
+    :param max_workers: Members parsed at the same time.
+    :return: Summary of each member that parsed, keyed by member name.
+    :rtype: dict[str, MemberSummary]
+    """
+    try:
+        with zipfile.ZipFile(zip_file, 'r') as zf:
+            member_names = [
+                info.filename for info in zf.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(TABULAR_MEMBER_SUFFIXES)
+            ]
+    except zipfile.BadZipFile:
+        logger.error(f"The provided zip file: {zip_file} is malformed or corrupt.")
+        return {}
+
+    unsafe = [name for name in member_names if not is_safe_member_name(name)]
+    if unsafe:
+        logger.error(f"Path traversal detected in ZIP {zip_file}: {unsafe}")
+        return {}
+
+    budget = StreamBudget(MAX_ARCHIVE_SIZE)
+    summaries = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {name: pool.submit(read_zip_member, zip_file, name, budget) for name in member_names}
+        for name, future in futures.items():
+            try:
+                summaries[name] = future.result()
+            except ValueError as e:
+                logger.error(f"ZIP member {name} rejected: {e}")
+            except Exception as e:
+                logger.error(f"ZIP member {name} could not be parsed: {e}")
+    return summaries
+
+
 # Example usage
 if __name__ == "__main__":
     zip_file_path = "example.zip"
@@ -12,8 +12,9 @@ import numpy as np
 import time
 from generic_excel_functions import apply_excel_formatting_to_dataframe_and_save_spreadsheet
 from generic_excel_functions import print_excel_file
-from generic_munge_functions import extract_date_from_filename
-from generic_dataframe_functions import load_csv_to_dataframe
+from generic_munge_functions import find_report_dates, DATE_HINT_SINGLE, NO_DATE_STRING
+from generic_dataframe_functions import load_csv_with_schema
+from generic_history_store import append_history, frame_to_history_rows
 from generic_dataframe_functions import verify_dataframe_contains
 from generic_munge_functions import archive_original_file
 from whenever import Instant
@@ -29,6 +30,18 @@ FILENAME_STRINGS_TO_MATCH = [
     ]
 
 ARCHIVE_DIRECTORY_NAME = "FloatReportArchive"
+HISTORY_VENDOR = "PAI"  # vendor name used in the revenue history store
+# Only these columns of the float report are read, see load_csv_with_schema()
+FLOAT_REPORT_SCHEMA = {
+    "columns": {
+        "Location": "string",
+        "Reject Balance": "string",
+        "Balance": "string",
+        "Today's Float": "string",
+        "Route": "string",
+    },
+    "money": ["Reject Balance", "Balance", "Today's Float"],
+}
 
 
 class FileMatcher:
@@ -92,7 +105,8 @@ def data_handler_process(file_path: Path):
 
     logger.debug(f"Looking for date string in: {file_path.stem}")
     try:
-        filedate = extract_date_from_filename(file_path.stem)  # filename without SUFFIX
+        filedates = find_report_dates(file_path.stem, hint=DATE_HINT_SINGLE)
+        filedate = filedates[0].strftime("%Y%m%d") if filedates else NO_DATE_STRING
         logger.info(f"Extracted Date: {filedate} from filename")
     except Exception as e:
         logger.error(f"Error extracting date from filename: {file_path.stem}, Error: {e}")
@@ -104,10 +118,17 @@ def data_handler_process(file_path: Path):
     input_file_archive_destination = file_path.parent / ARCHIVE_DIRECTORY_NAME
     logger.debug(f"Archive for processed file path is: {input_file_archive_destination}")
 
+    # Read the report once, the printed report and the history rows are both made from this frame
+    try:
+        df = load_csv_with_schema(file_path, FLOAT_REPORT_SCHEMA)
+    except (KeyError, ValueError) as e:
+        logger.error(f"Problem loading float report {file_path}: {e}")
+        return False
+
     # Launch the processing function
     try:
         logger.debug(f"Starting CSV processing for file: {file_path} with date: {filedate}")
-        result = process_floatReport_csv(file_path, filedate)
+        result = process_floatReport_csv(df, filedate)
         logger.info(f"CSV processing completed successfully, {len(result)} records found")
     except Exception as e:
         logger.error(f"Failure processing dataframe for file: {file_path}, Error: {e}")
@@ -138,6 +159,9 @@ def data_handler_process(file_path: Path):
         logger.error(f"Error printing file: {output_file}, Error: {e}")
         return False
 
+    # Keep the balances in the revenue history store
+    append_history(HISTORY_VENDOR, file_path, history_rows_from_frame(df, filedates, file_path))
+
     # Archive the original file
     try:
         logger.info(f"Archiving original file from {file_path.name} to {input_file_archive_destination.stem}")
@@ -151,13 +175,46 @@ def data_handler_process(file_path: Path):
 
 
 
+@logger.catch
+def extract_history_rows(file_path: Path):
+    """
+    Side effect free: each terminal's balances as revenue history rows.
+
+    :param file_path: The float report CSV file
+    :type file_path: Path
+    :return: Rows for generic_history_store
+    :rtype: list of dict
+    """
+    filedates = find_report_dates(file_path.stem, hint=DATE_HINT_SINGLE)
+    if not filedates:
+        logger.warning(f"No report date in {file_path.name}, nothing added to history.")
+        return []
+    return history_rows_from_frame(load_csv_with_schema(file_path, FLOAT_REPORT_SCHEMA), filedates, file_path)
+
+
+def history_rows_from_frame(df, filedates, file_path):
+    """Each terminal's balances from the float report as read with FLOAT_REPORT_SCHEMA, before processing."""
+    if not filedates:
+        logger.warning(f"No report date in {file_path.name}, nothing added to history.")
+        return []
+    return frame_to_history_rows(
+        df[df["Location"].notna()],
+        ["Balance", "Today's Float", "Reject Balance"],
+        report_date=filedates[0],
+        location_column="Location",
+        entity_column="Route",
+    )
+
+
 @logger.catch
 def process_floatReport_csv(in_f, RUNDATE):
     """
     process_floatReport_csv: Processes the float report CSV file and applies necessary transformations.
 
-    :param param1: Description of the first parameter (replace with actual parameter names)
-    :type param1: type (replace with actual type)
+    :param in_f: The float report CSV, or the report already read with FLOAT_REPORT_SCHEMA which is left unchanged
+    :type in_f: Path or pandas.DataFrame
+    :param RUNDATE: Report date printed on the report
+    :type RUNDATE: str
     :return: Processed data from the float report in the form of a DataFrame
     :rtype: pandas.DataFrame
     """    
@@ -171,7 +228,12 @@ def process_floatReport_csv(in_f, RUNDATE):
     PRINT_DATE = timestamp
 
     empty_df = panda.DataFrame()
-    df = load_csv_to_dataframe(in_f)
+    try:
+        # money columns come back as float, "(12.50)" style negatives included
+        df = in_f.copy() if isinstance(in_f, panda.DataFrame) else load_csv_with_schema(in_f, FLOAT_REPORT_SCHEMA)
+    except (KeyError, ValueError, FileNotFoundError) as e:
+        logger.error(f"Problem loading float report {in_f}: {e}")
+        return empty_df
 
     expected_fields_list = [
         "Location",
@@ -192,29 +254,6 @@ def process_floatReport_csv(in_f, RUNDATE):
     # tack on the date that this report is printed
     df.at[len(df), "Location"] = PRINT_DATE    
 
-    # Strip out undesirable characters from "Balance" column
-    try:
-        df["Balance"] = df["Balance"].replace("[\$,)]", "", regex=True)
-        df["Balance"] = df["Balance"].astype(float)
-    except KeyError as e:
-        logger.error(f"KeyError in balance column: {e}")
-        return empty_df
-
-    # Process FLOAT_LABEL column
-    try:
-        df.replace({FLOAT_LABEL: {"[\$,)]": ""}}, regex=True, inplace=True)
-        df[FLOAT_LABEL] = panda.to_numeric(df[FLOAT_LABEL], errors="coerce")
-    except KeyError as e:
-        logger.error(f"KeyError in 'Todays' Float' column: {e}")
-        return empty_df
-
-    # Process "Reject Balance" column
-    try:
-        df["Reject Balance"] = df["Reject Balance"].astype(float)
-    except KeyError as e:
-        logger.error(f"KeyError in 'Reject Balance' column: {e}")
-        return empty_df
-
     # sum the columns
     df.loc["Totals"] = df.select_dtypes(np.number).sum()
     df.at["Totals", "Location"] = ROUTE_TEXT
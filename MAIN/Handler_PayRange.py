@@ -4,9 +4,11 @@
 import pandas as pd
 from loguru import logger
 from pathlib import Path
-from generic_munge_functions import extract_dates
+from generic_munge_functions import find_report_dates
 from generic_excel_functions import convert_dataframe_to_excel_with_formatting_and_save
 from generic_pathlib_file_methods import move_file_with_check
+from generic_dataframe_functions import load_csv_with_schema
+from generic_history_store import append_history, frame_to_history_rows
 
 
 # standardized declaration for CFSIV_Data_Munge_Extensible project
@@ -17,6 +19,32 @@ FILENAME_STRINGS_TO_MATCH = [
     "dummy place holder",
 ]
 ARCHIVE_DIRECTORY_NAME = "PayRange_History"
+LOCATION_LABEL = 'location'
+HISTORY_VENDOR = "PayRange"  # vendor name used in the revenue history store
+COLUMNS_TO_KEEP = {  # csv data names and what to change each one to
+    'date': "Date",
+    'machine': "Mach Name",
+    'mob_sales': "Mobile$",
+    'cash_sales': "Cash$",
+    'card_sales': "Credit$",
+    'tot_sales': "Total$",
+    'net': "Net$",
+}
+# Only these columns of the device detail report are read, see load_csv_with_schema()
+CSV_SCHEMA = {
+    "columns": {
+        'date': "string",
+        'machine': "string",
+        LOCATION_LABEL: "string",
+        'mob_sales': "string",
+        'cash_sales': "string",
+        'card_sales': "string",
+        'tot_sales': "string",
+        'net': "string",
+    },
+    "money": ['mob_sales', 'cash_sales', 'card_sales', 'tot_sales', 'net'],
+    "strip": ['date', 'machine', LOCATION_LABEL],
+}
 
 
 class FileMatcher:
@@ -54,25 +82,17 @@ def data_handler_process(original_file_path: Path):
         return False
 
     logger.debug(f"Looking for date string(s) in: {original_file_path.stem}")
-    filedate_list = extract_dates(original_file_path.stem)  # filename without SUFFIX
+    filedate_list = find_report_dates(original_file_path.stem)  # filename without SUFFIX
     logger.debug(f"Found Date: {filedate_list}")
     archive_input_file_destination = original_file_path.parent / ARCHIVE_DIRECTORY_NAME / Path(f"{original_file_path.name}")
     logger.debug(f"Archive for processed file path is: {archive_input_file_destination}")
 
-    LOCATION_LABEL = 'location'
-    columns_to_keep = {  # csv data names and what to change each one to
-        'date': "Date",
-        'machine': "Mach Name",
-        'mob_sales': "Mobile$",
-        'cash_sales': "Cash$",
-        'card_sales': "Credit$",
-        'tot_sales': "Total$",
-        'net': "Net$",
-    }
+    columns_to_keep = COLUMNS_TO_KEEP
 
     # launch the processing function
     df_processed = process_payrange_csv(original_file_path, columns_to_keep, LOCATION_LABEL)
     logger.debug(f'Data processing returned:\n{df_processed=}')
+    append_history(HISTORY_VENDOR, original_file_path, history_rows_from_frame(df_processed, filedate_list))
 
     # Add a new rows using .loc[] with the same value for all columns
     num_columns = df_processed.shape[1]  # Number of columns in the DataFrame
@@ -95,6 +115,32 @@ def data_handler_process(original_file_path: Path):
     # all work complete
     return True
 
+@logger.catch()
+def extract_history_rows(file_path: Path):
+    """
+    Side effect free: the per-machine sales of a device detail report as revenue history rows.
+
+    :param file_path: The device detail CSV file
+    :type file_path: Path
+    :return: Rows for generic_history_store
+    :rtype: list of dict
+    """
+    df = process_payrange_csv(file_path, COLUMNS_TO_KEEP, LOCATION_LABEL)
+    return history_rows_from_frame(df, find_report_dates(Path(file_path).stem))
+
+
+def history_rows_from_frame(df, filedate_list):
+    """Each machine's sales, dated by its own 'Date' or else by the date in the filename."""
+    return frame_to_history_rows(
+        df,
+        ["Mobile$", "Cash$", "Credit$", "Total$", "Net$"],
+        report_date=filedate_list[0] if filedate_list else None,
+        date_column="Date",
+        location_column=LOCATION_LABEL,
+        entity_column="Mach Name",
+    )
+
+
 @logger.catch()
 def process_payrange_csv(filename, columns, LOCATION_LABEL):
     """This function written with ChatGPT as a pair programmer.
@@ -102,10 +148,7 @@ def process_payrange_csv(filename, columns, LOCATION_LABEL):
     # Load the CSV file
     logger.info(f'Loading the CSV file {filename}')
     file_path = Path(filename)
-    df = pd.read_csv(file_path)
-
-    # Clean the data by stripping leading/trailing spaces from all columns
-    df = df.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
+    df = load_csv_with_schema(file_path, CSV_SCHEMA)
 
     value = df.iloc[0][LOCATION_LABEL]  # Extract the name of the Business where this data came from
 
@@ -2,11 +2,13 @@ import pandas as panda
 from loguru import logger
 from pathlib import Path
 
-from generic_munge_functions import extract_dates
+from generic_munge_functions import find_report_dates, DATE_HINT_SINGLE
 from generic_excel_functions import apply_excel_formatting_to_dataframe_and_save_spreadsheet
 from generic_excel_functions import convert_xlsx_2_pdf
 from generic_munge_functions import print_pdf_using_os_subprocess
 from generic_munge_functions import archive_original_file
+from generic_dataframe_functions import load_csv_with_schema
+from generic_history_store import append_history, frame_to_history_rows
 
 """this is now appended to the end of this file
 from TouchTunes_Jukebox_Details import (
@@ -24,6 +26,22 @@ FILENAME_STRINGS_TO_MATCH = [
     "dummy place holder",
 ]
 ARCHIVE_DIRECTORY_NAME = "TouchTunes_Collection_History"
+HISTORY_VENDOR = "TouchTunes"  # vendor name used in the revenue history store
+HISTORY_METRICS = [
+    "Cash Money Revenue",
+    "Cellphone Revenue",
+    "Total Revenues",
+    "Music License Fees",
+    "Total to split",
+    "Your Share",
+    "Storz Share",
+]
+FILENAME_DATE_HINT = DATE_HINT_SINGLE  # how find_report_dates() should read dates from our filenames
+# The collection details file has no header row, just description,value pairs
+CSV_SCHEMA = {
+    "names": ["Category", "Value"],
+    "columns": {"Category": str, "Value": str},
+}
 
 
 class FileMatcher:
@@ -63,7 +81,7 @@ def data_handler_process(file_path: Path):
         return False
 
     logger.debug(f"Looking for date string in: {file_path.stem}")
-    filedates_list = extract_dates(file_path.stem)  # filename without SUFFIX
+    filedates_list = find_report_dates(file_path.stem, hint=FILENAME_DATE_HINT)  # filename without SUFFIX
     logger.debug(f"Found Date: {filedates_list}")
 
     # this data has more needed details in the filename. example:   Collection Details (A79CD) May 17, 2024 (4).csv
@@ -95,6 +113,7 @@ def data_handler_process(file_path: Path):
     if len(df_output) < 1:
         logger.error(f"No data found to output")
         return False
+    append_history(HISTORY_VENDOR, file_path, history_rows_from_frame(df_output))
 
     # TODO move this section
     # processing done, send result to printer
@@ -131,6 +150,35 @@ def data_handler_process(file_path: Path):
     return True
 
 
+@logger.catch
+def extract_history_rows(file_path: Path):
+    """
+    Side effect free: one jukebox collection as revenue history rows.
+
+    :param file_path: The collection details CSV file
+    :type file_path: Path
+    :return: Rows for generic_history_store
+    :rtype: list of dict
+    """
+    filedates_list = find_report_dates(file_path.stem, hint=FILENAME_DATE_HINT)
+    if not filedates_list:
+        logger.warning(f"No report date in {file_path.name}, nothing added to history.")
+        return []
+    raw_dataframe = aquire_revenue_data(file_path, filedates_list, ID_inside_filename(file_path))
+    return history_rows_from_frame(create_output_dataframe_from(raw_dataframe))
+
+
+def history_rows_from_frame(df_output):
+    """The collection amounts of the output frame, dated by its 'Date' row."""
+    return frame_to_history_rows(
+        df_output,
+        HISTORY_METRICS,
+        date_column="Date",
+        location_column="Location Name",
+        entity_column="Device_ID",
+    )
+
+
 @logger.catch
 def aquire_revenue_data(file_path: Path, dates_list, device_id) -> bool:
     # This is the customized procedures used to process this data. Should return a dataframe.
@@ -159,13 +207,10 @@ def aquire_revenue_data(file_path: Path, dates_list, device_id) -> bool:
     #                                       ...
     # Read the CSV file with no headers
     try:
-        df = panda.read_csv(file_path, header=None)
+        df = load_csv_with_schema(file_path, CSV_SCHEMA)
     except FileNotFoundError as e:
         return empty_df
     logger.debug(f'Dataframe loaded.')
-
-    # Rename the columns for better readability
-    df.columns = ["Category", "Value"]
     # Create a dictionary to track the occurrence of each category as we look for duplicate labels
     category_count = {}
 
@@ -186,7 +231,7 @@ def aquire_revenue_data(file_path: Path, dates_list, device_id) -> bool:
     # Define the new rows as a list of dictionaries so we can add data to the bottom
     new_rows = [
         {"Category": "Device_ID", "Value": str(device_id)},
-        {"Category": "Date",  "Value": dates_list[0]},  # we only want the first date if more than 1 is provided
+        {"Category": "Date",  "Value": dates_list[0].isoformat()},  # we only want the first date if more than 1 is provided
     ]
     logger.debug(f'{new_rows=}')
 
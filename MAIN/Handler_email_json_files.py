@@ -1,12 +1,13 @@
 import re
-import requests
 import pandas as panda
 from loguru import logger
 from pathlib import Path
-from generic_munge_functions import extract_dates
+from generic_munge_functions import find_report_dates
 from generic_munge_functions import archive_original_file
 from generic_dataframe_functions import send_dataframe_to_file_as_csv
 from generic_dataframe_functions import load_json_to_dataframe
+from generic_email_rules import EmailRuleEngine, SavedAttachment
+from generic_download_manager import DownloadManager, DownloadError
 
 SYSTEM_PRINTER_NAME = "Canon TR8500 series"  # SumatrPDF needs the output printer name
 
@@ -19,6 +20,10 @@ FILENAME_STRINGS_TO_MATCH = [
 ]
 ARCHIVE_DIRECTORY_NAME = "eMail_history"
 DOWNLOAD_DIRECTORY = Path("D:/Users/Conrad/Downloads/")
+DOWNLOAD_MANAGER = DownloadManager()  # one pooled session for every emailed link
+# what to do with each email is declared in EmailRoutingRules.json
+EMAIL_RULES = EmailRuleEngine.from_file(download_directory=DOWNLOAD_DIRECTORY,
+                                        downloader=lambda url, directory: initiate_download(url, directory))
 
 class FileMatcher:
     """
@@ -57,7 +62,7 @@ def data_handler_process(file_path: Path):
         return False
 
     logger.debug(f"Looking for date string in: {file_path.stem}")
-    filedates_list = extract_dates(file_path.stem)  # filename without SUFFIX
+    filedates_list = find_report_dates(file_path.stem)  # filename without SUFFIX
     logger.debug(f"Found Date(s): {filedates_list}")
 
     new_source_data_filename = file_path.parent / ARCHIVE_DIRECTORY_NAME / file_path.name
@@ -112,15 +117,11 @@ def process_this_data(raw_dataframe, date_str_list, output_file) -> bool:
 
     # *** place custom code here ***
 
-    # There is an email from PayRange that includes a link in the body of the email to the download url for the data that the email references.
-    PAYRANGE_EMAIL_BODY_DETAILS_DOWNLOAD_IDENTIFIER = "\r\nDownload\r\n<https://"
-    # When this sub-string exists in the body of an email then go ahead and initiate that download.
-    if PAYRANGE_EMAIL_BODY_DETAILS_DOWNLOAD_IDENTIFIER in raw_dataframe['body']:
-        logger.debug(f'Data download URL found.')
-        data_url = extract_download_url(raw_dataframe['body'])
-        logger.debug(f'Data URL: {data_url}')
-        initiate_download(data_url, DOWNLOAD_DIRECTORY)
-        logger.debug('Data download completed.')
+    # Emails such as PayRange's carry a link to the data they reference, the routing rules decide what to act on.
+    for email in raw_dataframe.to_dict("records"):
+        attachments = [SavedAttachment(a["filename"], a["saved_to"], a.get("content_hash")) for a in email.get("attachments") or []]
+        actions = EMAIL_RULES.route(email.get("from"), email.get("subject"), email.get("body"), attachments)
+        logger.debug(f"Email rule actions taken: {actions}")
 
     # all work complete
     return raw_dataframe
@@ -145,7 +146,8 @@ def extract_download_url(text):
 
 def initiate_download(url, download_dir):
     """
-    Download a file from the given URL and save it in the specified directory using pathlib.
+    Download a file from the given URL into the specified directory.
+    The file appears in the directory only once it is complete, interrupted downloads are resumed.
 
     :param url: The URL of the resource to download.
     :type url: str
@@ -154,28 +156,10 @@ def initiate_download(url, download_dir):
     :return: The path to the downloaded file.
     :rtype: Path or None
     """
-    # Ensure the download directory exists
-    download_dir = Path(download_dir)
-    download_dir.mkdir(parents=True, exist_ok=True)
-
-    # Extract the filename from the URL
-    filename = url.split('/')[-1]
-    
-    # Full path to save the file
-    file_path = download_dir / filename
-
     try:
-        # Download the file
-        response = requests.get(url, stream=True)
-        response.raise_for_status()  # Raise an error for bad HTTP status codes
-        
-        # Save the file
-        with file_path.open('wb') as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
-        
-        print(f"File downloaded successfully: {file_path}")
-        return file_path
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to download the file: {e}")
+        result = DOWNLOAD_MANAGER.download(url, download_dir)
+    except DownloadError as e:
+        logger.error(f"Failed to download the file: {e}")
         return None
+    logger.info(f"File downloaded successfully: {result}")
+    return result.path
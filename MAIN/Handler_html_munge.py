@@ -1,9 +1,10 @@
 import pandas as pd
 from loguru import logger
 from pathlib import Path
-from generic_munge_functions import extract_dates
-from generic_pdf_functions import print_pdf, convert_html_to_pdf
+from generic_munge_functions import find_report_dates
+from generic_pdf_functions import print_pdf, convert_html_batch
 from generic_munge_functions import archive_original_file
+from generic_file_hash_functions import new_sibling_files, record_processed_files
 
 SYSTEM_PRINTER_NAME = "Canon TR8500 series"  # SumatrPDF needs the output printer name
 
@@ -58,35 +59,52 @@ def data_handler_process(file_path: Path):
         return False
 
     logger.debug(f"Looking for date string in: {file_path.stem}")
-    filedates_list = extract_dates(file_path.stem)  # filename without SUFFIX
+    filedates_list = find_report_dates(file_path.stem)  # filename without SUFFIX
     logger.debug(f"Found Date: {filedates_list}")
 
     
 
-    output_file = Path(f"{ARCHIVE_DIRECTORY_NAME}{OUTPUT_FILE_SUFFIX}")
-    logger.debug(f"Output filename: {output_file}")
+    # reports are often downloaded together, convert the new ones waiting next to this file in the same batch
+    sibling_hashes = new_sibling_files(file_path, declaration.matches)
+    html_files = [file_path] + list(sibling_hashes)
+    input_file_archive_destination = file_path.parent / ARCHIVE_DIRECTORY_NAME
+    pages = [(html_file, output_file_for(html_file, input_file_archive_destination)) for html_file in html_files]
+    logger.debug(f"Output filenames: {[str(output_file) for html_file, output_file in pages]}")
 
     # launch the processing function
     try:
         logger.debug(f'Starting data aquisition.')
         # raw_dataframe = aquire_data(file_path, filedates_list)
-        convert_html_to_pdf(file_path, output_file)
+        input_file_archive_destination.mkdir(parents=True, exist_ok=True)
+        timings = convert_html_batch(pages)
     except Exception as e:
         logger.error(f"Failure processing HTML: {e}")
         return False
 
-    print_pdf(output_file, SYSTEM_PRINTER_NAME)
-
-    # move PDF file to archive directory
-    input_file_archive_destination = file_path.parent / ARCHIVE_DIRECTORY_NAME
-    try:
-        logger.info(f"Archiving original file from:\n {file_path} to \n{input_file_archive_destination}")
-        archive_original_file(file_path, input_file_archive_destination)
-    except Exception as e:
-        logger.error(f"Error archiving file: {file_path}, Error: {e}")
-        return False
-
-    return True
+    # a page missing from the timings was in a batch that failed, it stays in place for the next run
+    converted = [(html_file, output_file) for html_file, output_file in pages if output_file in timings]
+    for html_file, output_file in pages:
+        if output_file not in timings:
+            logger.error(f"{html_file.name} was not converted to PDF, leaving it in the download directory.")
+    converted_files = {html_file for html_file, output_file in converted}
+    record_processed_files({f: content_hash for f, content_hash in sibling_hashes.items() if f in converted_files})
+
+    # print the PDF and move the HTML next to it in the archive directory
+    for html_file, output_file in converted:
+        print_pdf(output_file, SYSTEM_PRINTER_NAME)
+        try:
+            logger.info(f"Archiving original file from:\n {html_file} to \n{input_file_archive_destination}")
+            archive_original_file(html_file, input_file_archive_destination)
+        except Exception as e:
+            logger.error(f"Error archiving file: {html_file}, Error: {e}")
+            return False
+
+    return file_path in converted_files
+
+
+def output_file_for(html_file, archive_directory):
+    """Each report in a batch gets its own PDF, kept in the archive directory where its HTML is moved."""
+    return archive_directory / f"{html_file.stem}{OUTPUT_FILE_SUFFIX}"
 
 
 @logger.catch
@@ -1,6 +1,6 @@
 from loguru import logger
 from pathlib import Path
-from generic_munge_functions import extract_dates
+from generic_munge_functions import find_report_dates
 from generic_pdf_functions import print_pdf, load_pdf_to_dataframe
 from generic_dataframe_functions import print_dataframe_to_named_printer
 from generic_munge_functions import archive_original_file
@@ -58,7 +58,7 @@ def data_handler_process(file_path: Path):
         return False
 
     logger.debug(f"Looking for date string in: {file_path.stem}")
-    filedates_list = extract_dates(file_path.stem)  # filename without SUFFIX
+    filedates_list = find_report_dates(file_path.stem)  # filename without SUFFIX
     logger.debug(f"Found Date: {filedates_list}")
 
     output_file = Path(f"{ARCHIVE_DIRECTORY_NAME}{OUTPUT_FILE_SUFFIX}")
@@ -21,6 +21,7 @@ import json
 from loguru import logger
 from pathlib import Path
 from generic_dataframe_functions import save_dataframe_as_csv_and_print
+from generic_dataframe_functions import parse_money_columns
 
 
 # standardized declaration for CFSIV_Data_Munge_Extensible project
@@ -153,18 +154,8 @@ dft2.astype(str).min()
     """
 
     try:
-        # TODO standardize the function that strips extra characters from a numeric string
-        # e.g. df[?] = strip2float(df[?])
-        # try to recognize as many standard strings as possible. $1 ($1) -$1 $-1,234.876 etc
-        df["Surch"].replace("[\$,)]", "", regex=True, inplace=True)
-        df["Surch"] = df["Surch"].astype(float)
-    except KeyError as e:
-        logger.error(f"KeyError in dataframe: {e}")
-        return empty_df
-
-    try:
-        df["Settlement"].replace("[\$,)]", "", regex=True, inplace=True)
-        df["Settlement"] = df["Settlement"].astype(float)
+        # recognizes $1 ($1) -$1 $-1,234.876 etc
+        parse_money_columns(df, ["Surch", "Settlement"])
     except KeyError as e:
         logger.error(f"KeyError in dataframe: {e}")
         return empty_df
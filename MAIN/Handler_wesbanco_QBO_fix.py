@@ -4,14 +4,65 @@
 from loguru import logger
 from pathlib import Path
 import re
+from concurrent.futures import ProcessPoolExecutor
 import generic_pathlib_file_methods as plfh
+from generic_cache_functions import PersistentLRUCache, ruleset_hash
+from generic_file_hash_functions import new_sibling_files, record_processed_files
+from generic_ofx_functions import FITIDLedger, read_qbo_file, merge_qbo_documents
+from generic_pipeline_sinks import get_sinks
 
 QBO_MODIFIED_DIRECTORY = Path("D:/Users/Conrad/Documents/")
+QBO_FITID_LEDGER_FILE = QBO_MODIFIED_DIRECTORY / "qbo_fitid_ledger.sqlite"  # every FITID already written
+QBO_MAX_WORKERS = 4  # account exports processed concurrently
 
 # standardized declaration for CFSIV_Data_Munge_Extensible project
 INPUT_DATA_FILE_SUFFIX = ".qbo"
 FILENAME_STRINGS_TO_MATCH = ["Export-", "dummy place holder"]
 
+# Remove specified bad text patterns from memo lines
+BAD_TEXT = [
+    r"DEBIT +\d{4}",  # TODO should this be removed as unneccessary?
+    "CKCD ",  # the space included here ensures that this string is not part of a bigger word
+    "AC-",  # no space here allows this substring to be removed from a string
+    "POS DB ",
+    "POS ",  # 'pos' won't be removed from words like 'position'
+    "-ONLINE ",
+    "-ACH ",
+    "DEBIT ",
+    "CREDIT ",
+    "ACH ",  # possibly i need to consider how these strings are handled by the cleaning routine.
+    "MISCELLANEOUS ",  # 'ach ' would probably match 'reach ' and result in 're'
+    "PREAUTHORIZED ",
+    "PURCHASE ",
+    "TERMINAL ",
+    "ATM ",
+    "BOOK ",
+    "REF ",
+    "BillPay ",
+    "Insurance ",
+    "SEWER PMT ",
+    "FREIGHT TOOLS ",
+    "ENER ",
+    "FUNDS ",
+    "ANYWHERE ",
+    "ACHTRANS ",
+    "NAYAX REIM ",
+    "EFTRANSACT ",
+    "LOAN PAYMENT ",
+    "TECHNOL ",
+    "MERCHANT ",
+    "AUTOMATIC ",
+    "TRANSFER ",
+]
+MEMO_REPLACEMENTS = {"BILL PAYMT": "BillPay"}  # Shortening common phrases
+QBO_NAME_MAX_LENGTH = 32  # Quickbooks limits names of transactions to 32 characters
+
+# Cleaned memos are remembered between runs. Changing the rules above automatically invalidates the cache.
+MEMO_CACHE_FILE = Path("qbo_memo_cache.sqlite")
+MEMO_RULES_VERSION = 1  # bump this if preprocess_memo() logic changes without changing the rules above
+MEMO_RULESET = ruleset_hash(BAD_TEXT, MEMO_REPLACEMENTS, QBO_NAME_MAX_LENGTH, MEMO_RULES_VERSION)
+_memo_cache = None  # opened on first use
+
 
 class FileMatcher:
     """
@@ -57,96 +108,187 @@ def data_handler_process(file_path: Path) -> bool:
     """
     Processes the data file specified by the file path.
 
-    This function checks if the file exists, processes its contents,
-    and moves the file to the appropriate history folder.
+    Any other account exports waiting in the same directory are processed along with it
+    so that several accounts are handled concurrently. Every processed file is moved
+    to the appropriate history folder. The directory watcher only dispatched the first file,
+    so the content hashes of the others are added to its index here.
 
     :param file_path: The Path object representing the file to process.
     :type file_path: Path
     :return: True if the file was successfully processed, False otherwise.
     :rtype: bool
     """
-    if not file_path.exists:
+    if not file_path.exists():
         logger.error(f"File to process does not exist.")
         return False
-    else:
-        # process file
-        original_records_list = read_base_file(file_path)
-        if not len(original_records_list) > 0:
-            logger.error(f"File returned no records.")
-            return False
-        # we have a file, try to process
-        logger.info(f"file found to process: {file_path.name}")
-        modify_QBO(original_records_list)
+    # gather every waiting export so they can be processed together
+    sibling_hashes = new_sibling_files(file_path, declaration.matches)
+    export_files = [file_path] + list(sibling_hashes)
+    logger.info(f"{len(export_files)} file(s) found to process: {[f.name for f in export_files]}")
+    results = process_qbo_exports(export_files)
+    record_processed_files({f: content_hash for f, content_hash in sibling_hashes.items() if results.get(f)})
+    for export_file, processed in results.items():
+        if not processed:
+            logger.error(f"File {export_file.name} was not processed.")
+            continue
         # work finished remove original file from download directory
-        new_file_path = file_path.parent / "QBO_file_history" / file_path.name
+        new_file_path = export_file.parent / "QBO_file_history" / export_file.name
         # move the file
-        plfh.move_file_with_check(file_path, new_file_path)
+        plfh.move_file_with_check(export_file, new_file_path)
     # all work complete
-    return True
+    return results.get(file_path, False)
+
+
+@logger.catch
+def process_qbo_exports(export_files, max_workers=QBO_MAX_WORKERS):
+    """
+    Clean several account exports concurrently and write one incremental QBO file per account.
+
+    Parsing and memo cleaning run across a process pool. Writing the output, updating
+    the FITID ledger and saving newly cleaned memos happen here in the parent process
+    so only one process writes to each database.
+    Downloads for the same account are merged before the ledger is consulted.
+
+    :param export_files: The QBO files to process.
+    :type export_files: list[Path]
+    :param max_workers: Size of the process pool. A single file is processed without a pool.
+    :type max_workers: int
+    :return: True or False for each export file, True when the file was processed.
+    :rtype: dict[Path, bool]
+    """
+    results = {export_file: False for export_file in export_files}
+    memo_cache = get_memo_cache()
+    if len(export_files) == 1 or max_workers < 2:
+        documents = [clean_qbo_file(export_file) for export_file in export_files]
+    else:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(export_files)), initializer=_start_worker) as pool:
+            cleaned = list(pool.map(_clean_qbo_file_in_worker, export_files))
+        documents = [document for document, _ in cleaned]
+        for _, new_memos in cleaned:
+            for raw, value in new_memos.items():
+                memo_cache.put(raw, value)
+    # save any newly cleaned memos for the next run, a dry run leaves the cache file as it was
+    new_memos = memo_cache.take_pending()
+    if new_memos and get_sinks().record("qbo_memo_cache", new_memos):
+        for raw, value in new_memos.items():
+            memo_cache.put(raw, value)
+        memo_cache.flush()
+
+    # downloads for the same account are merged so overlapping transactions are only handled once
+    by_account = {}
+    for export_file, document in zip(export_files, documents):
+        if document is None or not document.transactions:
+            logger.error(f"File {export_file.name} returned no transactions.")
+            continue
+        by_account.setdefault(document.account_id, []).append((export_file, document))
+
+    ledger = FITIDLedger(QBO_FITID_LEDGER_FILE)
+    try:
+        for account_number, account_exports in by_account.items():
+            merged = merge_qbo_documents([document for _, document in account_exports])
+            if write_incremental_qbo(merged, ledger):
+                for export_file, _ in account_exports:
+                    results[export_file] = True
+    finally:
+        ledger.close()
+    return results
 
 
 @logger.catch
-def modify_QBO(QBO_records_list):
-    """Take a list of strings from a QBO file format and improve transaction names and memos.
+def clean_qbo_file(file_path: Path):
+    """Take a QBO file and improve transaction names and memos.
     Wesbanco Bank places all useful info into the memo line. Quickbooks processes transactions based on the names.
     Wesbanco places verbose human readable descriptions in the memo line and a simple transaction number in the name.
     Let's swap those to help quickbooks process the transactions and categorize them.
     Quickbooks limits names of transactions to 32 characters so let's remove the verbose language from the original memos.
+
+    This runs inside the process pool so it must only depend on its argument.
+
+    :param file_path: The QBO file to clean.
+    :type file_path: Path
+    :return: The parsed document with cleaned transactions, or None if the file could not be read.
+    :rtype: QBODocument or None
     """
-    modified_qbo, file_date, acct_number = process_qbo_lines(QBO_records_list)
+    logger.debug(f"Attempting to open input file {file_path.name}")
+    document = read_qbo_file(file_path)
+    if document is None:
+        return None
+    for transaction in document.transactions:
+        clean_transaction(transaction)
+    logger.debug(f"{len(document.transactions)} transactions found in {file_path.name}.")
+    return document
+
+
+def _start_worker():
+    """Pool initializer, a forked worker must not reuse the parent's SQLite connection."""
+    global _memo_cache
+    _memo_cache = None
+
+
+def _clean_qbo_file_in_worker(file_path: Path):
+    """
+    Run clean_qbo_file() in a pool worker.
+
+    :return: The cleaned document and the memos the worker cleaned that were not cached yet
+    :rtype: tuple
+    """
+    document = clean_qbo_file(file_path)
+    return document, get_memo_cache().take_pending()
+
+
+@logger.catch
+def write_incremental_qbo(document, ledger):
+    """
+    Write only the transactions the ledger has not seen before and record them in the ledger.
+
+    The output is named <DTEND>_<ACCTID>.qbo. An existing file of that name is never
+    overwritten, a counter is added to the new name instead.
+
+    :param document: The cleaned document for one account.
+    :type document: QBODocument
+    :param ledger: The ledger of FITIDs already written.
+    :type ledger: FITIDLedger
+    :return: True if the document was handled (including when nothing was new), False on failure.
+    :rtype: bool
+    """
+    account_number = document.account_id or "42"  # default
+    qbo_file_date = (document.statement_end or "19700101")[:8]  # default value incase no date found
+    incremental = document.deduplicate(ledger.seen_fitids(account_number))
+    new_transactions = incremental.transactions
+    skipped = len(document.transactions) - len(new_transactions)
+    if not new_transactions:
+        logger.info(f"No new transactions for account {account_number}, {skipped} already imported.")
+        return True
     # Attempt to write results to cleanfile
-    fname = "".join([file_date, "_", acct_number, INPUT_DATA_FILE_SUFFIX])
-    logger.debug(f"Attempting to output modified lines to file name: {fname}")
-    clean_output_file = Path(QBO_MODIFIED_DIRECTORY, fname)
+    clean_output_file = unique_output_path(QBO_MODIFIED_DIRECTORY, f"{qbo_file_date}_{account_number}")
+    logger.debug(f"Attempting to output modified lines to file name: {clean_output_file.name}")
+    if not get_sinks().output(clean_output_file, incremental.serialize()):
+        return True  # a dry run leaves the ledger untouched so the same transactions stay new
     try:
-        with open(clean_output_file, "w") as f:
-            f.writelines(modified_qbo)
+        clean_output_file.write_text(incremental.serialize())
     except Exception as e:
         logger.error(f"Error in writing {clean_output_file}")
         logger.warning(str(e))
         return False
-
-    logger.info(f"File {clean_output_file} contents written successfully.")
+    ledger.record(account_number, new_transactions, clean_output_file.name)
+    logger.info(f"File {clean_output_file} written with {len(new_transactions)} new transactions, {skipped} already imported.")
     return True
 
 
+@logger.catch
+def unique_output_path(directory: Path, stem: str) -> Path:
+    """Return directory/stem.qbo, or stem_2.qbo, stem_3.qbo... if that name is taken."""
+    candidate = Path(directory, f"{stem}{INPUT_DATA_FILE_SUFFIX}")
+    counter = 1
+    while candidate.exists():
+        counter += 1
+        candidate = Path(directory, f"{stem}_{counter}{INPUT_DATA_FILE_SUFFIX}")
+    return candidate
+
+
 @logger.catch
 def preprocess_memo(memo):
     # Remove specified bad text patterns
-    BAD_TEXT = [
-        r"DEBIT +\d{4}",  # TODO should this be removed as unneccessary?
-        "CKCD ",  # the space included here ensures that this string is not part of a bigger word
-        "AC-",  # no space here allows this substring to be removed from a string
-        "POS DB ",
-        "POS ",  # 'pos' won't be removed from words like 'position'
-        "-ONLINE ",
-        "-ACH ",
-        "DEBIT ",
-        "CREDIT ",
-        "ACH ",  # possibly i need to consider how these strings are handled by the cleaning routine.
-        "MISCELLANEOUS ",  # 'ach ' would probably match 'reach ' and result in 're'
-        "PREAUTHORIZED ",
-        "PURCHASE ",
-        "TERMINAL ",
-        "ATM ",
-        "BOOK ",
-        "REF ",
-        "BillPay ",
-        "Insurance ",
-        "SEWER PMT ",
-        "FREIGHT TOOLS ",
-        "ENER ",
-        "FUNDS ",
-        "ANYWHERE ",
-        "ACHTRANS ",
-        "NAYAX REIM ",
-        "EFTRANSACT ",
-        "LOAN PAYMENT ",
-        "TECHNOL ",
-        "MERCHANT ",
-        "AUTOMATIC ",
-        "TRANSFER ",
-    ]
     logger.debug(f"Original memo line:{memo}")
     for bad_text in BAD_TEXT:
         if re.match(r".*\d{4}.*", bad_text):  # Check if the bad text is a regex pattern
@@ -154,7 +296,9 @@ def preprocess_memo(memo):
         else:
             memo = memo.replace(bad_text, "")
     # Shortening common phrases (if any remain)
-    memo = memo.replace("BILL PAYMT", "BillPay").strip()
+    for phrase, short_phrase in MEMO_REPLACEMENTS.items():
+        memo = memo.replace(phrase, short_phrase)
+    memo = memo.strip()
     # Further cleanup to remove extra spaces and standardize spacing
     memo = re.sub(" +", " ", memo).strip()
     logger.debug(f"Cleaned memo:{memo}")
@@ -162,7 +306,7 @@ def preprocess_memo(memo):
 
 
 @logger.catch
-def truncate_name(name, max_length=32):
+def truncate_name(name, max_length=QBO_NAME_MAX_LENGTH):
     """
     Truncate the name value to ensure it does not exceed QuickBooks' limit.
     
@@ -182,160 +326,54 @@ def truncate_name(name, max_length=32):
 
 
 
+def get_memo_cache():
+    """
+    Return the memo normalization cache, opening it on first use.
+
+    :return: The cache of cleaned memo lines keyed by raw memo and rule-set hash.
+    :rtype: PersistentLRUCache
+    """
+    global _memo_cache
+    if _memo_cache is None:
+        _memo_cache = PersistentLRUCache(MEMO_CACHE_FILE, "memo_cache", MEMO_RULESET)
+    return _memo_cache
+
+
 @logger.catch
-def extract_transaction_details(transaction_lines):
-    """Extract details from transaction lines into a dictionary of tag:value."""
-    transaction_details = {}
-    
-    for line in transaction_lines:
-        line = line.strip()
-        
-        if not line:
-            continue  # Skip empty lines
-        
-        # Split the line at the first occurrence of ">" to separate the tag from its value
-        parts = line.split(">", 1)
-        
-        if len(parts) == 2 and parts[0].startswith("<"):
-            tag = parts[0][1:].strip()  # Remove the opening "<" from the tag
-            value = parts[1].strip()  # Strip any leading/trailing whitespace from value
-            
-            if tag in transaction_details:
-                logger.warning(f"Duplicate tag '{tag}' found. Overwriting previous value.")
-            
-            transaction_details[tag] = value
-    
-    logger.debug(f"Extracted transaction details: {transaction_details}")
-    return transaction_details
+def normalize_memo(memo):
+    """
+    Clean and truncate a memo line, reusing the result from earlier runs when the same memo was seen before.
 
+    :param memo: The raw memo text from the bank download.
+    :type memo: str
+    :return: The memo with bad text removed, truncated to the Quickbooks name limit.
+    :rtype: str
+    """
+    return get_memo_cache().get_or_compute(memo, lambda raw: truncate_name(preprocess_memo(raw)))
 
 
 @logger.catch
-def process_transaction(transaction_lines):
-    """Process individual transactions, ensuring memo presence, checking name and memo equality,
-    and reformatting back into a list of lines."""
-    transaction_details = extract_transaction_details(transaction_lines)
+def clean_transaction(transaction):
+    """Process an individual transaction, ensuring memo presence, checking name and memo equality
+    and swapping them. The transaction is modified in place keeping its original tag order."""
     # Ensure there's a memo tag, add a default one if necessary
-    if "MEMO" not in transaction_details:
-        transaction_details["MEMO"] = "No Memo"
+    if transaction.memo is None:
+        transaction.set("MEMO", "No Memo")
     else:
         # memo needs to be stripped of bad text and truncated
-        transaction_details["MEMO"] = truncate_name(
-            preprocess_memo(transaction_details["MEMO"])
-        )
-    logger.debug(transaction_details)
+        transaction.set("MEMO", normalize_memo(transaction.memo))
     # Check for equality of name and memo
-    if "NAME" not in transaction_details:
-        transaction_details["NAME"] = "No Name"
-    name = transaction_details["NAME"]
-    memo = transaction_details["MEMO"]
+    if transaction.name is None:
+        transaction.set("NAME", "No Name")
+    name = transaction.name
+    memo = transaction.memo
     if name == memo == "CHECK PAID":
         # Use checknum for name and refnum for memo if available
-        checknum = transaction_details.get("CHECKNUM", "No CheckNum")
-        refnum = transaction_details.get("REFNUM", "No RefNum")
-        transaction_details["NAME"] = checknum
-        transaction_details["MEMO"] = refnum
+        transaction.set("NAME", transaction.get("CHECKNUM", "No CheckNum"))
+        transaction.set("MEMO", transaction.get("REFNUM", "No RefNum"))
     else:
-        # name and memo are different so we need to swap their values using the power of tuple unpacking
-        transaction_details["NAME"], transaction_details["MEMO"] = transaction_details[
-            "MEMO"
-        ], transaction_details.get("NAME", "No Name")
-    logger.debug(transaction_details)
-    # Convert transaction_details back into a list of lines
-    processed_lines = []
-    for tag, value in transaction_details.items():
-        line = f"<{tag}>{value}\n"
-        processed_lines.append(line)
-    return processed_lines
-
-
-@logger.catch
-def process_qbo_lines(lines):
-    qbo_file_date = "19700101"  # default value incase no date found
-    account_number = "42"  # default
-    modified_lines = []  # Stores the modified lines of the entire file
-    transaction_lines = []  # Temporarily stores lines of the current transaction
-    processing_transaction = (
-        False  # Flag to indicate if we're within a transaction block
-    )
-    xacts_found = 0  # initialize counter of transactions found
-    for line in lines:
-        line_stripped = line.strip()
-        # Process header lines to extract date and account number
-        if line_stripped.startswith("<DTEND>"):
-            qbo_file_date = line_stripped.replace("<DTEND>", "")
-        elif line_stripped.startswith("<ACCTID>"):
-            account_number = line_stripped.replace("<ACCTID>", "")
-        if line_stripped.startswith("<STMTTRN>"):
-            processing_transaction = True  # Mark the start of a transaction
-            xacts_found += 1  # increment counter
-            transaction_lines = [line]  # Start a new transaction block
-        elif line_stripped.startswith("</STMTTRN>"):
-            # End of transaction found
-            transaction_lines.append(line)  # append the line
-            processing_transaction = (
-                False  # Reset the flag as the transaction block ends
-            )
-            modified_transaction_lines = process_transaction(
-                transaction_lines
-            )  # Process the collected lines of the transaction
-            modified_lines.extend(
-                modified_transaction_lines
-            )  # Add processed lines to the output
-        elif processing_transaction:
-            # If we are within a transaction, keep collecting its lines
-            transaction_lines.append(line)
-        else:
-            # Lines not part of a transaction are added directly to the output
-            modified_lines.append(line)
-    logger.debug(f"{xacts_found} transactions found.")
-    logger.debug(modified_lines)  # TODO make this output more log friendly
-    return modified_lines, qbo_file_date, account_number
-
-
-@logger.catch
-
-def read_base_file(input_file: Path):
-    """
-    Reads the contents of the specified file and returns a list of its lines.
-
-    This function attempts to open the file at the given path and read its contents.
-    If the file is successfully read, it returns a list of lines. If an error occurs,
-    it logs the error and returns an empty list.
-
-    :param input_file: The path to the file to be read (as a `Path` object).
-    :type input_file: Path
-    :return: A list containing the lines of the file. Returns an empty list if an error occurs.
-    :rtype: list[str]
-    
-    :raises FileNotFoundError: If the file does not exist.
-    :raises PermissionError: If there are insufficient permissions to read the file.
-    :raises Exception: For any other exceptions encountered during the file read process.
-
-    :example:
-
-    >>> from pathlib import Path
-    >>> file_path = Path("example.txt")
-    >>> lines = read_base_file(file_path)
-    >>> print(lines)
-    ['Line 1', 'Line 2', 'Line 3']
-
-    """
-    logger.debug(f"Attempting to open input file {input_file.name}")
-    try:
-        # Use Path's read_text method to read the entire file
-        file_contents = input_file.read_text().splitlines()
-    except FileNotFoundError:
-        logger.error(f"File not found: {input_file.name}")
-        file_contents = []
-    except PermissionError:
-        logger.error(f"Permission denied: {input_file.name}")
-        file_contents = []
-    except Exception as e:
-        logger.error(f"Error reading {input_file.name}: {str(e)}")
-        file_contents = []
-
-    if file_contents:
-        logger.debug(f"File contents read successfully. {len(file_contents)} lines.")
-    return file_contents
-
+        # name and memo are different so we need to swap their values
+        transaction.set("NAME", memo)
+        transaction.set("MEMO", name)
+    logger.debug(transaction)
+    return transaction
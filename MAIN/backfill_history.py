@@ -0,0 +1,197 @@
+"""
+Re-ingest archived reports into the revenue history store.
+
+Years of processed reports sit in the handlers' archive folders. This walks those folders, matches every
+file to its handler with the same ScriptManager matchers the directory watcher uses and calls the handler's
+side effect free extract_history_rows(). Nothing is printed, moved or written except the history store.
+
+Files are parsed in a process pool. Every stored file is recorded with its content hash so an interrupted
+backfill picks up where it stopped and files that did not change are never parsed twice.
+
+Usage:
+    python backfill_history.py "D:/Users/Conrad/Downloads" --workers 8
+"""
+
+from loguru import logger
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import importlib
+import os
+import sys
+import time
+from file_processor_and_scripts_manager import ScriptManager
+from generic_file_hash_functions import hash_file
+from generic_history_store import RevenueHistoryStore, HISTORY_DATABASE
+
+SCRIPTS_DIRECTORY = Path(__file__).parent
+ARCHIVE_DIRECTORY_NAMES = [
+    "FloatReportArchive",
+    "TouchTunes_Collection_History",
+    "KioSoft_History",
+    "PayRange_History",
+    "QBO_file_history",
+    "QuarterlyCommission",
+]
+TARGET_FILES_PER_SECOND = 20  # a year of daily reports from every vendor should backfill in about a minute
+PROGRESS_EVERY_SECONDS = 5
+
+
+def find_archived_reports(roots, directory_names=None):
+    """
+    List every file in the archive folders below the given roots.
+
+    :param roots: Download folders holding the archive folders, or archive folders themselves
+    :type roots: list of str or Path
+    :param directory_names: Names of the archive folders, ARCHIVE_DIRECTORY_NAMES when not given
+    :type directory_names: list of str or None
+    :return: Files in a stable order
+    :rtype: list of Path
+    """
+    directory_names = directory_names or ARCHIVE_DIRECTORY_NAMES
+    folders = []
+    for root in map(Path, roots):
+        if root.name in directory_names:
+            folders.append(root)
+        else:
+            folders.extend(root / name for name in directory_names if (root / name).is_dir())
+    files = sorted({path for folder in folders for path in folder.rglob("*") if path.is_file()})
+    logger.info(f"Found {len(files)} archived files in {len(folders)} archive folders.")
+    return files
+
+
+def _worker_setup(scripts_directory):
+    """Make the handler modules importable in each worker and keep their debug logging quiet."""
+    if str(scripts_directory) not in sys.path:
+        sys.path.insert(0, str(scripts_directory))
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+
+def extract_file_history(script_name, file_path):
+    """
+    Worker: parse one archived report with its handler.
+
+    :param script_name: Handler module that matched the file
+    :type script_name: str
+    :param file_path: The archived report
+    :type file_path: str or Path
+    :return: Vendor name and history rows. Rows are None when the handler failed to parse the file.
+    :rtype: tuple(str, list or None)
+    """
+    module = importlib.import_module(script_name)
+    rows = module.extract_history_rows(Path(file_path))
+    return getattr(module, "HISTORY_VENDOR", script_name), rows
+
+
+def plan_backfill(files, script_manager, store):
+    """
+    Decide which files need parsing.
+
+    :return: (script_name, path, content_hash) for each file to parse and counts of the files skipped
+    :rtype: tuple(list, dict)
+    """
+    work = []
+    skipped = {"unmatched": 0, "no_history": 0, "already_stored": 0}
+    for path in files:
+        script_name = script_manager.get_script_name_for_file(path.name)
+        if script_name is None:
+            skipped["unmatched"] += 1
+        elif script_manager.scripts[script_name]["history"] is None:
+            skipped["no_history"] += 1
+        else:
+            content_hash = hash_file(path)
+            if store.has_source(path.name, content_hash):
+                skipped["already_stored"] += 1
+            else:
+                work.append((script_name, path, content_hash))
+    logger.info(f"{len(work)} files to parse, skipped: {skipped}")
+    return work, skipped
+
+
+def _log_progress(done, total, started):
+    elapsed = time.perf_counter() - started
+    rate = done / elapsed if elapsed else 0.0
+    remaining = (total - done) / rate if rate else 0.0
+    logger.info(f"Backfill {done}/{total} files, {rate:.1f} files/s, about {remaining:.0f}s remaining")
+
+
+@logger.catch()
+def backfill_history(roots, database=None, max_workers=None, scripts_directory=SCRIPTS_DIRECTORY,
+                     target_files_per_second=TARGET_FILES_PER_SECOND):
+    """
+    Parse every archived report that is not in the history store yet and store its rows.
+
+    :param roots: Download folders holding the archive folders, or archive folders themselves
+    :type roots: list of str or Path
+    :param database: History database, HISTORY_DATABASE when not given
+    :type database: str or Path or None
+    :param max_workers: Worker processes, one per CPU when not given. 1 parses in this process.
+    :type max_workers: int or None
+    :param scripts_directory: Folder holding the handler modules
+    :type scripts_directory: Path
+    :param target_files_per_second: Throughput below this is logged as a warning
+    :type target_files_per_second: float
+    :return: Counts of stored, failed and skipped files, rows stored and files per second
+    :rtype: dict
+    """
+    script_manager = ScriptManager(scripts_directory)
+    script_manager.load_scripts()
+    store = RevenueHistoryStore(database or HISTORY_DATABASE)
+    stats = {"stored": 0, "failed": 0, "rows": 0, "files_per_second": 0.0}
+    try:
+        work, skipped = plan_backfill(find_archived_reports(roots), script_manager, store)
+        stats.update(skipped)
+        started = time.perf_counter()
+        last_progress = started
+
+        def record(path, content_hash, vendor, rows):
+            nonlocal last_progress
+            if rows is None:
+                logger.error(f"Could not parse {path}, it will be retried on the next backfill.")
+                stats["failed"] += 1
+            else:
+                stats["rows"] += store.append(vendor, path.name, rows, content_hash)
+                stats["stored"] += 1
+            if time.perf_counter() - last_progress > PROGRESS_EVERY_SECONDS:
+                last_progress = time.perf_counter()
+                _log_progress(stats["stored"] + stats["failed"], len(work), started)
+
+        workers = max_workers or os.cpu_count() or 1
+        if workers == 1 or len(work) < 2:
+            for script_name, path, content_hash in work:
+                record(path, content_hash, *extract_file_history(script_name, path))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_worker_setup,
+                                     initargs=(str(scripts_directory),)) as pool:
+                futures = {
+                    pool.submit(extract_file_history, script_name, str(path)): (path, content_hash)
+                    for script_name, path, content_hash in work
+                }
+                for future in as_completed(futures):
+                    path, content_hash = futures[future]
+                    try:
+                        vendor, rows = future.result()
+                    except Exception as e:
+                        logger.error(f"Worker failed on {path}: {e}")
+                        vendor, rows = None, None
+                    record(path, content_hash, vendor, rows)  # the store is only written from this process
+
+        elapsed = time.perf_counter() - started
+        stats["files_per_second"] = round(len(work) / elapsed, 1) if work and elapsed else 0.0
+        _log_progress(len(work), len(work), started)
+        if work and stats["files_per_second"] < target_files_per_second:
+            logger.warning(f"Backfill ran at {stats['files_per_second']} files/s, below the target of {target_files_per_second}.")
+        logger.info(f"Backfill finished: {stats}")
+        return stats
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-ingest archived reports into the revenue history store.")
+    parser.add_argument("roots", nargs="+", help="Download folders holding the archive folders")
+    parser.add_argument("--database", default=str(HISTORY_DATABASE), help="History database file")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, default one per CPU")
+    args = parser.parse_args()
+    backfill_history(args.roots, database=args.database, max_workers=args.workers)
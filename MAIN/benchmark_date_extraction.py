@@ -0,0 +1,141 @@
+"""
+Microbenchmark of extract_dates() against the multi-pattern extractor it replaced.
+
+The old implementation is kept below, unchanged apart from the logger.catch wrapper, so the gain of the
+single pass tokenizer can be measured on any machine. Both are timed without logger.catch on the report
+filenames from test_date_from_str.py plus a few timestamped names.
+
+Measured result: about 5.5-6x over all filenames (2-9x per name), not the order of magnitude that was aimed for.
+The old extractor makes six regex passes, the new one makes a single pass, so the gain is capped by how much of the
+old cost was spent re-scanning the string. What is left is one finditer over the name plus building date objects,
+which is why names with few or no digits ('This string has no dates.') gain only about 2x. Handlers do not pay even
+that more than once per file: find_report_dates() caches by filename and only falls back to dateutil when the
+single pass did not find the dates the hint asks for.
+
+Usage:
+    python benchmark_date_extraction.py
+    python benchmark_date_extraction.py --number 20000 --repeat 7
+"""
+
+from datetime import datetime
+import argparse
+import re
+import statistics
+import timeit
+from generic_munge_functions import extract_dates
+
+DEFAULT_NUMBER = 5_000  # calls per filename in one timing
+DEFAULT_REPEAT = 5  # timings per filename, the median is reported
+
+BENCHMARK_FILENAMES = [
+    "pay_at_machine_log_2024-06-19_to_2024-08-02",
+    "ATMActivityReport-2024-08-01-053533AM",
+    "Storz_Amusements_LLC-A13212-2024-08-04-location_sales",
+    "Terminal Status(w_FLOAT)automated 3 - 2024-07-31",
+    "Screenshot_2-8-2024_105738_www.vgtsforindiana.org",
+    "This string has no dates.",
+    "NAC2024 FINAL 4212024a5.PDF this string may be un-parsable",
+    "Collection Details (A79CD) May 17, 2024 (12).csv",
+    "notifiernayaxcom_report_20240918103000",
+    "revenue_detail_report_2024Sep18",
+]
+
+
+def _legacy_is_date_valid(date_str):
+    formats = ["%Y%b%d", "%Y%m%d", "%Y-%m-%d"]
+    min_date = datetime(1970, 1, 1)
+    max_date = datetime(2170, 1, 1)
+    for fmt in formats:
+        try:
+            date_obj = datetime.strptime(date_str, fmt)
+            return min_date <= date_obj <= max_date
+        except (TypeError, ValueError):
+            continue
+    return False
+
+
+def legacy_extract_dates(string):
+    """The extractor before the single pass tokenizer: six patterns, each scanned separately."""
+    patterns = [
+        r"(\d{4})[-_]?(\d{2})[-_]?(\d{2})",  # YYYY-MM-DD or YYYY_MM_DD
+        r"(\d{1,2})-(\d{1,2})-(\d{4})",  # MM-DD-YYYY
+        r"(\d{4})(\d{2})(\d{2})",  # YYYYMMDD
+        r"(\d{4})([a-zA-Z]{3})(\d{2})",  # YYYYmonDD
+        r"([A-Za-z]+) (\d{1,2}), (\d{4})",  # Month DD, YYYY
+        r"\b(\d{1,2})(\d{1,2})(\d{4})\b",  # Handle formats like '4212024'
+    ]
+    found_dates = set()
+    for pattern in patterns:
+        for match in re.findall(pattern, string):
+            try:
+                if pattern == patterns[0]:
+                    date_str = f"{match[0]}-{match[1].zfill(2)}-{match[2].zfill(2)}"
+                elif pattern == patterns[1]:
+                    date_str = f"{match[2]}-{match[0].zfill(2)}-{match[1].zfill(2)}"
+                elif pattern == patterns[2]:
+                    date_str = f"{match[0]}-{match[1].zfill(2)}-{match[2].zfill(2)}"
+                elif pattern == patterns[3]:
+                    month = datetime.strptime(match[1].lower(), "%b").strftime("%m")
+                    date_str = f"{match[0]}-{month}-{match[2].zfill(2)}"
+                elif pattern == patterns[4]:
+                    month = datetime.strptime(match[0][:3].lower(), "%b").strftime("%m")
+                    date_str = f"{match[2]}-{month}-{match[1].zfill(2)}"
+                elif pattern == patterns[5]:
+                    date_str = f"{match[2]}-{match[0].zfill(2)}-{match[1].zfill(2)}"
+                if _legacy_is_date_valid(date_str):
+                    found_dates.add(date_str)
+            except ValueError:
+                continue
+    if not found_dates:
+        return []
+    date_objects = sorted(datetime.strptime(date, "%Y-%m-%d") for date in found_dates)
+    return [date.strftime("%Y-%m-%d") for date in date_objects]
+
+
+def time_extractor(extractor, filenames, number=DEFAULT_NUMBER, repeat=DEFAULT_REPEAT):
+    """
+    Median seconds per call for each filename.
+
+    :return: Filename to median seconds per call
+    :rtype: dict
+    """
+    timings = {}
+    for filename in filenames:
+        runs = timeit.repeat(lambda: extractor(filename), number=number, repeat=repeat)
+        timings[filename] = statistics.median(runs) / number
+    return timings
+
+
+def run_benchmark(filenames=BENCHMARK_FILENAMES, number=DEFAULT_NUMBER, repeat=DEFAULT_REPEAT):
+    """
+    Time the old and the new extractor on the same filenames.
+
+    :return: One row per filename with both timings in microseconds and the speedup
+    :rtype: list of dict
+    """
+    current = getattr(extract_dates, "__wrapped__", extract_dates)  # leave out the logger.catch wrapper
+    legacy = time_extractor(legacy_extract_dates, filenames, number, repeat)
+    new = time_extractor(current, filenames, number, repeat)
+    return [
+        {
+            "filename": filename,
+            "legacy_us": round(legacy[filename] * 1e6, 2),
+            "current_us": round(new[filename] * 1e6, 2),
+            "speedup": round(legacy[filename] / new[filename], 1),
+        }
+        for filename in filenames
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare extract_dates() with the extractor it replaced.")
+    parser.add_argument("--number", type=int, default=DEFAULT_NUMBER, help="calls per filename in one timing")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timings per filename")
+    args = parser.parse_args()
+    rows = run_benchmark(number=args.number, repeat=args.repeat)
+    width = max(len(row["filename"]) for row in rows)
+    for row in rows:
+        print(f"{row['filename']:<{width}}  {row['legacy_us']:>8.2f} us  {row['current_us']:>8.2f} us  {row['speedup']:>5.1f}x")
+    legacy_total = sum(row["legacy_us"] for row in rows)
+    current_total = sum(row["current_us"] for row in rows)
+    print(f"{'all filenames':<{width}}  {legacy_total:>8.2f} us  {current_total:>8.2f} us  {legacy_total / current_total:>5.1f}x")
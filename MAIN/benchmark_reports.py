@@ -0,0 +1,285 @@
+"""
+Benchmark each handler's parse and transform stage on synthetic reports.
+
+For every vendor format a report of the requested size is generated (see synthetic_reports.py) and the
+handler's processing function is timed on it under DryRunSinks, so nothing is printed, moved or stored.
+Generated reports are kept in the work directory and reused by later runs of the same size.
+
+Every run appends one line per case to benchmark_history.jsonl keyed by the git commit. A case is flagged
+as a regression when its median time is more than REGRESSION_TOLERANCE slower than the last run of the
+same case and size on a different commit. The exit code is 1 when anything regressed.
+
+Usage:
+    python benchmark_reports.py --rows 1000 100000 1000000
+    python benchmark_reports.py --cases kiosoft payrange --rows 10000000 --repeat 3
+"""
+
+from loguru import logger
+from pathlib import Path
+from datetime import datetime
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+import pandas as pd
+from generic_pipeline_sinks import DryRunSinks, use_sinks
+from synthetic_reports import generate_report, REPORT_DATE
+
+BENCHMARK_HISTORY_FILE = Path(__file__).parent / "benchmark_history.jsonl"
+BENCHMARK_WORK_DIRECTORY = Path(tempfile.gettempdir()) / "cfsiv_benchmarks"
+DEFAULT_ROWS = [1_000, 100_000]
+DEFAULT_REPEAT = 5
+REGRESSION_TOLERANCE = 0.20  # 20% slower than the previous commit is reported as a regression
+RUN_DATE = REPORT_DATE.isoformat()
+
+# case: handler module and its parse and transform stage, called once per generated file
+BENCHMARK_CASES = {
+    "pai_float": {
+        "handler": "Handler_PAI_float_report",
+        "stage": lambda module, path: module.process_floatReport_csv(path, RUN_DATE),
+    },
+    "monthly_revenue": {
+        "handler": "Handler_process_surcharge",
+        "stage": lambda module, path: module.process_monthly_surcharge_report(path, RUN_DATE),
+    },
+    "atm_commissions": {
+        "handler": "Handler_ATM_commissions",
+        "stage": lambda module, path: module.process_commission_report(path, RUN_DATE),
+    },
+    "kiosoft": {
+        "handler": "Handler_Kiosoft_revenue_detail_report",
+        "stage": lambda module, path: module.summarize_kiosoft_log(path),
+    },
+    "payrange": {
+        "handler": "Handler_PayRange",
+        "stage": lambda module, path: module.process_payrange_csv(path, module.COLUMNS_TO_KEEP, module.LOCATION_LABEL),
+    },
+    "touchtunes": {
+        "handler": "Handler_TouchTunes_Collection_details",
+        "stage": lambda module, path: module.create_output_dataframe_from(
+            module.aquire_revenue_data(path, module.find_report_dates(path.stem, hint=module.FILENAME_DATE_HINT),
+                                       module.ID_inside_filename(path))),
+    },
+    "wesbanco_qbo": {
+        "handler": "Handler_wesbanco_QBO_fix",
+        "stage": lambda module, path: module.clean_qbo_file(path),
+    },
+    "nayax_zip": {
+        "handler": "Handler_Nayax_zip_files",
+        "stage": lambda module, path: module.process_json(  # list and check every member, parse the tabular ones
+            module.get_data_from(path), [], path.with_suffix(module.OUTPUT_FILE_SUFFIX), module.stream_zip_members(path)),
+    },
+}
+
+
+def git_commit(directory=None):
+    """
+    Identify the code being measured.
+
+    :return: Short commit hash, with '+dirty' when tracked files have uncommitted changes, or 'unknown'
+    :rtype: str
+    """
+    directory = directory or Path(__file__).parent
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=directory,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        changes = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=directory,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}+dirty" if changes else commit
+
+
+@contextmanager
+def _working_directory(path):
+    """Handlers drop temp.json, temp.xlsx and caches in the current directory, keep them in the work directory."""
+    previous = Path.cwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def synthetic_files(case, rows, work_directory, seed=0):
+    """Generate the report for a case and size once, later runs reuse it."""
+    directory = Path(work_directory) / f"{case}_{rows}_{seed}"
+    done_marker = directory / ".complete"
+    if not done_marker.exists():
+        logger.info(f"Generating {rows} row synthetic report for {case}")
+        paths = generate_report(case, directory, rows, seed)
+        done_marker.write_text("\n".join(path.name for path in paths))
+    return [directory / name for name in done_marker.read_text().splitlines()]
+
+
+def time_case(case, rows, work_directory, repeat=DEFAULT_REPEAT):
+    """
+    Time one case at one size.
+
+    :param case: A key of BENCHMARK_CASES
+    :type case: str
+    :param rows: Rows in the synthetic report
+    :type rows: int
+    :param work_directory: Where reports are generated and the handler runs
+    :type work_directory: Path
+    :param repeat: Timed runs, the first run is not counted when repeat > 1
+    :type repeat: int
+    :return: Result record, 'status' is 'ok', 'skipped' when the handler can not be imported or 'failed'
+    :rtype: dict
+    """
+    record = {"case": case, "rows": rows, "repeat": repeat}
+    try:
+        module = importlib.import_module(BENCHMARK_CASES[case]["handler"])
+    except ImportError as e:
+        logger.warning(f"Skipping {case}: {e}")
+        return {**record, "status": "skipped", "reason": str(e)}
+    stage = BENCHMARK_CASES[case]["stage"]
+    paths = synthetic_files(case, rows, work_directory)
+    timings = []
+    with _working_directory(work_directory), use_sinks(DryRunSinks()):
+        for run in range(repeat + (1 if repeat > 1 else 0)):  # one warm up run fills caches and page cache
+            started = time.perf_counter()
+            for path in paths:
+                result = stage(module, path)
+                if result is None or (isinstance(result, pd.DataFrame) and result.empty):
+                    return {**record, "status": "failed", "reason": f"{case} stage returned nothing for {path.name}"}
+            timings.append(time.perf_counter() - started)
+    timings = timings[1:] if repeat > 1 else timings
+    median = statistics.median(timings)
+    return {
+        **record,
+        "status": "ok",
+        "files": len(paths),
+        "median_seconds": round(median, 6),
+        "min_seconds": round(min(timings), 6),
+        "rows_per_second": round(rows / median) if median else None,
+    }
+
+
+def load_history(history_file=BENCHMARK_HISTORY_FILE):
+    """
+    :return: Earlier results, oldest first
+    :rtype: list of dict
+    """
+    history_file = Path(history_file)
+    if not history_file.exists():
+        return []
+    with history_file.open() as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_regressions(results, history, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compare results with the latest earlier run of each case and size on a different commit.
+
+    :param results: Records from time_case(), each with a 'commit'
+    :type results: list of dict
+    :param history: Records from load_history()
+    :type history: list of dict
+    :param tolerance: Allowed slow down as a fraction
+    :type tolerance: float
+    :return: The results, each with 'baseline_commit', 'ratio' and 'regression' added when a baseline exists
+    :rtype: list of dict
+    """
+    for result in results:
+        if result["status"] != "ok":
+            continue
+        baseline = next((
+            old for old in reversed(history)
+            if old.get("status") == "ok" and old["case"] == result["case"] and old["rows"] == result["rows"]
+            and old["commit"] != result["commit"]
+        ), None)
+        if baseline is None:
+            continue
+        ratio = result["median_seconds"] / baseline["median_seconds"] if baseline["median_seconds"] else 1.0
+        result["baseline_commit"] = baseline["commit"]
+        result["ratio"] = round(ratio, 3)
+        result["regression"] = ratio > 1 + tolerance
+    return results
+
+
+def append_history(results, history_file=BENCHMARK_HISTORY_FILE):
+    with Path(history_file).open("a") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+
+def format_results(results):
+    """One line per case, regressions are marked with '!!'."""
+    lines = [f"{'case':<18}{'rows':>10}{'median s':>12}{'rows/s':>12}{'vs':>16}"]
+    for result in results:
+        if result["status"] != "ok":
+            lines.append(f"{result['case']:<18}{result['rows']:>10}  {result['status']}: {result.get('reason', '')}")
+            continue
+        versus = f"{result['ratio']:.2f}x {result['baseline_commit']}" if "ratio" in result else "-"
+        flag = "  !!" if result.get("regression") else ""
+        lines.append(f"{result['case']:<18}{result['rows']:>10}{result['median_seconds']:>12.4f}"
+                     f"{result['rows_per_second'] or 0:>12}{versus:>16}{flag}")
+    return "\n".join(lines)
+
+
+@logger.catch(reraise=True)
+def run_benchmarks(cases=None, rows_list=None, repeat=DEFAULT_REPEAT, work_directory=BENCHMARK_WORK_DIRECTORY,
+                   history_file=BENCHMARK_HISTORY_FILE, record=True, tolerance=REGRESSION_TOLERANCE):
+    """
+    Time every case at every size, compare with history and optionally record the results.
+
+    :param cases: Keys of BENCHMARK_CASES, all cases when not given
+    :type cases: list of str or None
+    :param rows_list: Report sizes, DEFAULT_ROWS when not given
+    :type rows_list: list of int or None
+    :param repeat: Timed runs per case and size
+    :type repeat: int
+    :param work_directory: Where reports are generated and kept
+    :type work_directory: Path
+    :param history_file: JSON lines file of earlier results
+    :type history_file: Path
+    :param record: Append these results to the history file
+    :type record: bool
+    :param tolerance: Allowed slow down before a result is a regression
+    :type tolerance: float
+    :return: Result records
+    :rtype: list of dict
+    """
+    work_directory = Path(work_directory).resolve()
+    work_directory.mkdir(parents=True, exist_ok=True)
+    environment = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.node(),
+    }
+    results = [
+        {**environment, **time_case(case, rows, work_directory, repeat)}
+        for case in (cases or BENCHMARK_CASES)
+        for rows in (rows_list or DEFAULT_ROWS)
+    ]
+    find_regressions(results, load_history(history_file), tolerance)
+    if record:
+        append_history(results, history_file)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark handler parse and transform stages on synthetic reports.")
+    parser.add_argument("--cases", nargs="+", choices=sorted(BENCHMARK_CASES), help="Cases to run, default all")
+    parser.add_argument("--rows", nargs="+", type=int, default=DEFAULT_ROWS, help="Report sizes, 1000 to 10000000")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Timed runs per case and size")
+    parser.add_argument("--work-dir", default=str(BENCHMARK_WORK_DIRECTORY), help="Where synthetic reports are kept")
+    parser.add_argument("--history", default=str(BENCHMARK_HISTORY_FILE), help="JSON lines file of earlier results")
+    parser.add_argument("--no-record", action="store_true", help="Compare with history without appending to it")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")  # handler debug logging would dominate the timings
+    results = run_benchmarks(args.cases, args.rows, args.repeat, args.work_dir, args.history, not args.no_record)
+    print(format_results(results))
+    sys.exit(1 if any(result.get("regression") for result in results) else 0)
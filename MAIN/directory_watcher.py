@@ -3,10 +3,14 @@ from pathlib import Path
 from loguru import logger
 import time
 import sys
+import queue
+import importlib
 from datetime import datetime
 from generic_pathlib_file_methods import move_file_with_check
+from generic_file_hash_functions import hash_file, ProcessedHashIndex, DOWNLOAD_HASH_INDEX_FILE
  
 ARCHIVE_FOLDER = Path("D:/Users/Conrad/Downloads/Archive_misc/")  # for files that are ignored
+DUPLICATES_FOLDER = ARCHIVE_FOLDER / "duplicates"  # re-sent reports whose contents were already processed
 
 logger.catch()
 def get_first_new_file(directory_to_watch, pickle_file, ignore_SUFFIXs=None):
@@ -104,7 +108,101 @@ def get_first_new_file(directory_to_watch, pickle_file, ignore_SUFFIXs=None):
 
 
 @logger.catch()
-def monitor_download_directory(directory_to_watch, file_processor, delay=1):
+def dispatch_new_file(new_file, file_processor, hash_index, content_hash=None):
+    """
+    Send a new file to its handler unless identical contents were already processed.
+    Duplicates are moved straight to the duplicates archive, costing one hash instead of a handler run and a print job.
+
+    :param new_file: The file found in the watched directory
+    :type new_file: Path
+    :param file_processor: Object responsible for processing new files
+    :type file_processor: object
+    :param hash_index: Index of content hashes that were processed successfully
+    :type hash_index: ProcessedHashIndex
+    :param content_hash: hash_file() digest when the caller already has it, the email fetcher hashes while saving
+    :type content_hash: str or None
+    :return: True if the file was processed, False if it was a duplicate or processing failed
+    :rtype: bool
+    """
+    # Hash before dispatching, handlers usually move or rename the file
+    content_hash = content_hash or hash_file(new_file)
+    file_size = new_file.stat().st_size
+    original = hash_index.lookup(content_hash)
+    if original:
+        logger.info(f"'{new_file.name}' has the same contents as '{original[0]}' processed {original[1]}, archiving as duplicate.")
+        duplicate_path = give_file_unique_name(DUPLICATES_FOLDER / new_file.name)
+        move_file_with_check(new_file, duplicate_path)
+        return False
+
+    logger.debug(f'File found to attempt processing {new_file}')
+    # Send this filename to be matched to a 'handler'
+    if file_processor.process(new_file):
+        # only successful runs are remembered so a failed file can be dropped in again
+        hash_index.record(content_hash, new_file.name, file_size)
+        return True
+    return False
+
+
+def give_file_unique_name(file_path):
+    """
+    Append a counter to the filename until it does not collide with an existing file.
+
+    :param file_path: The preferred path
+    :type file_path: Path
+    :return: file_path or a variation of it that does not exist yet
+    :rtype: Path
+    """
+    candidate = file_path
+    count = 1
+    while candidate.exists():
+        candidate = file_path.with_name(f"{file_path.stem}({count}){file_path.suffix}")
+        count += 1
+    return candidate
+
+
+def wait_for_handoff(handoff_queue, delay):
+    """
+    Pause between directory checks, returning early when the email fetcher hands over a saved attachment.
+
+    :param handoff_queue: Queue of (path, content_hash) put by EmailFetcher, or (path, content_hash, handler) for
+        attachments an email rule routed to a handler, None to just sleep
+    :type handoff_queue: queue.Queue or None
+    :param delay: Longest pause in seconds
+    :type delay: float
+    :return: The handed over tuple, None when the delay passed
+    :rtype: tuple or None
+    """
+    loop = delay
+    while loop > 0:  # Set the pace for how often to look for new files.
+        if handoff_queue is None:
+            time.sleep(0.1)  # Don't block processing of other code for more than 1 tenth of a second
+        else:
+            try:
+                return handoff_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        loop -= 0.1
+    return None
+
+
+class NamedHandler:
+    """
+    A file_processor that sends every file to one handler, for attachments an email rule routed to it.
+
+    :param handler: Module name of the handler
+    :type handler: str
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def process(self, file_path):
+        logger.info(f"Routing {Path(file_path).name} to {self.handler} as an email rule asked")
+        return bool(importlib.import_module(self.handler).data_handler_process(Path(file_path)))
+
+
+@logger.catch()
+def monitor_download_directory(directory_to_watch, file_processor, delay=1, handoff_queue=None):
     """
     Monitors the specified directory for new files, processes them using the provided file_processor,
     and logs the progress. Ignores certain file types.
@@ -115,6 +213,10 @@ def monitor_download_directory(directory_to_watch, file_processor, delay=1):
     :type file_processor: object
     :param delay: Time delay between checks for new files, in seconds, defaults to 1
     :type delay: int, optional
+    :param handoff_queue: Attachments saved by EmailFetcher(handoff_queue=...) are processed from here as soon as
+        they are saved. The fetcher stages them in a subfolder, which the directory check does not look into, so
+        each is dispatched once. Handlers still only run on this thread.
+    :type handoff_queue: queue.Queue or None
     :return: True when the monitoring loop exits
     :rtype: bool
     """
@@ -138,6 +240,7 @@ def monitor_download_directory(directory_to_watch, file_processor, delay=1):
         return count
     
     logger.info(f"Starting directory watcher on {directory_to_watch}")
+    hash_index = ProcessedHashIndex(DOWNLOAD_HASH_INDEX_FILE)
     loops = 0
     try:
         while True:
@@ -152,18 +255,21 @@ def monitor_download_directory(directory_to_watch, file_processor, delay=1):
                     new_file_path = Path(ARCHIVE_FOLDER) / new_file.stem
                     logger.debug(f"New destination: {new_file_path=}")
                     move_file_with_check(new_file, new_file_path)                    
-                else:                    
-                    logger.debug(f'File found to attempt processing {new_file}')
-                    # Send this filename to be matched to a 'handler'
-                    file_processor.process(directory_to_watch / new_file)
-            loop = delay
-            while loop > 0:  # Set the pace for how often to look for new files.
-                time.sleep(0.1)  # Don't block processing of other code for more than 1 tenth of a second
-                loop -= 0.1
+                else:
+                    dispatch_new_file(Path(directory_to_watch) / new_file, file_processor, hash_index)
+            handed_off = wait_for_handoff(handoff_queue, delay)
+            if handed_off:
+                handed_off_file, content_hash, *handler = handed_off
+                if Path(handed_off_file).exists():  # a directory check may have processed it already
+                    logger.info(f"Attachment handed over by the email fetcher: {Path(handed_off_file).name}")
+                    processor = NamedHandler(handler[0]) if handler else file_processor
+                    dispatch_new_file(Path(handed_off_file), processor, hash_index, content_hash)
 
     except KeyboardInterrupt:
         logger.info(f"Keyboard interrupt detected.")
         logger.info("Directory watcher stopped")
+    finally:
+        hash_index.close()
     return True
 
 
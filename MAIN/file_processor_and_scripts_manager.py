@@ -48,6 +48,8 @@ class ScriptManager:
                         self.scripts[script_name] = {
                             "declaration": module.declaration,
                             "process": module.data_handler_process,
+                            # optional side effect free parser used to fill the revenue history store
+                            "history": getattr(module, "extract_history_rows", None),
                         }
                         logger.info(f"Loaded script: {script_name}")
                     else:
@@ -87,6 +89,20 @@ class ScriptManager:
         logger.warning(f"No matching script found for file: {filename}")
         return None
 
+    def get_script_name_for_file(self, filename):
+        """
+        Same matching as get_script_for_file() but returns the handler's module name.
+
+        :param filename: Name of the file to match
+        :type filename: str
+        :return: Name of the matching handler module, None if no handler matches
+        :rtype: str or None
+        """
+        for script_name, script in self.scripts.items():
+            if script["declaration"].matches(filename):
+                return script_name
+        return None
+
 
 class FileProcessor:
     """
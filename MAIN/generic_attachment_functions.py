@@ -0,0 +1,185 @@
+"""
+Write email attachments to disk without holding them in memory.
+
+An attachment arrives as a stream of chunks in its Content-Transfer-Encoding. AttachmentWriter decodes
+base64 and quoted-printable chunk by chunk into a hidden '.part' file next to the destination, hashes the
+decoded bytes as they are written and renames the finished file into place. The directory watcher ignores
+'.part' files, so it only ever sees complete attachments.
+
+    with AttachmentWriter(download_dir / "statement.pdf", "base64") as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+    writer.content_hash  # same digest as generic_file_hash_functions.hash_file()
+"""
+
+from loguru import logger
+from pathlib import Path
+import base64
+import binascii
+import hashlib
+import os
+import quopri
+import tempfile
+from generic_file_hash_functions import HASH_DIGEST_SIZE
+
+ATTACHMENT_CHUNK_SIZE = 1024 * 1024  # encoded bytes requested or written per step
+ATTACHMENT_MAX_BYTES = 100 * 1024 * 1024  # decoded attachments larger than this are not saved
+PARTIAL_SUFFIX = ".part"  # in the directory watcher's ignore list
+
+
+class AttachmentTooLarge(ValueError):
+    """The decoded attachment went over the writer's max_bytes."""
+
+
+class _IdentityDecoder:
+    """7bit, 8bit and binary parts, and payloads that are already decoded."""
+
+    def decode(self, chunk):
+        return bytes(chunk)
+
+    def flush(self):
+        return b""
+
+
+class _Base64Decoder:
+    """Decodes complete 4 character groups and carries the rest over to the next chunk."""
+
+    def __init__(self):
+        self._pending = b""
+
+    def decode(self, chunk):
+        data = self._pending + bytes(chunk).translate(None, b" \t\r\n")
+        complete = len(data) - len(data) % 4
+        self._pending = data[complete:]
+        return base64.b64decode(data[:complete])
+
+    def flush(self):
+        pending, self._pending = self._pending, b""
+        if not pending:
+            return b""
+        try:
+            return base64.b64decode(pending + b"=" * (-len(pending) % 4))
+        except binascii.Error:
+            logger.warning(f"Dropped {len(pending)} trailing characters of a malformed base64 attachment")
+            return b""
+
+
+class _QuotedPrintableDecoder:
+    """Decodes complete lines, so '=' escapes and soft line breaks are never split between chunks."""
+
+    def __init__(self):
+        self._pending = b""
+
+    def decode(self, chunk):
+        data = self._pending + bytes(chunk)
+        end = data.rfind(b"\n") + 1
+        self._pending = data[end:]
+        return quopri.decodestring(data[:end])
+
+    def flush(self):
+        pending, self._pending = self._pending, b""
+        return quopri.decodestring(pending)
+
+
+_DECODERS = {
+    "base64": _Base64Decoder,
+    "quoted-printable": _QuotedPrintableDecoder,
+}
+
+
+class AttachmentWriter:
+    """
+    Decode an attachment into a temporary file and move it into place when it is complete.
+    Used as a context manager the file is committed when the block finishes and removed when it raises.
+
+    :param destination: Final path of the attachment
+    :type destination: str or Path
+    :param encoding: Content-Transfer-Encoding of the chunks, None when they are already decoded
+    :type encoding: str or None
+    :param max_bytes: Largest decoded size accepted, None for no limit
+    :type max_bytes: int or None
+    """
+
+    def __init__(self, destination, encoding=None, max_bytes=ATTACHMENT_MAX_BYTES):
+        self.destination = Path(destination)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._digest = hashlib.blake2b(digest_size=HASH_DIGEST_SIZE)
+        self._decoder = _DECODERS.get((encoding or "").lower(), _IdentityDecoder)()
+        self.destination.parent.mkdir(parents=True, exist_ok=True)
+        descriptor, name = tempfile.mkstemp(prefix=f".{self.destination.name[:40]}.", suffix=PARTIAL_SUFFIX,
+                                            dir=self.destination.parent)
+        self.temporary = Path(name)
+        self._file = os.fdopen(descriptor, "wb")
+
+    @property
+    def content_hash(self):
+        """Hex digest of the decoded bytes written so far."""
+        return self._digest.hexdigest()
+
+    def write(self, chunk):
+        """
+        Decode and write one chunk.
+
+        :param chunk: Encoded bytes
+        :type chunk: bytes
+        :raises AttachmentTooLarge: when the decoded size goes over max_bytes
+        """
+        self._write(self._decoder.decode(chunk))
+
+    def _write(self, data):
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise AttachmentTooLarge(f"{self.destination.name} is larger than {self.max_bytes} bytes")
+        self._digest.update(data)
+        self._file.write(data)
+
+    def commit(self):
+        """
+        Write what the decoder still holds and rename the file to its destination.
+
+        :return: The destination
+        :rtype: Path
+        """
+        self._write(self._decoder.flush())
+        self._file.close()
+        os.replace(self.temporary, self.destination)
+        logger.debug(f"Saved {self.size} bytes to {self.destination} (hash {self.content_hash[:12]})")
+        return self.destination
+
+    def abort(self):
+        """Throw away the partial file."""
+        self._file.close()
+        self.temporary.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+
+def write_attachment(chunks, destination, encoding=None, max_bytes=ATTACHMENT_MAX_BYTES):
+    """
+    Stream an attachment to disk.
+
+    :param chunks: Encoded attachment in pieces
+    :type chunks: iterable of bytes
+    :param destination: Final path of the attachment
+    :type destination: str or Path
+    :param encoding: Content-Transfer-Encoding of the chunks, None when they are already decoded
+    :type encoding: str or None
+    :param max_bytes: Largest decoded size accepted, None for no limit
+    :type max_bytes: int or None
+    :return: The finished writer with destination, size and content_hash
+    :rtype: AttachmentWriter
+    :raises AttachmentTooLarge: when the attachment is too large, nothing is left on disk
+    """
+    with AttachmentWriter(destination, encoding, max_bytes) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+    return writer
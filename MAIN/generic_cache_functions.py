@@ -0,0 +1,164 @@
+"""
+Defines a persistent cache used to avoid repeating expensive string clean-up work between runs.
+
+Values are kept in an in-memory LRU for the current run and in a SQLite table on disk for later runs.
+Every entry is stored under a 'ruleset' hash so that changing the rules that produced a value
+automatically invalidates everything that was computed with the old rules.
+"""
+
+from loguru import logger
+from pathlib import Path
+from collections import OrderedDict
+import hashlib
+import json
+import sqlite3
+
+
+@logger.catch()
+def ruleset_hash(*rules) -> str:
+    """
+    Build a short stable fingerprint of the rules used to compute cached values.
+
+    :param rules: Any JSON serializable objects (lists of patterns, replacement tables, version numbers...)
+    :return: Hex digest that changes whenever any of the rules change.
+    :rtype: str
+    """
+    payload = json.dumps(rules, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class PersistentLRUCache:
+    """
+    String to string cache backed by SQLite with an in-memory LRU in front of it.
+
+    :param database: Path to the SQLite file. It is created if it does not exist.
+    :type database: str or Path
+    :param table: Name of the table holding this cache.
+    :type table: str
+    :param ruleset: Fingerprint of the rules used to compute the values, see ruleset_hash().
+    :type ruleset: str
+    :param maxsize: Maximum number of entries held in memory.
+    :type maxsize: int
+    """
+
+    def __init__(self, database, table, ruleset, maxsize=4096):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid cache table name: {table}")
+        self.database = Path(database)
+        self.table = table
+        self.ruleset = ruleset
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._pending = {}  # values computed this run that are not yet written to disk
+
+        self.database.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(self.database), timeout=30)
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "ruleset TEXT NOT NULL, raw TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (ruleset, raw))"
+        )
+        # anything computed with a different set of rules is stale
+        removed = self._connection.execute(
+            f"DELETE FROM {self.table} WHERE ruleset != ?", (self.ruleset,)
+        ).rowcount
+        self._connection.commit()
+        if removed:
+            logger.info(f"Rules changed, {removed} stale entries removed from cache '{self.table}'.")
+        logger.debug(f"Cache '{self.table}' opened at {self.database} for ruleset {self.ruleset}")
+
+    def _remember(self, key, value):
+        """Place a value in the in-memory LRU, evicting the oldest entry when full."""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        Look up a value, first in memory then on disk.
+
+        :param key: The raw string the value was computed from.
+        :type key: str
+        :return: The cached value or None if it is not known.
+        :rtype: str or None
+        """
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return self._memory[key]
+        if key in self._pending:  # computed this run, evicted from memory before the next flush
+            self.hits += 1
+            self._remember(key, self._pending[key])
+            return self._pending[key]
+        row = self._connection.execute(
+            f"SELECT value FROM {self.table} WHERE ruleset = ? AND raw = ?",
+            (self.ruleset, key),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, row[0])
+        return row[0]
+
+    def put(self, key, value):
+        """
+        Store a value. Disk writes are batched until flush() is called.
+
+        :param key: The raw string the value was computed from.
+        :type key: str
+        :param value: The computed value.
+        :type value: str
+        """
+        self._remember(key, value)
+        self._pending[key] = value
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached value for key, calling compute(key) only when it is not cached.
+        A compute that returns None (for example one that logged an error) is not cached.
+
+        :param key: The raw string the value is computed from.
+        :type key: str
+        :param compute: Function that produces the value from the key.
+        :type compute: callable
+        :return: The cached or freshly computed value.
+        :rtype: str or None
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute(key)
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def take_pending(self):
+        """
+        Hand over the values computed since the last flush instead of writing them, so a worker
+        process can pass them to the one process that writes the cache.
+
+        :return: Raw string to value
+        :rtype: dict
+        """
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def flush(self):
+        """Write any values computed since the last flush to disk."""
+        if not self._pending:
+            return
+        self._connection.executemany(
+            f"INSERT OR REPLACE INTO {self.table} (ruleset, raw, value) VALUES (?, ?, ?)",
+            [(self.ruleset, key, value) for key, value in self._pending.items()],
+        )
+        self._connection.commit()
+        logger.debug(f"Cache '{self.table}' saved {len(self._pending)} new entries. hits={self.hits} misses={self.misses}")
+        self._pending.clear()
+
+    def close(self):
+        """Flush outstanding values and close the database."""
+        self.flush()
+        self._connection.close()
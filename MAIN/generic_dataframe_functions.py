@@ -6,9 +6,18 @@ Defines common functions for working with dataframes used throughout my code
 from loguru import logger
 import pandas as pd
 import json
+import re
+import importlib.util
+from decimal import Decimal, InvalidOperation
 from pathlib import Path
 from generic_excel_functions import convert_dataframe_to_excel_with_formatting_and_save
 from generic_pathlib_file_methods import move_file_with_check
+from generic_pipeline_sinks import get_sinks
+
+MONEY_JUNK = r"[\s$,()\-]"  # everything removed from a money string before it is converted
+MONEY_JUNK_RE = re.compile(MONEY_JUNK)
+# pyarrow parses CSV files multi-threaded, fall back to the C parser when it is not installed
+CSV_ENGINE = "pyarrow" if importlib.util.find_spec("pyarrow") else "c"
 
 @logger.catch()
 def load_json_to_dataframe(file_path):
@@ -137,6 +146,118 @@ def load_csv_with_optional_headers_to_dataframe(in_f: str, headers="") -> pd.Dat
 
     return df
 
+def schema_read_options(schema, **read_csv_kwargs):
+    """
+    Translate a handler's CSV schema into pd.read_csv() keyword arguments.
+
+    A schema is a dict declared next to the handler that reads the file:
+        "columns": {name: dtype} of the only columns to read, in any order
+        "names": optional list of column names for files without a header row
+        "money": columns holding currency text, read as strings then converted by parse_money_columns()
+        "dates": columns converted with pd.to_datetime() after reading, "date_format" is optional
+        "strip": text columns whose surrounding whitespace is removed
+        "rename": {name: new_name} applied last
+
+    :param schema: The handler's schema declaration
+    :type schema: dict
+    :param read_csv_kwargs: Extra arguments for read_csv, they win over the schema
+    :return: Keyword arguments for pd.read_csv
+    :rtype: dict
+    """
+    money = set(schema.get("money", []))
+    options = {
+        "usecols": list(schema["columns"]),
+        "dtype": {col: ("string" if col in money else dtype) for col, dtype in schema["columns"].items()},
+        "engine": CSV_ENGINE,
+    }
+    if schema.get("names"):
+        options.update(header=None, names=schema["names"])
+    options.update(read_csv_kwargs)
+    if "chunksize" in options or "converters" in options:
+        options["engine"] = "c"  # not supported by the pyarrow engine
+    return options
+
+
+def apply_schema_conversions(df, schema):
+    """
+    Finish a frame read with schema_read_options(): strip, money, dates then renames.
+
+    :param df: Frame or chunk just read from the file
+    :type df: pd.DataFrame
+    :param schema: The handler's schema declaration
+    :type schema: dict
+    :return: The converted frame
+    :rtype: pd.DataFrame
+    """
+    for col in schema.get("strip", []):
+        df[col] = df[col].str.strip()
+    if schema.get("money"):
+        parse_money_columns(df, schema["money"])
+    for col in schema.get("dates", []):
+        df[col] = pd.to_datetime(df[col], format=schema.get("date_format"), errors="coerce")
+    if schema.get("rename"):
+        df = df.rename(columns=schema["rename"])
+    return df
+
+
+def check_schema_columns(in_f, schema):
+    """
+    Read just the header row and make sure every declared column is there.
+
+    :raises KeyError: If the file does not contain every declared column
+    """
+    if schema.get("names"):
+        return  # no header row to check
+    header = pd.read_csv(in_f, nrows=0).columns
+    missing = [col for col in schema["columns"] if col not in header]
+    if missing:
+        raise KeyError(f"{Path(in_f).name} is missing columns: {missing}")
+
+
+@logger.catch(reraise=True)
+def load_csv_with_schema(in_f, schema, **read_csv_kwargs):
+    """
+    Load only the columns a handler declares, with their dtypes pushed down into read_csv.
+    Columns that are not declared are never parsed or allocated.
+
+    :param in_f: Path to the CSV file
+    :type in_f: str or Path
+    :param schema: The handler's schema declaration, see schema_read_options()
+    :type schema: dict
+    :param read_csv_kwargs: Extra arguments for read_csv
+    :return: The loaded frame
+    :rtype: pd.DataFrame
+    :raises KeyError: If the file does not contain every declared column
+    """
+    check_schema_columns(in_f, schema)
+    options = schema_read_options(schema, **read_csv_kwargs)
+    logger.debug(f"Reading {len(options['usecols'])} declared columns from {in_f} using the {options['engine']} engine")
+    df = pd.read_csv(in_f, **options)
+    df = apply_schema_conversions(df, schema)
+    logger.debug(f"file imported into dataframe with {len(df)} rows.")
+    return df
+
+def iter_csv_with_schema(in_f, schema, chunksize, **read_csv_kwargs):
+    """
+    Same as load_csv_with_schema() but yields the file in chunks of rows so memory stays flat.
+
+    :param in_f: Path to the CSV file
+    :type in_f: str or Path
+    :param schema: The handler's schema declaration, see schema_read_options()
+    :type schema: dict
+    :param chunksize: Number of rows per chunk
+    :type chunksize: int
+    :return: Converted chunks
+    :rtype: Iterator[pd.DataFrame]
+    :raises KeyError: If the file does not contain every declared column
+    """
+    check_schema_columns(in_f, schema)
+    options = schema_read_options(schema, chunksize=chunksize, **read_csv_kwargs)
+    logger.debug(f"Streaming {len(options['usecols'])} declared columns from {in_f} in chunks of {chunksize} rows")
+    with pd.read_csv(in_f, **options) as reader:
+        for chunk in reader:
+            yield apply_schema_conversions(chunk, schema)
+
 @logger.catch()
 def verify_dataframe_contains(df, list):
     """
@@ -186,6 +307,123 @@ def de_duplicate_header_names(df):
     logger.debug(f"{new_columns=}")
     return df
 
+def _money_text_to_numbers(text, as_decimal, errors):
+    """
+    Convert a Series of money strings. Negatives are '(12.50)', '-12.50' or '$-12.50'. Blanks become NaN.
+    """
+    text = text.astype("string").str.strip()
+    negative = text.str.contains("-", regex=False) | (text.str.startswith("(") & text.str.endswith(")"))
+    negative = negative.fillna(False).astype(bool)
+    digits = text.str.replace(MONEY_JUNK, "", regex=True).replace("", pd.NA)
+    if not as_decimal:
+        amounts = pd.to_numeric(digits, errors=errors).astype("float64")
+        return amounts.where(~negative, -amounts)
+
+    amounts = []
+    for value, is_negative in zip(digits.tolist(), negative.tolist()):
+        try:
+            amount = Decimal(value)
+        except (InvalidOperation, TypeError):
+            if errors == "raise" and not pd.isna(value):
+                raise ValueError(f"Unable to parse money value '{value}'")
+            amounts.append(None)
+            continue
+        amounts.append(-amount if is_negative else amount)
+    return pd.Series(amounts, index=text.index, dtype=object)
+
+
+@logger.catch(reraise=True)
+def parse_money_series(series, as_decimal=False, errors="coerce"):
+    """
+    Vectorized conversion of currency text such as '$1,234.50', '(12.50)', '-$3' or '' to numbers.
+
+    :param series: Column holding money values as text or numbers
+    :type series: pd.Series
+    :param as_decimal: Return Decimal objects instead of float64
+    :type as_decimal: bool
+    :param errors: 'coerce' turns unparsable values into NaN, 'raise' raises ValueError
+    :type errors: str
+    :return: The converted column with the same index
+    :rtype: pd.Series
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series.map(lambda v: None if pd.isna(v) else Decimal(str(v))) if as_decimal else series.astype("float64")
+    return _money_text_to_numbers(series, as_decimal, errors)
+
+
+@logger.catch(reraise=True)
+def parse_money_columns(df, columns, as_decimal=False, errors="coerce"):
+    """
+    Convert all the declared money columns of a frame in one pass.
+    The text columns are stacked into a single Series so the clean up runs once per frame, not once per column.
+
+    :param df: Frame to modify in place
+    :type df: pd.DataFrame
+    :param columns: Names of the money columns
+    :type columns: list of str
+    :param as_decimal: Return Decimal objects instead of float64
+    :type as_decimal: bool
+    :param errors: 'coerce' turns unparsable values into NaN, 'raise' raises ValueError
+    :type errors: str
+    :return: The same frame, for chaining
+    :rtype: pd.DataFrame
+    :raises KeyError: If one of the columns does not exist
+    """
+    missing = [col for col in columns if col not in df.columns]
+    if missing:
+        raise KeyError(f"Money columns not found: {missing}")
+
+    text_columns = []
+    for col in columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = parse_money_series(df[col], as_decimal, errors)
+        else:
+            text_columns.append(col)
+    if text_columns:
+        stacked = pd.concat([df[col] for col in text_columns], ignore_index=True)
+        parsed = _money_text_to_numbers(stacked, as_decimal, errors).to_numpy()
+        rows = len(df)
+        for position, col in enumerate(text_columns):
+            df[col] = parsed[position * rows:(position + 1) * rows]
+    return df
+
+
+def money_converter(value, as_decimal=False):
+    """
+    Scalar version of parse_money_series() for use as a read_csv converters hook.
+
+    :param value: One cell as read from the file
+    :type value: str
+    :return: The amount, or NaN (None for Decimal) when the cell is blank or unparsable
+    :rtype: float or Decimal
+    """
+    text = str(value).strip()
+    digits = MONEY_JUNK_RE.sub("", text)
+    try:
+        amount = Decimal(digits) if as_decimal else float(digits)
+    except (InvalidOperation, ValueError):
+        return None if as_decimal else float("nan")
+    if "-" in text or (text.startswith("(") and text.endswith(")")):
+        amount = -amount
+    return amount
+
+
+def money_converters(columns, as_decimal=False):
+    """
+    Build a converters mapping for pd.read_csv so money columns are parsed while the file is read.
+
+    :param columns: Names of the money columns
+    :type columns: list of str
+    :param as_decimal: Produce Decimal objects instead of floats
+    :type as_decimal: bool
+    :return: {column: converter}
+    :rtype: dict
+    """
+    if as_decimal:
+        return {col: lambda value: money_converter(value, as_decimal=True) for col in columns}
+    return {col: money_converter for col in columns}
+
+
 @logger.catch()
 def save_dataframe_as_csv_and_print(outfile: Path, frame, input_filename: Path) -> bool:
     """
@@ -236,6 +474,8 @@ def send_dataframe_to_file_as_csv(outfile: Path, frame):
         None
     """
     # logger.debug(f'{frame=}')
+    if not get_sinks().output(outfile, frame):
+        return
     frame.to_csv(outfile, index=False)
     # TODO display contents of 'outfile' to debug logging
     logger.debug(f"Dataframe saved to {outfile}")
@@ -0,0 +1,277 @@
+"""
+Download the report links that arrive by email.
+
+One DownloadManager keeps a pooled requests Session, so repeated downloads from a vendor reuse their
+connection. Failed connections and 429/5xx responses are retried with backoff. A download that breaks off
+is continued with an HTTP Range request from the bytes already on disk, guarded by If-Range with the
+ETag or Last-Modified of the response the bytes came from, so a resource that changed is fetched whole.
+Bytes are written to a hidden '.part' file named from a digest of the full URL, which the directory watcher
+ignores, and hashed while they arrive. The finished file is renamed into the watch folder in one step,
+under the Content-Disposition name when the server sends one and with a counter added when that name is taken.
+
+Every download reports its size, time to first byte, total time and throughput.
+
+    with DownloadManager(max_workers=4) as manager:
+        results = manager.download_all(urls, DOWNLOAD_DIRECTORY)
+    logger.info(summarize_downloads(results))
+"""
+
+from loguru import logger
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, unquote
+import hashlib
+import os
+import re
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from generic_attachment_functions import PARTIAL_SUFFIX
+from generic_file_hash_functions import HASH_DIGEST_SIZE, HASH_CHUNK_SIZE
+from generic_pathlib_file_methods import sanitize_filename
+from directory_watcher import give_file_unique_name
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # bytes read from the socket per step
+DOWNLOAD_TIMEOUT = (10, 60)  # seconds to connect, seconds between bytes
+DOWNLOAD_RETRIES = 3  # per download, for refused connections, 429/5xx answers and transfers that break off
+DOWNLOAD_BACKOFF = 0.5  # seconds, doubled for each retry
+DOWNLOAD_MAX_WORKERS = 4  # downloads running at the same time
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+_DESTINATION_LOCK = threading.Lock()  # parallel downloads of the same name must not pick the same free name
+_PARTIAL_LOCKS = {}  # partial path to the lock held while a download writes it
+
+
+class DownloadError(Exception):
+    """A download failed after its retries or its checksum did not match."""
+
+
+class DownloadResult:
+    """What one download produced and how long it took."""
+
+    __slots__ = ("url", "path", "size", "content_hash", "seconds", "first_byte_seconds", "resumed_from", "attempts")
+
+    def __init__(self, url, path, size, content_hash, seconds, first_byte_seconds, resumed_from=0, attempts=1):
+        self.url = url
+        self.path = path
+        self.size = size
+        self.content_hash = content_hash
+        self.seconds = seconds
+        self.first_byte_seconds = first_byte_seconds
+        self.resumed_from = resumed_from
+        self.attempts = attempts
+
+    @property
+    def bytes_per_second(self):
+        return (self.size - self.resumed_from) / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return (f"DownloadResult({self.path.name!r}, {self.size} bytes, {self.seconds:.3f}s, "
+                f"first byte {self.first_byte_seconds:.3f}s, {self.bytes_per_second / 1024:.0f} KiB/s)")
+
+
+def filename_for(url, response=None):
+    """The name from Content-Disposition, else the last part of the URL path."""
+    disposition = response.headers.get("Content-Disposition", "") if response is not None else ""
+    match = re.search(r"filename\*?=(?:UTF-8'')?\"?([^\";]+)\"?", disposition, re.IGNORECASE)
+    name = unquote(match.group(1)) if match else unquote(urlsplit(url).path.rsplit("/", 1)[-1])
+    return sanitize_filename(name) if name else "download"
+
+
+def partial_path_for(url, directory):
+    """
+    The hidden '.part' file a URL is downloaded into. The digest of the whole URL keeps links that differ only in
+    their query, such as /download?id=1 and /download?id=2, apart.
+    """
+    digest = hashlib.blake2b(url.encode(), digest_size=8).hexdigest()
+    return Path(directory) / f".{filename_for(url)[:40]}.{digest}{PARTIAL_SUFFIX}"
+
+
+def validator_path_for(partial):
+    """Where the If-Range validator of a partial is kept, it ends in '.part' too so the watcher ignores it."""
+    return partial.with_name(f"{partial.stem}.validator{PARTIAL_SUFFIX}")
+
+
+def resume_validator(response):
+    """The ETag, else the Last-Modified date, a later If-Range can send. Weak ETags are not allowed in If-Range."""
+    etag = response.headers.get("ETag", "")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified", "")
+
+
+def _partial_lock(partial):
+    with _DESTINATION_LOCK:
+        return _PARTIAL_LOCKS.setdefault(str(partial), threading.Lock())
+
+
+def _hash_existing(path):
+    digest = hashlib.blake2b(digest_size=HASH_DIGEST_SIZE)
+    with path.open("rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest
+
+
+class DownloadManager:
+    """
+    Pooled, retrying, resumable downloads.
+
+    :param max_workers: Downloads running at the same time in download_all(), also the connection pool size
+    :type max_workers: int
+    :param retries: Attempts after the first for each download
+    :type retries: int
+    :param timeout: Seconds to connect and seconds between bytes
+    :type timeout: tuple
+    :param chunk_size: Bytes read per step
+    :type chunk_size: int
+    :param session: A requests Session to use instead of a new one
+    :type session: requests.Session or None
+    """
+
+    def __init__(self, max_workers=DOWNLOAD_MAX_WORKERS, retries=DOWNLOAD_RETRIES, timeout=DOWNLOAD_TIMEOUT,
+                 chunk_size=DOWNLOAD_CHUNK_SIZE, backoff=DOWNLOAD_BACKOFF, session=None):
+        self.max_workers = max_workers
+        self.retries = retries
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.backoff = backoff
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=max_workers,
+            pool_maxsize=max_workers,
+            max_retries=Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                              allowed_methods=["GET"], raise_on_status=False),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def download(self, url, directory, filename=None, expected_hash=None):
+        """
+        Download one URL into a directory.
+
+        :param url: The link
+        :type url: str
+        :param directory: Where the finished file is placed
+        :type directory: str or Path
+        :param filename: Name for the file, taken from the response or the URL when not given. A name that is
+            taken gets a counter, an existing file is never replaced.
+        :type filename: str or None
+        :param expected_hash: hash_file() digest the download must have
+        :type expected_hash: str or None
+        :return: Path, size, hash and timings of the download
+        :rtype: DownloadResult
+        :raises DownloadError: when every attempt failed or the hash does not match
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        # named from the URL, not the response, so every attempt resumes from the same bytes
+        partial = partial_path_for(url, directory)
+        with _partial_lock(partial):  # two workers given the same URL must not append to one partial
+            return self._download(url, directory, partial, filename, expected_hash)
+
+    def _download(self, url, directory, partial, filename, expected_hash):
+        validator_file = validator_path_for(partial)
+        started = time.perf_counter()
+        first_byte_seconds = None
+        resumed_from = None
+        last_error = None
+        for attempt in range(1, self.retries + 2):
+            offset = partial.stat().st_size if partial.exists() else 0
+            validator = validator_file.read_text() if offset and validator_file.exists() else ""
+            # without a validator nothing shows the bytes on disk belong to this resource, so start over
+            headers = {"Range": f"bytes={offset}-", "If-Range": validator} if validator else {}
+            try:
+                with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code == 416:  # the partial file is not a prefix of this resource
+                        partial.unlink()
+                        validator_file.unlink(missing_ok=True)
+                        raise DownloadError(f"Range {offset}- not satisfiable, starting over")
+                    response.raise_for_status()
+                    if first_byte_seconds is None:
+                        first_byte_seconds = time.perf_counter() - started
+                    filename = filename or filename_for(url, response)
+                    if response.status_code != 206 or not validator:
+                        offset = 0  # the server sent the whole file, the resource changed or could not be checked
+                        if new_validator := resume_validator(response):
+                            validator_file.write_text(new_validator)
+                        else:
+                            validator_file.unlink(missing_ok=True)
+                    digest = _hash_existing(partial) if offset else hashlib.blake2b(digest_size=HASH_DIGEST_SIZE)
+                    if resumed_from is None:
+                        resumed_from = offset
+                    with partial.open("ab" if offset else "wb") as f:
+                        for chunk in response.iter_content(self.chunk_size):
+                            f.write(chunk)
+                            digest.update(chunk)
+                break
+            except requests.HTTPError as e:
+                raise DownloadError(f"Download of {url} failed: {e}") from e  # 429/5xx were already retried
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError, DownloadError) as e:
+                last_error = e
+                if attempt > self.retries:
+                    raise DownloadError(f"Download of {url} failed after {attempt} attempts: {e}") from e
+                wait = self.backoff * 2 ** (attempt - 1)
+                logger.warning(f"Download of {url} broke off ({e}), resuming in {wait}s")
+                time.sleep(wait)
+        validator_file.unlink(missing_ok=True)
+        content_hash = digest.hexdigest()
+        if expected_hash and content_hash != expected_hash:
+            partial.unlink(missing_ok=True)
+            raise DownloadError(f"Download of {url} has hash {content_hash}, expected {expected_hash}")
+        with _DESTINATION_LOCK:
+            destination = give_file_unique_name(directory / filename)
+            os.replace(partial, destination)
+        result = DownloadResult(url, destination, destination.stat().st_size, content_hash,
+                                time.perf_counter() - started, first_byte_seconds or 0.0, resumed_from or 0, attempt)
+        logger.info(f"Downloaded {result}" + (f" after {attempt} attempts ({last_error})" if attempt > 1 else ""))
+        return result
+
+    def download_all(self, urls, directory):
+        """
+        Download several URLs, max_workers at a time.
+
+        :return: A DownloadResult, or the DownloadError of a failed download, per URL in order
+        :rtype: list
+        """
+        def attempt(url):
+            try:
+                return self.download(url, directory)
+            except DownloadError as e:
+                logger.error(str(e))
+                return e
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="download") as pool:
+            return list(pool.map(attempt, urls))
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+
+def summarize_downloads(results):
+    """
+    Totals for a batch of downloads.
+
+    :param results: From download_all()
+    :type results: list
+    :return: Counts, bytes, mean time to first byte and overall throughput
+    :rtype: dict
+    """
+    done = [result for result in results if isinstance(result, DownloadResult)]
+    seconds = sum(result.seconds for result in done)
+    size = sum(result.size - result.resumed_from for result in done)
+    return {
+        "downloaded": len(done),
+        "failed": len(results) - len(done),
+        "bytes": size,
+        "mean_first_byte_seconds": round(sum(result.first_byte_seconds for result in done) / len(done), 4) if done else None,
+        "bytes_per_second": round(size / seconds) if seconds else None,
+    }
@@ -0,0 +1,299 @@
+"""
+Declarative routing of email to actions.
+
+Rules are loaded from EmailRoutingRules.json. Each rule has regular expressions for the sender, subject
+and body and a list of attachment types. Every condition a rule gives must match. The rule's action runs
+when it does:
+
+    download_link     download the URL captured by the rule's 'link' pattern into the download directory
+    save_attachment   save the matching attachments into the rule's 'directory'
+    route_to_handler  save the matching attachments and run the rule's 'handler' on each of them, or hand them
+                      to the directory watcher with the handler's name when a handoff queue is given
+
+Each pattern is searched on its own, so it may use any regular expression feature. Before that the longest
+literal every pattern requires is looked for in one pass over the field, through a single trie shaped
+alternation of all the literals. Only rules whose literal is present, and rules without one, are searched
+with their full pattern, so the work per message follows the rules it could match, not the number of rules.
+"""
+
+from loguru import logger
+from pathlib import Path
+import importlib
+import json
+import re
+from generic_attachment_functions import write_attachment, ATTACHMENT_CHUNK_SIZE
+from generic_pathlib_file_methods import sanitize_filename
+
+try:
+    from re import _parser as regex_parser  # Python 3.11 and later
+except ImportError:
+    import sre_parse as regex_parser
+
+EMAIL_ROUTING_RULES_FILE = Path(__file__).parent / "EmailRoutingRules.json"
+RULE_FIELDS = ("sender", "subject", "body", "attachment")
+RULE_ACTIONS = ("download_link", "save_attachment", "route_to_handler")
+DEFAULT_LINK_PATTERN = r"Download\s*<\s*(https?://[^\s>]+)\s*>"  # PayRange puts its report link after 'Download'
+RULE_FLAGS = re.IGNORECASE | re.DOTALL | re.MULTILINE
+
+
+class EmailRule:
+    """
+    One routing rule, see EmailRoutingRules.json for the keys.
+
+    :param name: Shown in the log when the rule fires
+    :type name: str
+    :param action: One of RULE_ACTIONS
+    :type action: str
+    """
+
+    __slots__ = ("name", "action", "patterns", "handler", "directory", "link")
+
+    def __init__(self, name, action, sender=None, subject=None, body=None, attachment_types=None, handler=None,
+                 directory=None, link=DEFAULT_LINK_PATTERN):
+        if action not in RULE_ACTIONS:
+            raise ValueError(f"Rule '{name}' has unknown action '{action}', expected one of {RULE_ACTIONS}")
+        if action == "route_to_handler" and not handler:
+            raise ValueError(f"Rule '{name}' routes to a handler but does not name one")
+        attachment = None
+        if attachment_types:
+            suffixes = "|".join(re.escape(str(suffix).lstrip(".")) for suffix in attachment_types)
+            attachment = rf"\.(?:{suffixes})$"  # matched against one attachment name per line
+        self.name = name
+        self.action = action
+        self.patterns = {field: pattern for field, pattern in zip(RULE_FIELDS, (sender, subject, body, attachment)) if pattern}
+        self.handler = handler
+        self.directory = directory
+        self.link = re.compile(link, RULE_FLAGS) if action == "download_link" else None
+        for field, pattern in self.patterns.items():
+            try:
+                re.compile(pattern, RULE_FLAGS)
+            except re.error as e:
+                raise ValueError(f"Rule '{name}' has an invalid {field} pattern: {e}") from e
+
+    def matching_attachments(self, attachment_names):
+        if "attachment" not in self.patterns:
+            return list(attachment_names)
+        pattern = re.compile(self.patterns["attachment"], RULE_FLAGS)
+        return [name for name in attachment_names if pattern.search(name)]
+
+    def __repr__(self):
+        return f"EmailRule({self.name!r}, {self.action!r}, {sorted(self.patterns)})"
+
+
+class SavedAttachment:
+    """An attachment the fetcher already saved, from the 'attachments' list it builds for each email."""
+
+    def __init__(self, filename, saved_to, content_hash=None):
+        self.filename = filename
+        self.path = Path(saved_to)
+        self.content_hash = content_hash
+        self.encoding = None
+
+    def chunks(self):
+        with self.path.open("rb") as f:
+            while chunk := f.read(ATTACHMENT_CHUNK_SIZE):
+                yield chunk
+
+
+def required_literal(pattern):
+    """
+    The longest run of plain characters that every match of a pattern contains.
+
+    :param pattern: A rule pattern
+    :type pattern: str
+    :return: The run in lower case, '' when the pattern has none outside groups, classes and repeats
+    :rtype: str
+    """
+    longest = run = ""
+    for op, value in regex_parser.parse(pattern):
+        if op is regex_parser.LITERAL:
+            run += chr(value)
+        elif op is not regex_parser.AT:  # anchors such as ^ and \b match no characters, the run goes on
+            longest, run = max(longest, run, key=len), ""
+    return max(longest, run, key=len).lower()
+
+
+def _trie_pattern(literals):
+    """An alternation of the literals that branches one character at a time, so it costs the same for any number."""
+    trie = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[""] = None  # a literal ends here
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        alternation = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        if "" in node:
+            return f"(?:{alternation})?" if len(branches) == 1 else f"{alternation}?"
+        return alternation
+
+    return build(trie)
+
+
+class _FieldMatcher:
+    """
+    The rules that test one field of a message.
+
+    :param patterns: Rule index to pattern
+    :type patterns: dict
+    """
+
+    def __init__(self, patterns):
+        self.patterns = {index: re.compile(pattern, RULE_FLAGS) for index, pattern in patterns.items()}
+        self.by_literal = {}
+        self.always = set()  # rules without a literal are always searched
+        for index, pattern in patterns.items():
+            literal = required_literal(pattern)
+            if literal:
+                self.by_literal.setdefault(literal, []).append(index)
+            else:
+                self.always.add(index)
+        # the lookahead reports the longest literal starting at each position, the shorter ones are its prefixes
+        self.prefilter = re.compile(f"(?=({_trie_pattern(self.by_literal)}))") if self.by_literal else None
+
+    def candidates(self, text):
+        """Indexes of the rules whose literal the text contains, plus those without one."""
+        found = set(self.always)
+        if self.prefilter is not None:
+            for hit in set(self.prefilter.findall(text.lower())):
+                for end in range(1, len(hit) + 1):
+                    found.update(self.by_literal.get(hit[:end], ()))
+        return found
+
+    def search(self, text):
+        """Indexes of the rules whose pattern the text contains."""
+        return {index for index in self.candidates(text) if self.patterns[index].search(text)}
+
+
+class EmailRuleEngine:
+    """
+    Evaluate every rule against a message at once and run the actions of the rules that match.
+
+    :param rules: Rules in priority order
+    :type rules: list of EmailRule
+    :param download_directory: Where downloaded links and attachments that are not saved yet go unless a rule names
+        a directory
+    :type download_directory: str or Path or None
+    :param downloader: Called with (url, directory) for download_link rules, returns the saved path
+    :type downloader: callable or None
+    """
+
+    def __init__(self, rules, download_directory=None, downloader=None):
+        self.rules = list(rules)
+        self.download_directory = Path(download_directory) if download_directory is not None else None
+        self.downloader = downloader
+        self._matchers = {}
+        for field in RULE_FIELDS:
+            patterns = {index: rule.patterns[field] for index, rule in enumerate(self.rules) if field in rule.patterns}
+            if patterns:
+                self._matchers[field] = _FieldMatcher(patterns)
+
+    @classmethod
+    def from_file(cls, rules_file=EMAIL_ROUTING_RULES_FILE, **kwargs):
+        """
+        Load the rules from a JSON file with a "Rules" list.
+
+        :param rules_file: The rules file
+        :type rules_file: str or Path
+        :param kwargs: Passed on to EmailRuleEngine
+        :rtype: EmailRuleEngine
+        """
+        with Path(rules_file).open() as f:
+            declarations = json.load(f)["Rules"]
+        rules = [EmailRule(**declaration) for declaration in declarations if not declaration.get("disabled")]
+        logger.debug(f"Loaded {len(rules)} email routing rules from {rules_file}")
+        return cls(rules, **kwargs)
+
+    def match(self, sender="", subject="", body="", attachment_names=()):
+        """
+        Find the rules a message matches.
+
+        :return: Matching rules in priority order
+        :rtype: list of EmailRule
+        """
+        texts = {"sender": sender or "", "subject": subject or "", "body": body or "",
+                 "attachment": "\n".join(attachment_names)}
+        found = {field: matcher.search(texts[field]) for field, matcher in self._matchers.items()}
+        return [
+            rule for index, rule in enumerate(self.rules)
+            if all(index in found[field] for field in rule.patterns)
+        ]
+
+    @property
+    def routes_to_handlers(self):
+        """True when a rule runs a handler."""
+        return any(rule.action == "route_to_handler" for rule in self.rules)
+
+    def route(self, sender="", subject="", body="", attachments=(), handoff_queue=None):
+        """
+        Run the actions of every rule the message matches.
+
+        :param attachments: SavedAttachment objects, or objects with 'filename' and either 'payload' or imap streaming
+            'chunks()'. Saved attachments are used where they are unless a rule names another directory.
+        :type attachments: list
+        :param handoff_queue: Attachments for route_to_handler rules are put here as (path, content_hash, handler)
+            for monitor_download_directory() instead of running the handler on the calling thread
+        :type handoff_queue: queue.Queue or None
+        :return: (rule name, action, result) for every action taken, the result of save_attachment and
+            route_to_handler is the list of saved paths
+        :rtype: list of tuple
+        """
+        attachments = [attachment for attachment in attachments if getattr(attachment, "filename", None)]
+        names = [attachment.filename for attachment in attachments]
+        results = []
+        for rule in self.match(sender, subject, body, names):
+            logger.info(f"Email rule '{rule.name}' matched '{subject}' from {sender}, action: {rule.action}")
+            if rule.action == "download_link":
+                result = self._download_links(rule, body)
+            else:
+                wanted = set(rule.matching_attachments(names))
+                saved = [self._save(rule, attachment, sender) for attachment in attachments if attachment.filename in wanted]
+                saved = [item for item in saved if item is not None]
+                result = [path for path, content_hash in saved]
+                if rule.action == "route_to_handler":
+                    if handoff_queue is not None:
+                        for path, content_hash in saved:
+                            handoff_queue.put((path, content_hash, rule.handler))
+                    else:
+                        handler = importlib.import_module(rule.handler)
+                        for path in result:
+                            handler.data_handler_process(path)
+            results.append((rule.name, rule.action, result))
+        return results
+
+    def _download_links(self, rule, body):
+        urls = rule.link.findall(body or "")
+        if self.downloader is None:
+            logger.warning(f"Email rule '{rule.name}' found {len(urls)} links but no downloader is configured")
+            return []
+        directory = rule.directory or self.download_directory
+        if directory is None:
+            logger.error(f"Email rule '{rule.name}' found {len(urls)} links but has no directory to download into")
+            return []
+        return [self.downloader(url, Path(directory)) for url in urls]
+
+    def _save(self, rule, attachment, sender):
+        """
+        :return: (path, content_hash) of the saved attachment, None when there is nowhere to save it
+        :rtype: tuple or None
+        """
+        if isinstance(attachment, SavedAttachment):
+            if rule.directory is None:
+                return attachment.path, attachment.content_hash  # already saved by the fetcher
+            # a copy of the file on disk, the name already carries the sender
+            saved = write_attachment(attachment.chunks(), Path(rule.directory) / attachment.path.name)
+            return saved.destination, saved.content_hash
+        directory = rule.directory or self.download_directory
+        if directory is None:
+            logger.error(f"Email rule '{rule.name}' has no directory to save {attachment.filename} into")
+            return None
+        destination = Path(directory) / f"{sanitize_filename(sender)}_{sanitize_filename(attachment.filename[:50])}"
+        if hasattr(attachment, "chunks"):
+            saved = write_attachment(attachment.chunks(), destination, attachment.encoding)
+        else:
+            saved = write_attachment([attachment.payload], destination)
+        return saved.destination, saved.content_hash
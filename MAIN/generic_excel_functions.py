@@ -4,6 +4,7 @@ from pathlib import Path
 from loguru import logger
 import time
 from generic_pathlib_file_methods import delete_file_and_verify
+from generic_pipeline_sinks import get_sinks
 from fpdf import FPDF
 
 @logger.catch()
@@ -54,7 +55,8 @@ def convert_dataframe_to_excel_with_formatting_and_save(filename, frame):
     """Takes a dataframe and outputs to excel file."""
     logger.debug(f'Applying formatting rules and write excel file...')
     apply_excel_formatting_to_dataframe_and_save_spreadsheet(filename, frame)
-    time.sleep(1)  # Allow time for file to save
+    if get_sinks().writes_files:
+        time.sleep(1)  # Allow time for file to save
     logger.debug(f'Sending excel file to printer...')
     print_excel_file(filename)
 
@@ -110,6 +112,8 @@ def apply_excel_formatting_to_dataframe_and_save_spreadsheet(filename, frame):
         "_Assets": "$",
         "Sales($)": "$",
     }
+    if not get_sinks().output(filename, frame):
+        return filename
     # clean up any old output file that exists
     logger.debug(f"Cleanup any old file left over from previous runs.")
     delete_file_and_verify(filename) 
@@ -132,6 +136,8 @@ def apply_excel_formatting_to_dataframe_and_save_spreadsheet(filename, frame):
 @logger.catch()
 def print_excel_file(filename):
     # Now we print
+    if not get_sinks().print_job(filename):
+        return
     logger.debug("Send processed excel file to printer...")
     try:
         # this should launch the system spreadsheet program and trigger the print function.
@@ -179,6 +185,8 @@ def convert_xlsx_2_pdf(fname, header=None, footer=None):
         footer = ["End"]  # Default value
 
     file_path = Path(fname)
+    if not get_sinks().output(file_path.with_suffix(".pdf")):
+        return file_path.with_suffix(".pdf")
 
     # Read the data from the first sheet
     try:
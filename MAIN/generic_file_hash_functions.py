@@ -0,0 +1,148 @@
+"""
+Content hashing used to recognise downloads that have already been processed.
+
+Vendors often re-send identical reports and browsers save the copies as 'report (1).csv',
+'report (2).csv'... so the filename can not be trusted. Instead each file is hashed and the
+hash is looked up in a small SQLite index of everything that was processed successfully.
+"""
+
+from loguru import logger
+from pathlib import Path
+from datetime import datetime
+import hashlib
+import sqlite3
+from generic_pipeline_sinks import get_sinks
+
+HASH_CHUNK_SIZE = 1024 * 1024  # bytes read per step while hashing, keeps memory flat for large files
+HASH_DIGEST_SIZE = 32
+DOWNLOAD_HASH_INDEX_FILE = Path("./download_hash_index.sqlite")  # shared by the directory watcher and batching handlers
+
+
+def hash_file(file_path, chunk_size=HASH_CHUNK_SIZE) -> str:
+    """
+    Hash the contents of a file with BLAKE2b, streaming it in chunks.
+
+    :param file_path: File to hash.
+    :type file_path: str or Path
+    :param chunk_size: Number of bytes read per step.
+    :type chunk_size: int
+    :return: Hex digest of the file contents.
+    :rtype: str
+    """
+    digest = hashlib.blake2b(digest_size=HASH_DIGEST_SIZE)
+    with Path(file_path).open("rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ProcessedHashIndex:
+    """
+    Persistent index of content hashes for files that have been processed.
+
+    :param database: Path to the SQLite file. It is created if it does not exist.
+    :type database: str or Path
+    """
+
+    def __init__(self, database):
+        self.database = Path(database)
+        self.database.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(self.database), timeout=30)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS processed_hashes ("
+            "content_hash TEXT PRIMARY KEY, file_name TEXT NOT NULL, "
+            "file_size INTEGER NOT NULL, processed_at TEXT NOT NULL)"
+        )
+        self._connection.commit()
+
+    def lookup(self, content_hash):
+        """
+        Find the file that was first processed with this content.
+
+        :param content_hash: Digest from hash_file().
+        :type content_hash: str
+        :return: (file_name, processed_at) of the original or None if the content is new.
+        :rtype: tuple or None
+        """
+        return self._connection.execute(
+            "SELECT file_name, processed_at FROM processed_hashes WHERE content_hash = ?",
+            (content_hash,),
+        ).fetchone()
+
+    def __contains__(self, content_hash):
+        return self.lookup(content_hash) is not None
+
+    def record(self, content_hash, file_name, file_size):
+        """
+        Remember that content with this hash has been processed. The first file seen is kept.
+
+        :param content_hash: Digest from hash_file().
+        :type content_hash: str
+        :param file_name: Name of the processed file, kept for the log messages of later duplicates.
+        :type file_name: str
+        :param file_size: Size of the processed file in bytes.
+        :type file_size: int
+        """
+        self._connection.execute(
+            "INSERT OR IGNORE INTO processed_hashes (content_hash, file_name, file_size, processed_at) "
+            "VALUES (?, ?, ?, ?)",
+            (content_hash, str(file_name), int(file_size), datetime.now().isoformat(timespec="seconds")),
+        )
+        self._connection.commit()
+        logger.debug(f"Recorded content hash {content_hash[:12]} for {file_name}")
+
+    def close(self):
+        self._connection.close()
+
+
+def new_sibling_files(file_path, matches, database=None):
+    """
+    Other files waiting next to the one a handler was given, for handlers that process several at once.
+    Files whose contents were already processed are left alone so the directory watcher archives them as duplicates.
+
+    :param file_path: The file the directory watcher dispatched
+    :type file_path: Path
+    :param matches: Called with a file name, True for files the handler processes
+    :type matches: callable
+    :param database: The watcher's hash index, DOWNLOAD_HASH_INDEX_FILE when not given
+    :type database: str or Path or None
+    :return: Content hash of each new sibling, in name order
+    :rtype: dict[Path, str]
+    """
+    siblings = sorted(f for f in file_path.parent.iterdir() if f.is_file() and f != file_path and matches(f.name))
+    if not siblings:
+        return {}
+    index = ProcessedHashIndex(database or DOWNLOAD_HASH_INDEX_FILE)
+    try:
+        hashes = {}
+        for sibling in siblings:
+            content_hash = hash_file(sibling)
+            if content_hash in index:
+                logger.debug(f"{sibling.name} was processed before, leaving it for the directory watcher")
+            else:
+                hashes[sibling] = content_hash
+        return hashes
+    finally:
+        index.close()
+
+
+def record_processed_files(hashes, database=None):
+    """
+    Add files a handler processed without the directory watcher dispatching them to the watcher's hash index.
+
+    :param hashes: Content hash of each processed file, from new_sibling_files()
+    :type hashes: dict[Path, str]
+    :param database: The watcher's hash index, DOWNLOAD_HASH_INDEX_FILE when not given
+    :type database: str or Path or None
+    """
+    if not hashes:
+        return
+    # a dry run must not mark real files as processed, the watcher would archive them as duplicates
+    if not get_sinks().record("download_hash_index", {path.name: content_hash for path, content_hash in hashes.items()}):
+        return
+    index = ProcessedHashIndex(database or DOWNLOAD_HASH_INDEX_FILE)
+    try:
+        for processed_file, content_hash in hashes.items():
+            index.record(content_hash, processed_file.name, processed_file.stat().st_size)
+    finally:
+        index.close()
@@ -0,0 +1,252 @@
+"""
+Local store of every revenue figure the handlers have processed.
+
+Reports are printed and archived, which leaves nothing to query when a year over year question comes up.
+Each handler turns its report into normalized 'long' rows (one amount per row) and appends them here.
+The store is a single SQLite file with indexes on vendor, month, location and metric so cross vendor
+totals come straight from the index instead of re-parsing archived CSV files.
+
+Appending is idempotent per source file: processing the same report again replaces its rows.
+"""
+
+from loguru import logger
+from pathlib import Path
+from datetime import date, datetime
+import math
+import sqlite3
+import pandas as pd
+from generic_file_hash_functions import hash_file
+from generic_dataframe_functions import money_converter
+from generic_pipeline_sinks import get_sinks
+
+HISTORY_DATABASE = Path("./revenue_history.sqlite")
+HISTORY_COLUMNS = ("report_date", "period_end", "location", "entity", "metric", "amount")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history_sources (
+    source_file TEXT PRIMARY KEY,
+    vendor TEXT NOT NULL,
+    content_hash TEXT,
+    row_count INTEGER NOT NULL,
+    ingested_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS revenue_history (
+    vendor TEXT NOT NULL,
+    source_file TEXT NOT NULL,
+    report_date TEXT NOT NULL,
+    period_end TEXT,
+    period_month TEXT NOT NULL,
+    location TEXT,
+    entity TEXT,
+    metric TEXT NOT NULL,
+    amount REAL
+);
+CREATE INDEX IF NOT EXISTS revenue_by_vendor_month ON revenue_history (vendor, period_month, metric);
+CREATE INDEX IF NOT EXISTS revenue_by_month ON revenue_history (period_month, metric);
+CREATE INDEX IF NOT EXISTS revenue_by_location ON revenue_history (location, report_date);
+CREATE INDEX IF NOT EXISTS revenue_by_source ON revenue_history (source_file);
+"""
+
+
+def _iso_date(value):
+    """Dates are stored as 'YYYY-MM-DD' text so they sort and group correctly."""
+    if value is None or (isinstance(value, float) and math.isnan(value)) or value is pd.NaT:
+        return None
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    try:
+        return pd.Timestamp(value).date().isoformat()
+    except (ValueError, TypeError):
+        return None  # not a date, the caller falls back to the report date
+
+
+def _amount(value):
+    if value is None or value == "":
+        return None
+    amount = money_converter(value) if isinstance(value, str) else float(value)
+    return None if math.isnan(amount) else amount
+
+
+@logger.catch(reraise=True)
+def frame_to_history_rows(df, metrics, report_date=None, period_end=None, date_column=None,
+                          location=None, location_column=None, entity_column=None):
+    """
+    Melt a handler's frame into history rows, one row per metric per input row.
+
+    :param df: The handler's parsed data
+    :type df: pd.DataFrame
+    :param metrics: Names of the amount columns to keep
+    :type metrics: list of str
+    :param report_date: Date used for every row when date_column is not given
+    :type report_date: date or None
+    :param period_end: End of the reporting period when the report covers a range
+    :type period_end: date or None
+    :param date_column: Column holding each row's own date, falls back to report_date when blank
+    :type date_column: str or None
+    :param location: Location used for every row when location_column is not given
+    :type location: str or None
+    :param location_column: Column holding each row's location
+    :type location_column: str or None
+    :param entity_column: Column identifying the machine, terminal or device
+    :type entity_column: str or None
+    :return: Rows ready for RevenueHistoryStore.append()
+    :rtype: list of dict
+    """
+    metrics = [metric for metric in metrics if metric in df.columns]
+    rows = []
+    for record in df.to_dict("records"):
+        row_date = _iso_date(record.get(date_column)) if date_column else None
+        row_date = row_date or _iso_date(report_date)
+        if row_date is None:
+            continue  # without a date the amount can not be placed in history
+        for metric in metrics:
+            amount = _amount(record[metric])
+            if amount is None:
+                continue
+            rows.append({
+                "report_date": row_date,
+                "period_end": _iso_date(period_end),
+                "location": str(record[location_column]) if location_column else location,
+                "entity": str(record[entity_column]) if entity_column else None,
+                "metric": metric,
+                "amount": amount,
+            })
+    return rows
+
+
+class RevenueHistoryStore:
+    """
+    SQLite backed history of normalized revenue rows.
+
+    :param database: Path to the SQLite file. It is created if it does not exist.
+    :type database: str or Path
+    """
+
+    def __init__(self, database=HISTORY_DATABASE):
+        self.database = Path(database)
+        self.database.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(self.database), timeout=30)
+        self._connection.executescript(SCHEMA)
+        self._connection.commit()
+
+    def has_source(self, source_file, content_hash=None):
+        """
+        Check if a report was already stored.
+
+        :param source_file: Name of the report file
+        :type source_file: str
+        :param content_hash: When given the stored copy must also have the same contents
+        :type content_hash: str or None
+        :rtype: bool
+        """
+        row = self._connection.execute(
+            "SELECT content_hash FROM history_sources WHERE source_file = ?", (str(source_file),)
+        ).fetchone()
+        if row is None:
+            return False
+        return content_hash is None or row[0] == content_hash
+
+    def append(self, vendor, source_file, rows, content_hash=None):
+        """
+        Store the rows of one report, replacing anything stored earlier for the same file.
+
+        :param vendor: Short vendor name such as 'Kiosoft'
+        :type vendor: str
+        :param source_file: Name of the report file the rows came from
+        :type source_file: str
+        :param rows: Dicts with the keys in HISTORY_COLUMNS, see frame_to_history_rows()
+        :type rows: list of dict
+        :param content_hash: Hash of the report contents, see generic_file_hash_functions.hash_file()
+        :type content_hash: str or None
+        :return: Number of rows stored
+        :rtype: int
+        """
+        source_file = str(source_file)
+        values = [
+            (vendor, source_file, row["report_date"], row.get("period_end"), row["report_date"][:7],
+             row.get("location"), row.get("entity"), row["metric"], row["amount"])
+            for row in rows
+        ]
+        with self._connection:  # one transaction, a crash never leaves half a report behind
+            self._connection.execute("DELETE FROM revenue_history WHERE source_file = ?", (source_file,))
+            self._connection.executemany(
+                "INSERT INTO revenue_history (vendor, source_file, report_date, period_end, period_month, "
+                "location, entity, metric, amount) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                values,
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO history_sources (source_file, vendor, content_hash, row_count, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (source_file, vendor, content_hash, len(values), datetime.now().isoformat(timespec="seconds")),
+            )
+        logger.debug(f"Stored {len(values)} history rows for {vendor} from {source_file}")
+        return len(values)
+
+    def query(self, sql, params=()):
+        """
+        Run a read only query against the store.
+
+        :param sql: SELECT statement over revenue_history and history_sources
+        :type sql: str
+        :param params: Query parameters
+        :return: The result
+        :rtype: pd.DataFrame
+        """
+        return pd.read_sql_query(sql, self._connection, params=params)
+
+    def revenue_by_month(self, metric=None, vendor=None, location=None):
+        """
+        Monthly totals per vendor and metric.
+
+        :param metric: Only this metric
+        :type metric: str or None
+        :param vendor: Only this vendor
+        :type vendor: str or None
+        :param location: Only this location
+        :type location: str or None
+        :return: vendor, period_month, metric, amount
+        :rtype: pd.DataFrame
+        """
+        filters, params = [], []
+        for column, value in (("metric", metric), ("vendor", vendor), ("location", location)):
+            if value is not None:
+                filters.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        return self.query(
+            f"SELECT vendor, period_month, metric, SUM(amount) AS amount FROM revenue_history {where} "
+            "GROUP BY vendor, period_month, metric ORDER BY period_month, vendor, metric",
+            params,
+        )
+
+    def close(self):
+        self._connection.close()
+
+
+@logger.catch()
+def append_history(vendor, source_path, rows, database=None):
+    """
+    Store a handler's history rows. Called by handlers before the source file is archived.
+
+    :param vendor: Short vendor name such as 'Kiosoft'
+    :type vendor: str
+    :param source_path: The report being processed
+    :type source_path: Path
+    :param rows: Rows from frame_to_history_rows()
+    :type rows: list of dict
+    :param database: History database, HISTORY_DATABASE when not given
+    :type database: str or Path or None
+    :return: Number of rows stored
+    :rtype: int
+    """
+    source_path = Path(source_path)
+    if not get_sinks().record("revenue_history", {"vendor": vendor, "source_file": source_path.name, "rows": rows}):
+        return len(rows)
+    content_hash = hash_file(source_path) if source_path.is_file() else None
+    store = RevenueHistoryStore(database or HISTORY_DATABASE)
+    try:
+        return store.append(vendor, source_path.name, rows, content_hash)
+    finally:
+        store.close()
@@ -0,0 +1,484 @@
+"""
+Incremental, headers-first IMAP fetching.
+
+Every folder on an IMAP server numbers its messages with ascending UIDs that stay valid for as long as the
+folder's UIDVALIDITY does not change. Remembering the highest UID processed per account and folder is
+enough to ask the server for only 'UID n+1:*' on the next poll, so each poll transfers just the new mail.
+The watermarks live in a small SQLite file.
+
+Most mail is not a report. Instead of downloading whole messages, the headers and BODYSTRUCTURE of new mail
+are fetched first and matched against rules. Only the parts of the relevant messages are downloaded, so
+bandwidth and memory follow the relevant mail rather than the size of the inbox.
+"""
+
+from loguru import logger
+from pathlib import Path
+from datetime import datetime
+from email.header import decode_header, make_header
+from itertools import takewhile
+import base64
+import quopri
+import re
+import sqlite3
+import threading
+from imap_tools import AND, U, MailMessage
+from generic_attachment_functions import ATTACHMENT_CHUNK_SIZE
+
+SUMMARY_BATCH_SIZE = 100  # messages whose headers and structure are fetched per command
+SUMMARY_HEADER_FIELDS = "FROM TO CC BCC SUBJECT DATE MESSAGE-ID"
+# Senders and subjects whose mail always matters, even without a report attachment. Keys are matched as
+# case insensitive substrings and every key in a rule must match.
+DEFAULT_MESSAGE_RULES = [
+    {"from": "payrange.com"},  # the device detail report arrives as a download link in the body
+    {"from": "nayax.com"},
+]
+
+UID_WATERMARK_DATABASE = Path("./imap_uid_watermarks.sqlite")
+
+
+class UIDWatermarkStore:
+    """
+    Highest processed UID per account and folder.
+
+    :param database: Path to the SQLite file. It is created if it does not exist.
+    :type database: str or Path
+    """
+
+    def __init__(self, database=UID_WATERMARK_DATABASE):
+        self.database = Path(database)
+        self.database.parent.mkdir(parents=True, exist_ok=True)
+        # shared by the fetcher threads, the lock keeps each statement and its commit together
+        self._connection = sqlite3.connect(str(self.database), timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS uid_watermarks ("
+            "account TEXT NOT NULL, folder TEXT NOT NULL, uidvalidity INTEGER NOT NULL, "
+            "last_uid INTEGER NOT NULL, updated_at TEXT NOT NULL, PRIMARY KEY (account, folder))"
+        )
+        self._connection.commit()
+
+    def get(self, account, folder):
+        """
+        :return: (uidvalidity, last_uid) or None when the folder was never synced
+        :rtype: tuple or None
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT uidvalidity, last_uid FROM uid_watermarks WHERE account = ? AND folder = ?",
+                (account, folder),
+            ).fetchone()
+
+    def last_uid(self, account, folder, uidvalidity):
+        """
+        Highest UID processed in the folder, 0 when nothing was processed yet or the folder's UIDs were reset.
+
+        :param uidvalidity: The folder's current UIDVALIDITY
+        :type uidvalidity: int
+        :rtype: int
+        """
+        stored = self.get(account, folder)
+        if stored is None:
+            return 0
+        if stored[0] != uidvalidity:
+            logger.warning(f"UIDVALIDITY of {account} {folder} changed from {stored[0]} to {uidvalidity}, resyncing.")
+            return 0
+        return stored[1]
+
+    def advance(self, account, folder, uidvalidity, uid):
+        """
+        Record that a message was processed. The watermark never moves backwards within one UIDVALIDITY.
+
+        :param uid: UID of the processed message
+        :type uid: int
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO uid_watermarks (account, folder, uidvalidity, last_uid, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (account, folder) DO UPDATE SET "
+                "last_uid = CASE WHEN uidvalidity = excluded.uidvalidity THEN MAX(last_uid, excluded.last_uid) "
+                "ELSE excluded.last_uid END, uidvalidity = excluded.uidvalidity, updated_at = excluded.updated_at",
+                (account, folder, int(uidvalidity), int(uid), datetime.now().isoformat(timespec="seconds")),
+            )
+
+    def close(self):
+        self._connection.close()
+
+
+def fetch_new_messages(mailbox, store, account, criteria=None, fetcher=None, **fetch_kwargs):
+    """
+    Fetch the messages of the current folder that arrived after the last processed UID.
+
+    The watermark for a message is advanced when the caller asks for the next one, so a message whose
+    processing raised is fetched again on the next poll.
+
+    :param mailbox: A logged in imap_tools MailBox
+    :param store: Where the watermarks are kept
+    :type store: UIDWatermarkStore
+    :param account: Name the watermarks are stored under, normally the login name
+    :type account: str
+    :param criteria: Extra search criteria such as AND(date_gte=...) that also limit the first sync
+    :param fetcher: Called with the search criteria instead of mailbox.fetch(), see fetch_message_summaries()
+    :type fetcher: callable or None
+    :param fetch_kwargs: Passed to mailbox.fetch(), for example mark_seen or bulk
+    :return: New messages in UID order
+    :rtype: generator of imap_tools.MailMessage
+    """
+    folder = mailbox.folder.get()
+    uidvalidity = mailbox.folder.status(folder, ["UIDVALIDITY"])["UIDVALIDITY"]
+    last_uid = store.last_uid(account, folder, uidvalidity)
+    search = AND(uid=U(last_uid + 1, "*"))
+    if criteria is not None:
+        search = AND(criteria, search)
+    logger.debug(f"Fetching {account} {folder} with criteria: {search}")
+    messages = fetcher(search) if fetcher else mailbox.fetch(search, **fetch_kwargs)
+    for msg in messages:
+        uid = int(msg.uid)
+        if uid <= last_uid:
+            continue  # 'n:*' always matches the newest message even when it is older than n
+        yield msg
+        store.advance(account, folder, uidvalidity, uid)
+
+
+_OPEN, _CLOSE = object(), object()  # parentheses, kept apart from quoted strings that contain them
+_TOKEN = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\}$|((?:[^\s()\[\]"]|\[[^\]]*\])+))')
+
+
+def _imap_tokens(data):
+    """Split raw imaplib FETCH data into parentheses, atoms (str), quoted strings (str) and literals (bytes)."""
+    for item in data:
+        text, literal = item if isinstance(item, tuple) else (item, None)
+        position = 0
+        while position < len(text or b""):
+            match = _TOKEN.match(text, position)
+            if match is None or match.end() == position:
+                break  # only trailing whitespace left
+            position = match.end()
+            opening, closing, quoted, literal_size, atom = match.groups()
+            if opening:
+                yield _OPEN
+            elif closing:
+                yield _CLOSE
+            elif quoted is not None:
+                yield re.sub(rb"\\(.)", rb"\1", quoted).decode("utf-8", "replace")
+            elif literal_size is not None:
+                yield literal
+            else:
+                atom = atom.decode("utf-8", "replace")
+                yield None if atom.upper() == "NIL" else atom
+
+
+def parse_fetch_response(data):
+    """
+    Parse the data of a raw 'UID FETCH' command.
+
+    :param data: Second item of the (typ, data) returned by imaplib
+    :type data: list
+    :return: One dict per message, keys are the upper case item names such as 'UID' or 'BODY[1]'
+    :rtype: list of dict
+    """
+    stack = [[]]
+    for token in _imap_tokens(data):
+        if token is _OPEN:
+            stack.append([])
+        elif token is _CLOSE and len(stack) > 1:
+            finished = stack.pop()
+            stack[-1].append(finished)
+        else:
+            stack[-1].append(token)
+    responses = []
+    for item in stack[0]:
+        if isinstance(item, list):  # skip the message sequence numbers in front of each list
+            responses.append({str(key).upper(): value for key, value in zip(item[::2], item[1::2])})
+    return responses
+
+
+def _decode_words(value):
+    """Decode '=?utf-8?q?...?=' encoded words used in attachment names."""
+    if not value or "=?" not in value:
+        return value
+    return str(make_header(decode_header(value)))
+
+
+def _parameters(values):
+    """BODYSTRUCTURE parameter list ('NAME' 'x.pdf' ...) as a lower case keyed dict."""
+    if not isinstance(values, list):
+        return {}
+    return {str(key).lower(): value for key, value in zip(values[::2], values[1::2])}
+
+
+class MessagePart:
+    """
+    One leaf part of a message as described by BODYSTRUCTURE.
+
+    :param section: Part number used to fetch it, for example '2' or '1.2'
+    :type section: str
+    """
+
+    __slots__ = ("section", "content_type", "encoding", "size", "filename", "charset", "disposition")
+
+    def __init__(self, section, content_type, encoding, size, filename=None, charset=None, disposition=None):
+        self.section = section
+        self.content_type = content_type
+        self.encoding = encoding
+        self.size = size
+        self.filename = filename
+        self.charset = charset
+        self.disposition = disposition
+
+    @property
+    def is_attachment(self):
+        return self.filename is not None or self.disposition == "attachment"
+
+    def __repr__(self):
+        return f"MessagePart({self.section!r}, {self.content_type!r}, {self.filename!r}, {self.size})"
+
+
+def parse_bodystructure(structure, section=""):
+    """
+    List the leaf parts of a parsed BODYSTRUCTURE.
+
+    :param structure: The BODYSTRUCTURE value from parse_fetch_response()
+    :type structure: list
+    :param section: Section of the structure, empty for the whole message
+    :type section: str
+    :rtype: list of MessagePart
+    """
+    if structure and isinstance(structure[0], list):  # multipart: child parts, then the subtype
+        parts = []
+        for number, child in enumerate(takewhile(lambda item: isinstance(item, list), structure), start=1):
+            parts.extend(parse_bodystructure(child, f"{section}.{number}" if section else str(number)))
+        return parts
+    main_type, sub_type = str(structure[0]).lower(), str(structure[1]).lower()
+    parameters = _parameters(structure[2])
+    if main_type == "text":
+        extension = 8  # body lines come first
+    elif (main_type, sub_type) == ("message", "rfc822"):
+        extension = 10  # envelope, body structure and lines come first
+    else:
+        extension = 7
+    disposition = structure[extension + 1] if len(structure) > extension + 1 else None
+    disposition_type, disposition_parameters = None, {}
+    if isinstance(disposition, list) and disposition:
+        disposition_type = str(disposition[0]).lower()
+        disposition_parameters = _parameters(disposition[1] if len(disposition) > 1 else None)
+    filename = disposition_parameters.get("filename") or parameters.get("name")
+    return [MessagePart(
+        section or "1",
+        f"{main_type}/{sub_type}",
+        str(structure[5] or "7bit").lower(),
+        int(structure[6] or 0),
+        _decode_words(filename),
+        parameters.get("charset"),
+        disposition_type,
+    )]
+
+
+class MessageSummary:
+    """
+    Headers and structure of a message, fetched without its body.
+    Header attributes (subject, from_, to, date, headers...) come from imap_tools' MailMessage.
+    """
+
+    def __init__(self, uid, size, header_bytes, structure):
+        self.uid = str(uid)
+        self.size = size
+        self.parts = parse_bodystructure(structure) if structure else []
+        self._header_message = MailMessage.from_bytes(header_bytes or b"")
+
+    def __getattr__(self, name):
+        return getattr(self._header_message, name)
+
+    @property
+    def attachment_parts(self):
+        return [part for part in self.parts if part.is_attachment]
+
+    @property
+    def text_parts(self):
+        return [part for part in self.parts if not part.is_attachment and part.content_type in ("text/plain", "text/html")]
+
+
+def fetch_message_summaries(mailbox, criteria, batch_size=SUMMARY_BATCH_SIZE, mark_seen=True):
+    """
+    Phase one: fetch only the headers and BODYSTRUCTURE of the messages matching the criteria.
+
+    :param mailbox: A logged in imap_tools MailBox
+    :param criteria: Search criteria
+    :param batch_size: Messages fetched per command
+    :type batch_size: int
+    :param mark_seen: Flag the messages as seen, like a full mailbox.fetch() does
+    :type mark_seen: bool
+    :return: Summaries in UID order
+    :rtype: generator of MessageSummary
+    """
+    uids = mailbox.uids(criteria)
+    header_item = "BODY" if mark_seen else "BODY.PEEK"
+    for start in range(0, len(uids), batch_size):
+        batch = uids[start:start + batch_size]
+        typ, data = mailbox.client.uid(
+            "FETCH", ",".join(batch),
+            f"(UID RFC822.SIZE BODYSTRUCTURE {header_item}[HEADER.FIELDS ({SUMMARY_HEADER_FIELDS})])",
+        )
+        if typ != "OK":
+            raise ConnectionError(f"FETCH of message summaries failed: {typ} {data}")
+        for response in sorted(parse_fetch_response(data), key=lambda response: int(response["UID"])):
+            header = next((value for key, value in response.items() if key.startswith("BODY[HEADER")), b"")
+            yield MessageSummary(response["UID"], int(response.get("RFC822.SIZE") or 0), header, response.get("BODYSTRUCTURE"))
+
+
+def rule_matches(summary, rule):
+    """Every key of the rule ('from', 'subject', 'to') is a case insensitive substring of that header."""
+    values = {"from": summary.from_, "subject": summary.subject, "to": " ".join(summary.to)}
+    return all(str(pattern).lower() in (values.get(key) or "").lower() for key, pattern in rule.items())
+
+
+def select_relevant_parts(summary, attachment_matcher=None, message_rules=None, ignore_file_types=()):
+    """
+    Decide which parts of a message are worth downloading.
+
+    A message matters when one of its attachments is accepted by attachment_matcher or when it matches one of
+    the message rules. Its text parts are always downloaded with it, attachments only when they are accepted
+    (or, for messages matched by a rule, when no matcher is given).
+
+    :param summary: The message from fetch_message_summaries()
+    :type summary: MessageSummary
+    :param attachment_matcher: Called with an attachment filename, truthy when a handler wants the file
+    :type attachment_matcher: callable or None
+    :param message_rules: Rules for rule_matches(), DEFAULT_MESSAGE_RULES when not given
+    :type message_rules: list of dict or None
+    :param ignore_file_types: Attachment suffixes never downloaded
+    :type ignore_file_types: list of str
+    :return: Parts to fetch, empty when the message is not relevant
+    :rtype: list of MessagePart
+    """
+    message_rules = DEFAULT_MESSAGE_RULES if message_rules is None else message_rules
+    attachments = [
+        part for part in summary.attachment_parts
+        if part.filename and part.filename.rsplit(".", 1)[-1].lower() not in ignore_file_types
+    ]
+    wanted = [part for part in attachments if attachment_matcher and attachment_matcher(part.filename)]
+    ruled = any(rule_matches(summary, rule) for rule in message_rules)
+    if ruled and attachment_matcher is None:
+        wanted = attachments
+    if not wanted and not ruled:
+        return []
+    return summary.text_parts + wanted
+
+
+def decode_part(payload, encoding):
+    """Undo the Content-Transfer-Encoding of a fetched part."""
+    if encoding == "base64":
+        return base64.b64decode(payload)
+    if encoding == "quoted-printable":
+        return quopri.decodestring(payload)
+    return payload
+
+
+class FetchedAttachment:
+    """An attachment downloaded in phase two, with the attributes of imap_tools' MailAttachment that are used."""
+
+    def __init__(self, part, payload):
+        self.part = part
+        self.filename = part.filename or ""
+        self.content_type = part.content_type
+        self.payload = payload
+        self.size = len(payload)
+
+
+def iter_part_chunks(mailbox, uid, section, chunk_size=ATTACHMENT_CHUNK_SIZE):
+    """
+    Download one part of a message in pieces with partial FETCH ('BODY.PEEK[2]<offset.length>').
+
+    :param mailbox: A logged in imap_tools MailBox
+    :param uid: UID of the message
+    :type uid: str
+    :param section: Section of the part
+    :type section: str
+    :param chunk_size: Encoded bytes requested per command
+    :type chunk_size: int
+    :return: The part, still in its Content-Transfer-Encoding
+    :rtype: generator of bytes
+    """
+    offset = 0
+    while True:
+        typ, data = mailbox.client.uid("FETCH", uid, f"(UID BODY.PEEK[{section}]<{offset}.{chunk_size}>)")
+        if typ != "OK":
+            raise ConnectionError(f"FETCH of part {section} of message {uid} failed: {typ} {data}")
+        response = next((response for response in parse_fetch_response(data) if str(response.get("UID")) == uid), {})
+        chunk = next((value for key, value in response.items() if key.startswith(f"BODY[{section}]")), None) or b""
+        chunk = chunk.encode() if isinstance(chunk, str) else chunk
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        offset += len(chunk)
+
+
+class StreamedAttachment:
+    """
+    An attachment that is downloaded only when it is saved, see generic_attachment_functions.write_attachment().
+    The mailbox must still be logged in when chunks() is read.
+    """
+
+    def __init__(self, mailbox, uid, part):
+        self.mailbox = mailbox
+        self.uid = uid
+        self.part = part
+        self.filename = part.filename or ""
+        self.content_type = part.content_type
+        self.encoding = part.encoding
+        self.size = part.size  # encoded size from BODYSTRUCTURE, about 4/3 of the file for base64
+
+    def chunks(self, chunk_size=ATTACHMENT_CHUNK_SIZE):
+        return iter_part_chunks(self.mailbox, self.uid, self.part.section, chunk_size)
+
+
+class FetchedMessage:
+    """
+    A message with only its relevant parts downloaded. It offers the MailMessage attributes EmailFetcher uses.
+    """
+
+    def __init__(self, summary, text="", html="", attachments=None):
+        self.summary = summary
+        self.text = text
+        self.html = html
+        self.attachments = attachments or []
+
+    def __getattr__(self, name):
+        return getattr(self.summary, name)
+
+
+def fetch_parts(mailbox, summary, parts, stream_attachments=False):
+    """
+    Phase two: download the given parts of one message in a single command.
+
+    :param mailbox: A logged in imap_tools MailBox
+    :param summary: The message
+    :type summary: MessageSummary
+    :param parts: Parts from select_relevant_parts()
+    :type parts: list of MessagePart
+    :param stream_attachments: Leave the attachments on the server as StreamedAttachment to be saved in chunks
+    :type stream_attachments: bool
+    :rtype: FetchedMessage
+    """
+    message = FetchedMessage(summary)
+    if stream_attachments:
+        message.attachments = [StreamedAttachment(mailbox, summary.uid, part) for part in parts if part.is_attachment]
+        parts = [part for part in parts if not part.is_attachment]
+    response = {}
+    if parts:
+        items = " ".join(f"BODY.PEEK[{part.section}]" for part in parts)
+        typ, data = mailbox.client.uid("FETCH", summary.uid, f"(UID {items})")
+        if typ != "OK":
+            raise ConnectionError(f"FETCH of parts of message {summary.uid} failed: {typ} {data}")
+        response = next((response for response in parse_fetch_response(data) if str(response.get("UID")) == summary.uid), {})
+    for part in parts:
+        payload = response.get(f"BODY[{part.section}]") or b""
+        payload = decode_part(payload.encode() if isinstance(payload, str) else payload, part.encoding)
+        if part.is_attachment:
+            message.attachments.append(FetchedAttachment(part, payload))
+        elif part.content_type == "text/html" and not message.html:
+            message.html = payload.decode(part.charset or "utf-8", "replace")
+        elif part.content_type == "text/plain" and not message.text:
+            message.text = payload.decode(part.charset or "utf-8", "replace")
+    logger.debug(f"Fetched {len(parts)} of {len(summary.parts)} parts of message {summary.uid}")
+    return message
@@ -0,0 +1,211 @@
+"""
+Local, indexed archive of the email the fetchers have seen.
+
+Writing every message as a JSON file into the watched Downloads folder sends each one through the watcher,
+the JSON loader and the archive mover. Instead each message is appended once to a SQLite file with a FTS5
+full text index over subject, sender and body. Rules and searches run against the index, and a message
+is marked handled once an action has been taken on it so it is only acted on once.
+
+SQLite builds without FTS5 fall back to LIKE searches over the same columns.
+"""
+
+from loguru import logger
+from pathlib import Path
+from datetime import datetime
+import json
+import sqlite3
+import threading
+from generic_pipeline_sinks import get_sinks
+
+MAIL_ARCHIVE_DATABASE = Path("./mail_archive.sqlite")
+MAIL_COLUMNS = ("message_key", "account", "uid", "subject", "sender", "recipients", "date", "body", "headers", "attachments")
+RULE_COLUMNS = {"from": "sender", "subject": "subject", "to": "recipients"}  # rule keys as in generic_imap_functions
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    message_key TEXT NOT NULL UNIQUE,
+    account TEXT,
+    uid TEXT,
+    subject TEXT,
+    sender TEXT,
+    recipients TEXT,
+    date TEXT,
+    body TEXT,
+    headers TEXT,
+    attachments TEXT,
+    archived_at TEXT NOT NULL,
+    handled_at TEXT,
+    handled_by TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_by_sender ON messages (sender, date);
+CREATE INDEX IF NOT EXISTS messages_by_date ON messages (date);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    subject, sender, body, content='messages', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, subject, sender, body) VALUES (new.id, new.subject, new.sender, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, subject, sender, body)
+    VALUES ('delete', old.id, old.subject, old.sender, old.body);
+END;
+"""
+
+
+def message_key(email_data):
+    """The Message-ID header, or sender, date and subject for mail without one."""
+    headers = {str(name).lower(): value for name, value in (email_data.get("headers") or {}).items()}
+    message_id = headers.get("message-id")
+    if isinstance(message_id, (list, tuple)):
+        message_id = message_id[0] if message_id else None
+    if message_id:
+        return str(message_id).strip()
+    return f"{email_data.get('from')}|{email_data.get('date')}|{email_data.get('subject')}"
+
+
+def _fts_query(text):
+    """Quote every word so user text can not break the MATCH syntax."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in str(text).split())
+
+
+class MailArchive:
+    """
+    SQLite archive of email with a full text index.
+
+    :param database: Path to the SQLite file. It is created if it does not exist.
+    :type database: str or Path
+    :param full_text: Use FTS5 when SQLite has it, False forces the LIKE fallback
+    :type full_text: bool
+    """
+
+    def __init__(self, database=MAIL_ARCHIVE_DATABASE, full_text=True):
+        self.database = Path(database)
+        self.database.parent.mkdir(parents=True, exist_ok=True)
+        # shared by the fetcher threads, the lock keeps each statement and its commit together
+        self._connection = sqlite3.connect(str(self.database), timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._connection.row_factory = sqlite3.Row
+        self._connection.executescript(SCHEMA)
+        self.full_text = False
+        if full_text:
+            try:
+                self._connection.executescript(FTS_SCHEMA)
+                self.full_text = True
+            except sqlite3.OperationalError as e:
+                logger.warning(f"SQLite has no FTS5 ({e}), mail searches fall back to LIKE.")
+        self._connection.commit()
+
+    def append(self, email_data, account=None, uid=None):
+        """
+        Archive one message. A message that is already archived is left as it is.
+
+        :param email_data: The dict EmailFetcher.construct_email_data() builds
+        :type email_data: dict
+        :param account: Account the message was fetched from
+        :type account: str or None
+        :param uid: IMAP UID of the message
+        :type uid: str or None
+        :return: True when the message was new
+        :rtype: bool
+        """
+        row = (
+            message_key(email_data),
+            account,
+            None if uid is None else str(uid),
+            email_data.get("subject"),
+            email_data.get("from"),
+            ", ".join(email_data.get("to") or ()),
+            email_data.get("date"),
+            email_data.get("body"),
+            json.dumps(email_data.get("headers") or {}, default=str),
+            json.dumps(email_data.get("attachments") or [], default=str),
+        )
+        if not get_sinks().record("mail_archive", dict(zip(MAIL_COLUMNS, row))):
+            return False
+        with self._lock:
+            cursor = self._connection.execute(
+                f"INSERT OR IGNORE INTO messages ({', '.join(MAIL_COLUMNS)}, archived_at) "
+                f"VALUES ({', '.join('?' * len(MAIL_COLUMNS))}, ?)",
+                (*row, datetime.now().isoformat(timespec="seconds")),
+            )
+            self._connection.commit()
+        if cursor.rowcount:
+            logger.debug(f"Archived email '{email_data.get('subject')}' from {email_data.get('from')}")
+        return bool(cursor.rowcount)
+
+    def find(self, rule=None, text=None, since=None, unhandled=False, limit=None):
+        """
+        Query the archive, newest first.
+
+        :param rule: Case insensitive substrings per header, keys 'from', 'subject' and 'to'
+        :type rule: dict or None
+        :param text: Words that must all appear in the subject, sender or body
+        :type text: str or None
+        :param since: Only mail dated on or after this ISO date
+        :type since: str or None
+        :param unhandled: Only mail no action has been taken on yet
+        :type unhandled: bool
+        :param limit: Most messages returned
+        :type limit: int or None
+        :return: Messages with headers and attachments decoded
+        :rtype: list of dict
+        """
+        conditions, parameters = [], []
+        for key, pattern in (rule or {}).items():
+            conditions.append(f"{RULE_COLUMNS[key]} LIKE ?")
+            parameters.append(f"%{pattern}%")
+        if text and self.full_text:
+            conditions.append("id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)")
+            parameters.append(_fts_query(text))
+        elif text:
+            for word in str(text).split():
+                conditions.append("(subject LIKE ? OR sender LIKE ? OR body LIKE ?)")
+                parameters.extend([f"%{word}%"] * 3)
+        if since:
+            conditions.append("date >= ?")
+            parameters.append(str(since))
+        if unhandled:
+            conditions.append("handled_at IS NULL")
+        query = "SELECT * FROM messages"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY date DESC, id DESC"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._connection.execute(query, parameters).fetchall()
+        return [self._as_dict(row) for row in rows]
+
+    def mark_handled(self, message_id, handled_by):
+        """
+        Remember that an action was taken on a message.
+
+        :param message_id: The 'id' of a message from find()
+        :type message_id: int
+        :param handled_by: What handled it, kept for the log
+        :type handled_by: str
+        """
+        with self._lock:
+            self._connection.execute(
+                "UPDATE messages SET handled_at = ?, handled_by = ? WHERE id = ?",
+                (datetime.now().isoformat(timespec="seconds"), handled_by, message_id),
+            )
+            self._connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    @staticmethod
+    def _as_dict(row):
+        message = dict(row)
+        message["headers"] = json.loads(message["headers"] or "{}")
+        message["attachments"] = json.loads(message["attachments"] or "[]")
+        return message
+
+    def close(self):
+        self._connection.close()
@@ -1,14 +1,18 @@
 import re
-from datetime import datetime
+from functools import lru_cache
+from datetime import date, datetime
 from loguru import logger
 import subprocess
 from pathlib import Path
 from generic_pathlib_file_methods import move_file_with_check
+from generic_pipeline_sinks import get_sinks
 from dateutil.parser import parse, ParserError
 
 @logger.catch()
 def print_pdf_using_os_subprocess(file_path, printer_name):
     """Print PDF files using the windows program SumatraPDF"""
+    if not get_sinks().print_job(file_path, printer_name):
+        return
     subprocess.run(
         [
             "C:\\Users\\Conrad\\AppData\\Local\\SumatraPDF\\SumatraPDF.exe",
@@ -32,128 +36,208 @@ def archive_original_file(input_filename: Path, destination: Path):
     move_file_with_check(input_filename, destination_filename)
     logger.debug(f"Moved original file from {input_filename} to {destination}")
 
+MIN_VALID_DATE = date(1970, 1, 1)
+MAX_VALID_DATE = date(2170, 1, 1)
+MONTH_ABBREVIATIONS = {name: number for number, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+# One pass tokenizer, the named group that matched tells us the layout of the candidate.
+# The leading lookahead lets the scan skip quickly over characters that can not start a date.
+DATE_TOKEN = re.compile(
+    r"(?=[0-9JFMASONDjfmasond])(?:"
+    r"(?<!\d)(?:"
+    r"(?P<iso_y>\d{4})[-_](?P<iso_m>\d{2})[-_](?P<iso_d>\d{2})"  # YYYY-MM-DD or YYYY_MM_DD
+    r"|(?P<mdy_m>\d{1,2})-(?P<mdy_d>\d{1,2})-(?P<mdy_y>\d{4})"  # MM-DD-YYYY
+    r"|(?P<ymon_y>\d{4})(?P<ymon_m>[A-Za-z]{3})(?P<ymon_d>\d{2})"  # YYYYmonDD
+    r"|(?P<digits>\d{6,8})(?!\d)"  # YYYYMMDD, MMDDYYYY or short forms like '4212024'
+    r"|(?P<stamp>\d{8})\d+"  # YYYYMMDD leading a longer run, as in timestamps like '20240918103000'
+    r")(?!\d)"
+    r"|\b(?P<mon_m>(?i:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[A-Za-z]*)"
+    r" (?P<mon_d>\d{1,2}), (?P<mon_y>\d{4})(?!\d)"  # Month DD, YYYY
+    r")"
+)
+# How a run of digits is split into (month, day, year) when it is not YYYYMMDD.
+# These are the first splits a greedy (\d{1,2})(\d{1,2})(\d{4}) would find, so '4212024' is 42/1/2024, not 4/21/2024
+COMPACT_SPLITS = {8: (2, 2), 7: (2, 1), 6: (1, 1)}
+
+
+def _checked_date(year, month, day):
+    """Build a date from integers using arithmetic checks only, None if it is impossible or out of range."""
+    if not 1 <= month <= 12 or day < 1:
+        return None
+    leap = year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    if day > DAYS_IN_MONTH[month - 1] + (month == 2 and leap):
+        return None
+    if not MIN_VALID_DATE.year <= year <= MAX_VALID_DATE.year:
+        return None
+    found = date(year, month, day)
+    return found if MIN_VALID_DATE <= found <= MAX_VALID_DATE else None
+
+
+def _date_from_match(match):
+    """Turn one DATE_TOKEN match into a date, None if the candidate is not a real date."""
+    kind = match.lastgroup
+    if kind == "iso_d":
+        return _checked_date(int(match["iso_y"]), int(match["iso_m"]), int(match["iso_d"]))
+    if kind == "mdy_y":
+        return _checked_date(int(match["mdy_y"]), int(match["mdy_m"]), int(match["mdy_d"]))
+    if kind == "ymon_d":
+        month = MONTH_ABBREVIATIONS.get(match["ymon_m"].lower())
+        return month and _checked_date(int(match["ymon_y"]), month, int(match["ymon_d"]))
+    if kind == "mon_y":
+        month = MONTH_ABBREVIATIONS.get(match["mon_m"][:3].lower())
+        return month and _checked_date(int(match["mon_y"]), month, int(match["mon_d"]))
+    if kind == "stamp":
+        stamp = match["stamp"]
+        return _checked_date(int(stamp[:4]), int(stamp[4:6]), int(stamp[6:]))
+    digits = match["digits"]
+    if len(digits) == 8:
+        found = _checked_date(int(digits[:4]), int(digits[4:6]), int(digits[6:]))
+        if found:
+            return found
+    month_len, day_len = COMPACT_SPLITS[len(digits)]
+    return _checked_date(
+        int(digits[month_len + day_len:]), int(digits[:month_len]), int(digits[month_len:month_len + day_len])
+    )
+
+
 @logger.catch()
-def is_date_valid(date_str):
-    formats = ["%Y%b%d", "%Y%m%d", "%Y-%m-%d"]
-    min_date = datetime(1970, 1, 1)
-    max_date = datetime(2170, 1, 1)
-    for fmt in formats:
-        try:
-            # Parse the date string
-            date_obj = datetime.strptime(date_str, fmt)
-            # test the truth of the valid date range
-            return min_date <= date_obj <= max_date
-        except (TypeError, ValueError) as e:
-            continue
-    return False
+def is_date_valid(value):
+    """
+    Check that a date, or a string holding a single date, is real and between 1970-01-01 and 2170-01-01.
+
+    :param value: A date object or a string such as '2024-08-04', '20240804' or '2024Aug04'
+    :type value: date or str
+    :return: True if the date is valid
+    :rtype: bool
+    """
+    if isinstance(value, date):
+        if isinstance(value, datetime):
+            value = value.date()
+        return MIN_VALID_DATE <= value <= MAX_VALID_DATE
+    if not isinstance(value, str):
+        return False
+    match = DATE_TOKEN.fullmatch(value)
+    return bool(match and match.lastgroup != "stamp" and _date_from_match(match))
+
 
 @logger.catch()
 def extract_dates(string):
-    # Define patterns to match different date formats
-    patterns = [
-        r"(\d{4})[-_]?(\d{2})[-_]?(\d{2})",  # YYYY-MM-DD or YYYY_MM_DD
-        r"(\d{1,2})-(\d{1,2})-(\d{4})",  # MM-DD-YYYY
-        r"(\d{4})(\d{2})(\d{2})",  # YYYYMMDD
-        r"(\d{4})([a-zA-Z]{3})(\d{2})",  # YYYYmonDD
-        r"([A-Za-z]+) (\d{1,2}), (\d{4})",  # Month DD, YYYY
-        r"\b(\d{1,2})(\d{1,2})(\d{4})\b",  # Handle formats like '4212024'
-    ]
+    """
+    Find every valid date in a string with a single scan.
 
+    :param string: Usually a filename without the suffix
+    :type string: str
+    :return: The distinct dates found, oldest first. Empty if there are none.
+    :rtype: list of datetime.date
+    """
     found_dates = set()  # Use a set to avoid duplicates
-
-    # Try each pattern to find dates
-    for pattern in patterns:
-        matches = re.findall(pattern, string)
-        for match in matches:
-            try:
-                if pattern == patterns[0]:  # YYYY-MM-DD or YYYY_MM_DD
-                    date_str = f"{match[0]}-{match[1].zfill(2)}-{match[2].zfill(2)}"
-                elif pattern == patterns[1]:  # MM-DD-YYYY
-                    date_str = f"{match[2]}-{match[0].zfill(2)}-{match[1].zfill(2)}"
-                elif pattern == patterns[2]:  # YYYYMMDD
-                    date_str = f"{match[0]}-{match[1].zfill(2)}-{match[2].zfill(2)}"
-                elif pattern == patterns[3]:  # YYYYmonDD
-                    month = datetime.strptime(match[1].lower(), "%b").strftime("%m")
-                    date_str = f"{match[0]}-{month}-{match[2].zfill(2)}"
-                elif pattern == patterns[4]:  # Month DD, YYYY
-                    month = datetime.strptime(match[0][:3].lower(), "%b").strftime("%m")
-                    date_str = f"{match[2]}-{month}-{match[1].zfill(2)}"
-                elif pattern == patterns[5]:  # MMDDYYYY
-                    date_str = f"{match[2]}-{match[0].zfill(2)}-{match[1].zfill(2)}"
-
-                # Validate and add the date
-                if is_date_valid(date_str):
-                    found_dates.add(date_str)
-            except ValueError:
+    for match in DATE_TOKEN.finditer(string):
+        found = _date_from_match(match)
+        if found:
+            found_dates.add(found)
+    return sorted(found_dates)
+
+# Format hints a handler can give find_report_dates() about the dates its filenames carry
+DATE_HINT_SINGLE = "single"  # one report date, the earliest found is used
+DATE_HINT_RANGE = "range"  # a start and an end date
+NO_DATE_STRING = "xxxxxxxx"
+FILENAME_DATE_CACHE_SIZE = 1024
+YEAR_DIGITS = re.compile(r"\d{4}")
+DATEUTIL_DEFAULTS = (datetime(2001, 1, 1), datetime(2002, 2, 2))
+
+
+def _dates_from_dateutil(fname):
+    """Slow fallback, let dateutil try each '-' or '_' separated piece of the name that could hold a year."""
+    found_dates = set()
+    for part in str(fname).replace("_", "-").split("-"):
+        if not YEAR_DIGITS.search(part):
+            continue
+        try:
+            found = parse(part, default=DATEUTIL_DEFAULTS[0]).date()
+            # dateutil fills missing fields from the default, a piece that only names a year or month is not a date
+            if found != parse(part, default=DATEUTIL_DEFAULTS[1]).date():
                 continue
+        except (ParserError, ValueError, OverflowError):
+            continue
+        if is_date_valid(found):
+            found_dates.add(found)
+    return sorted(found_dates)
+
+
+@lru_cache(maxsize=FILENAME_DATE_CACHE_SIZE)
+def _cached_report_dates(fname, hint, allow_fallback):
+    # precedence: the single pass tokenizer, then dateutil only if the tokenizer could not satisfy the hint
+    found_dates = extract_dates(fname)
+    needed = 2 if hint == DATE_HINT_RANGE else 1
+    if len(found_dates) < needed and allow_fallback:
+        logger.debug(f"Fast date scan found {found_dates} in '{fname}', trying dateutil.")
+        found_dates = sorted(set(found_dates) | set(_dates_from_dateutil(fname)))
+
+    if hint == DATE_HINT_SINGLE:
+        found_dates = found_dates[:1]
+    elif hint == DATE_HINT_RANGE and found_dates:
+        if len(found_dates) == 1:
+            logger.warning(f"Expected a date range in '{fname}' but found one date, using it as start and end.")
+        found_dates = [found_dates[0], found_dates[-1]]
+    return tuple(found_dates)
+
+
+def find_report_dates(fname, hint=None, allow_fallback=True):
+    """
+    The one place handlers get the dates embedded in a report filename.
+    Results are cached by filename so repeated lookups for the same file cost nothing.
+
+    :param fname: Filename, usually without the suffix
+    :type fname: str or Path
+    :param hint: None for every date found, DATE_HINT_SINGLE or DATE_HINT_RANGE
+    :type hint: str or None
+    :param allow_fallback: Let dateutil look at the name when the fast scan does not find enough dates
+    :type allow_fallback: bool
+    :return: Sorted dates. For DATE_HINT_RANGE [start, end], for DATE_HINT_SINGLE one date. Empty if none found.
+    :rtype: list of datetime.date
+    """
+    # checked before the caught lookup so a handler passing a bad hint fails loudly instead of getting None
+    if hint not in (None, DATE_HINT_SINGLE, DATE_HINT_RANGE):
+        raise ValueError(f"Unknown date hint: {hint}")
+    return _lookup_report_dates(str(fname), hint, allow_fallback)
 
-    # If no valid dates found, return an empty list
-    if not found_dates:
-        return []
-
-    # Convert the date strings to datetime objects and sort them
-    date_objects = [datetime.strptime(date, "%Y-%m-%d") for date in found_dates]
-    extracted_dates = sorted(date_objects)
 
-    # Convert the sorted datetime objects back to strings
-    sorted_date_strings = [date.strftime("%Y-%m-%d") for date in extracted_dates]
+@logger.catch()
+def _lookup_report_dates(fname, hint, allow_fallback):
+    return list(_cached_report_dates(fname, hint, allow_fallback))
 
-    return sorted_date_strings
 
 @logger.catch()
 def extract_date_from_filename(fname):
-    """the filename contains the date the report was run.
-    extract and return the date string
-    # TODO return a list of all dates found in filename
     """
-    datestring = "xxxxxxxx"
-    logger.debug("Processing: " + str(fname))
-    parts = str(fname).replace("_", "-").split("-")
-    logger.debug(f"fname split result: {parts}")
-    for part in parts:
-        try:
-            datestring = parse(part).strftime("%Y%m%d")
-        except ParserError as e:
-            logger.debug(f"Date not found Error: {e}")
-    reds = extract_date_from_filename_using_regularExpressions(fname)
-    if datestring == "xxxxxxxx":
-        if reds == "xxxxxxxx":
-            logger.error(f"No datestring found.")
-        else:
-            return reds
-    return datestring
+    The filename contains the date the report was run.
+
+    :param fname: Filename, usually without the suffix
+    :type fname: str or Path
+    :return: The report date as 'YYYYMMDD' or 'xxxxxxxx' if no date was found.
+    :rtype: str
+    """
+    found_dates = find_report_dates(fname, hint=DATE_HINT_SINGLE)
+    if not found_dates:
+        logger.error(f"No datestring found in {fname}.")
+        return NO_DATE_STRING
+    return found_dates[0].strftime("%Y%m%d")
+
 
 @logger.catch()
 def extract_date_from_filename_using_regularExpressions(fname):
+    """
+    Same as extract_date_from_filename() without the dateutil fallback.
 
-    # The filename contains the date the report was run.
-    # Extract and return the date string.
-
-    datestring = "xxxxxxxx"
-    logger.debug("Processing: " + str(fname))
-
-    # Regular expression patterns for different date formats
-    date_patterns = [
-        r"\b\d{4}-\d{2}-\d{2}\b",  # YYYY-MM-DD
-        r"\b\d{2}-\d{2}-\d{4}\b",  # DD-MM-YYYY
-        r"\b\d{4}_\d{2}_\d{2}\b",  # YYYY_MM_DD
-        r"\b\d{2}_\d{2}_\d{4}\b",  # DD_MM_YYYY
-        r"\b\d{8}\b",  # YYYYMMDD or DDMMYYYY
-    ]
-
-    for pattern in date_patterns:
-        match = re.search(pattern, fname)
-        if match:
-            date_str = match.group()
-            logger.debug(f"Found date string: {date_str}")
-            try:
-                # Attempt to parse the date string
-                datestring = parse(date_str).strftime("%Y%m%d")
-                break
-            except ParserError as e:
-                logger.debug(f"Date parsing error: {e}")
-
-    if datestring == "xxxxxxxx":
+    :param fname: Filename, usually without the suffix
+    :type fname: str or Path
+    :return: The report date as 'YYYYMMDD' or 'xxxxxxxx' if no date was found.
+    :rtype: str
+    """
+    found_dates = find_report_dates(fname, hint=DATE_HINT_SINGLE, allow_fallback=False)
+    if not found_dates:
         logger.debug("No valid date found in filename.")
-
-    return datestring
+        return NO_DATE_STRING
+    return found_dates[0].strftime("%Y%m%d")
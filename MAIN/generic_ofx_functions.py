@@ -0,0 +1,472 @@
+"""
+Defines a parser for OFX/QBO bank downloads.
+
+QBO files are OFX 1.x SGML: aggregates such as <STMTTRN> have closing tags but plain values such as
+<TRNAMT>-12.50 usually do not. The tokenizer below builds a tree of elements that keeps the original
+tag order, repeated tags and any closing tags so the file can be written back out after changes.
+Transactions are exposed as typed records (dates as datetimes, amounts as Decimal) and indexed by FITID
+so that overlapping downloads can be merged without repeating transactions already imported.
+"""
+
+from loguru import logger
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+import copy
+import re
+import sqlite3
+
+# <TAG>value  or  </TAG>   (value runs up to the next tag)
+OFX_TOKEN = re.compile(r"<(/?)([A-Za-z0-9_.]+)>([^<]*)")
+OFX_DATETIME = re.compile(
+    r"^(\d{4})(\d{2})(\d{2})(?:(\d{2})(\d{2})(?:(\d{2})(?:\.(\d{1,3}))?)?)?\s*(?:\[([+-]?\d+(?:\.\d+)?)(?::[^\]]*)?\])?$"
+)
+TRANSACTION_TAG = "STMTTRN"
+TRANSACTION_LIST_TAG = "BANKTRANLIST"
+
+
+class OFXElement:
+    """
+    A single OFX element. Aggregates hold children, leaves hold a value.
+
+    :param tag: The element tag name, e.g. 'STMTTRN' or 'TRNAMT'.
+    :type tag: str
+    :param value: The text value for leaf elements, None for aggregates.
+    :type value: str or None
+    :param closed: True if a leaf element was written with an explicit closing tag.
+    :type closed: bool
+    """
+
+    __slots__ = ("tag", "value", "children", "closed")
+
+    def __init__(self, tag, value=None, closed=False):
+        self.tag = tag
+        self.value = value
+        self.children = []
+        self.closed = closed
+
+    @property
+    def is_aggregate(self):
+        return self.value is None
+
+    def find(self, tag):
+        """Return the first descendant element with the given tag, or None."""
+        for child in self.children:
+            if child.tag == tag:
+                return child
+            found = child.find(tag)
+            if found is not None:
+                return found
+        return None
+
+    def find_all(self, tag):
+        """Yield every descendant element with the given tag in document order."""
+        for child in self.children:
+            if child.tag == tag:
+                yield child
+            else:
+                yield from child.find_all(tag)
+
+    def get(self, tag, default=None):
+        """Return the value of the first direct child leaf with the given tag."""
+        for child in self.children:
+            if child.tag == tag and not child.is_aggregate:
+                return child.value
+        return default
+
+    def set(self, tag, value):
+        """Set the value of a direct child leaf, appending the leaf if it does not exist yet."""
+        for child in self.children:
+            if child.tag == tag and not child.is_aggregate:
+                child.value = value
+                return
+        self.children.append(OFXElement(tag, value))
+
+    def serialize(self, lines):
+        """Append the SGML lines for this element to the list provided."""
+        if self.is_aggregate:
+            lines.append(f"<{self.tag}>")
+            for child in self.children:
+                child.serialize(lines)
+            lines.append(f"</{self.tag}>")
+        else:
+            closing = f"</{self.tag}>" if self.closed else ""
+            lines.append(f"<{self.tag}>{self.value}{closing}")
+
+
+@logger.catch()
+def parse_ofx_datetime(text):
+    """
+    Convert an OFX date string like '20240131', '20240131120000.000' or '20240131120000[-5:EST]' to a datetime.
+
+    :param text: The OFX date value.
+    :type text: str
+    :return: A datetime, timezone aware when the value carries an offset. None if the value is not a date.
+    :rtype: datetime or None
+    """
+    if not text:
+        return None
+    match = OFX_DATETIME.match(text.strip())
+    if not match:
+        logger.debug(f"Not an OFX date: {text}")
+        return None
+    year, month, day, hour, minute, second, millis, offset = match.groups()
+    tzinfo = None
+    if offset is not None:
+        tzinfo = timezone(timedelta(hours=float(offset)))
+    try:
+        return datetime(
+            int(year), int(month), int(day),
+            int(hour or 0), int(minute or 0), int(second or 0),
+            int((millis or "0").ljust(3, "0")) * 1000,
+            tzinfo=tzinfo,
+        )
+    except ValueError:
+        logger.debug(f"Invalid OFX date: {text}")
+        return None
+
+
+class OFXTransaction:
+    """
+    Typed view of a <STMTTRN> aggregate. Changes made through set() are written back to the element.
+
+    :param element: The STMTTRN element.
+    :type element: OFXElement
+    """
+
+    def __init__(self, element):
+        self.element = element
+
+    def get(self, tag, default=None):
+        return self.element.get(tag, default)
+
+    def set(self, tag, value):
+        self.element.set(tag, value)
+
+    @property
+    def fitid(self):
+        return self.element.get("FITID")
+
+    @property
+    def trntype(self):
+        return self.element.get("TRNTYPE")
+
+    @property
+    def name(self):
+        return self.element.get("NAME")
+
+    @property
+    def memo(self):
+        return self.element.get("MEMO")
+
+    @property
+    def dtposted(self):
+        return parse_ofx_datetime(self.element.get("DTPOSTED"))
+
+    @property
+    def trnamt(self):
+        try:
+            return Decimal(self.element.get("TRNAMT", "").strip())
+        except InvalidOperation:
+            return None
+
+    def __repr__(self):
+        return f"OFXTransaction(fitid={self.fitid!r}, dtposted={self.get('DTPOSTED')!r}, trnamt={self.get('TRNAMT')!r}, name={self.name!r})"
+
+
+class QBODocument:
+    """
+    A parsed QBO file: the plain text header followed by the OFX element tree.
+
+    :param header: Everything before the first tag (OFXHEADER:100, DATA:OFXSGML, ...).
+    :type header: str
+    :param root: A pseudo element holding the top level elements, normally a single <OFX>.
+    :type root: OFXElement
+    """
+
+    def __init__(self, header, root):
+        self.header = header
+        self.root = root
+
+    @property
+    def account_id(self):
+        element = self.root.find("ACCTID")
+        return element.value if element is not None else None
+
+    @property
+    def statement_start(self):
+        element = self.root.find("DTSTART")
+        return element.value if element is not None else None
+
+    @property
+    def statement_end(self):
+        element = self.root.find("DTEND")
+        return element.value if element is not None else None
+
+    @property
+    def transaction_lists(self):
+        return list(self.root.find_all(TRANSACTION_LIST_TAG))
+
+    @property
+    def transactions(self):
+        """All transactions in document order."""
+        return [OFXTransaction(element) for element in self.root.find_all(TRANSACTION_TAG)]
+
+    @property
+    def fitid_index(self):
+        """Transactions keyed by FITID. The first transaction wins if a FITID is repeated."""
+        index = {}
+        for transaction in self.transactions:
+            index.setdefault(transaction.fitid, transaction)
+        return index
+
+    def filter(self, predicate):
+        """
+        Return a copy of this document keeping only the transactions for which predicate(transaction) is True.
+
+        :param predicate: Function taking an OFXTransaction and returning a bool.
+        :type predicate: callable
+        :return: A new document.
+        :rtype: QBODocument
+        """
+        filtered = copy.deepcopy(self)
+        for parent in filtered._transaction_parents():
+            parent.children = [
+                child for child in parent.children
+                if child.tag != TRANSACTION_TAG or predicate(OFXTransaction(child))
+            ]
+        return filtered
+
+    def deduplicate(self, seen_fitids=None):
+        """
+        Return a copy without repeated FITIDs and without any FITID in seen_fitids.
+
+        :param seen_fitids: FITIDs already imported, defaults to none.
+        :type seen_fitids: set or None
+        :return: A new document.
+        :rtype: QBODocument
+        """
+        seen = set(seen_fitids or ())
+
+        def first_time_seen(transaction):
+            if transaction.fitid in seen:
+                return False
+            seen.add(transaction.fitid)
+            return True
+
+        return self.filter(first_time_seen)
+
+    def _transaction_parents(self):
+        """Yield every element that directly holds STMTTRN elements."""
+        stack = [self.root]
+        while stack:
+            element = stack.pop()
+            if any(child.tag == TRANSACTION_TAG for child in element.children):
+                yield element
+            stack.extend(child for child in element.children if child.is_aggregate)
+
+    def serialize(self):
+        """
+        Write the document back to QBO text, one tag per line.
+
+        :return: The QBO file contents.
+        :rtype: str
+        """
+        lines = []
+        for element in self.root.children:
+            element.serialize(lines)
+        header = self.header.rstrip("\r\n")
+        body = "\n".join(lines)
+        return f"{header}\n\n{body}\n" if header else f"{body}\n"
+
+
+@logger.catch()
+def parse_qbo(text):
+    """
+    Tokenize QBO/OFX text into a QBODocument.
+
+    :param text: The complete contents of a QBO file.
+    :type text: str
+    :return: The parsed document.
+    :rtype: QBODocument
+    """
+    first_tag = text.find("<")
+    if first_tag < 0:
+        logger.error("No OFX tags found in QBO text.")
+        return QBODocument(text, OFXElement("ROOT"))
+    header = text[:first_tag]
+    root = OFXElement("ROOT")
+    stack = [root]
+    last_leaf = None  # leaf that may be followed by its own closing tag (XML style OFX)
+
+    for closing, tag, text_value in OFX_TOKEN.findall(text, first_tag):
+        if closing:
+            if last_leaf is not None and last_leaf.tag == tag:
+                last_leaf.closed = True
+                last_leaf = None
+                continue
+            last_leaf = None
+            if not any(element.tag == tag for element in stack[1:]):
+                logger.warning(f"Unmatched closing tag </{tag}> ignored.")
+                continue
+            # close the aggregate, anything still open inside it was really an empty leaf
+            while stack[-1].tag != tag:
+                _demote_to_empty_leaf(stack.pop(), stack[-1])
+            stack.pop()
+            continue
+
+        value = text_value.strip()
+        if value:
+            last_leaf = OFXElement(tag, value)
+            stack[-1].children.append(last_leaf)
+        else:
+            element = OFXElement(tag)
+            stack[-1].children.append(element)
+            stack.append(element)
+            last_leaf = None
+
+    while len(stack) > 1:  # tolerate truncated files
+        element = stack.pop()
+        if not element.children:
+            _demote_to_empty_leaf(element, stack[-1])
+
+    document = QBODocument(header, root)
+    logger.debug(f"Parsed QBO for account {document.account_id} with {len(document.transactions)} transactions.")
+    return document
+
+
+def _demote_to_empty_leaf(element, parent):
+    """An open tag with no value that was never closed is an empty leaf. Hand its children back to the parent."""
+    position = parent.children.index(element)
+    parent.children[position + 1:position + 1] = element.children
+    element.children = []
+    element.value = ""
+
+
+@logger.catch()
+def read_qbo_file(file_path: Path):
+    """
+    Read and parse a QBO file.
+
+    :param file_path: The QBO file to read.
+    :type file_path: Path
+    :return: The parsed document or None if the file could not be read.
+    :rtype: QBODocument or None
+    """
+    try:
+        text = Path(file_path).read_text()
+    except (FileNotFoundError, PermissionError) as e:
+        logger.error(f"Could not read {file_path}: {e}")
+        return None
+    return parse_qbo(text)
+
+
+def merge_qbo_documents(documents):
+    """
+    Merge overlapping downloads for the same account. Transactions are kept once per FITID
+    and the statement date range is widened to cover every document.
+
+    :param documents: Parsed documents, the first one is used as the template for the result.
+    :type documents: list of QBODocument
+    :return: The merged document, or None if no documents were given.
+    :rtype: QBODocument or None
+    :raises ValueError: If the documents belong to different accounts.
+    """
+    documents = [document for document in documents if document is not None]
+    if not documents:
+        return None
+    accounts = {document.account_id for document in documents}
+    if len(accounts) > 1:
+        raise ValueError(f"Cannot merge QBO files from different accounts: {sorted(accounts, key=str)}")
+
+    merged = documents[0].deduplicate()
+    transaction_lists = merged.transaction_lists
+    if not transaction_lists:
+        logger.error("Template QBO document has no transaction list to merge into.")
+        return merged
+    target = transaction_lists[0]
+    seen = set(merged.fitid_index)
+    added = 0
+    for document in documents[1:]:
+        for transaction in document.transactions:
+            if transaction.fitid in seen:
+                continue
+            seen.add(transaction.fitid)
+            target.children.append(copy.deepcopy(transaction.element))
+            added += 1
+
+    # keep transactions in posting order
+    transactions = [child for child in target.children if child.tag == TRANSACTION_TAG]
+    others = [child for child in target.children if child.tag != TRANSACTION_TAG]
+    transactions.sort(key=lambda element: element.get("DTPOSTED", ""))
+    target.children = others + transactions
+
+    # widen the statement period to cover every document
+    starts = [document.statement_start for document in documents if document.statement_start]
+    ends = [document.statement_end for document in documents if document.statement_end]
+    if starts:
+        target.set("DTSTART", min(starts))
+    if ends:
+        target.set("DTEND", max(ends))
+    logger.debug(f"Merged {len(documents)} QBO documents, {added} transactions added from overlapping files.")
+    return merged
+
+
+class FITIDLedger:
+    """
+    Local record of every transaction FITID already written to a QBO file, per account.
+
+    Bank downloads overlap when date ranges are re-downloaded. Checking new downloads against
+    the ledger means only transactions that were never written before end up in the next QBO file.
+
+    :param database: Path to the SQLite file holding the ledger. It is created if it does not exist.
+    :type database: str or Path
+    """
+
+    def __init__(self, database):
+        self.database = Path(database)
+        self.database.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(self.database), timeout=30)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS fitid_ledger ("
+            "acctid TEXT NOT NULL, fitid TEXT NOT NULL, dtposted TEXT, trnamt TEXT, "
+            "output_file TEXT, recorded_at TEXT NOT NULL, PRIMARY KEY (acctid, fitid))"
+        )
+        self._connection.commit()
+
+    def seen_fitids(self, acctid):
+        """
+        Return every FITID already written for an account.
+
+        :param acctid: The account number.
+        :type acctid: str
+        :rtype: set[str]
+        """
+        rows = self._connection.execute("SELECT fitid FROM fitid_ledger WHERE acctid = ?", (str(acctid),))
+        return {row[0] for row in rows}
+
+    def record(self, acctid, transactions, output_file):
+        """
+        Add transactions to the ledger once they have been written.
+
+        :param acctid: The account number.
+        :type acctid: str
+        :param transactions: The transactions written.
+        :type transactions: list of OFXTransaction
+        :param output_file: Name of the QBO file they were written to.
+        :type output_file: str
+        """
+        recorded_at = datetime.now().isoformat(timespec="seconds")
+        self._connection.executemany(
+            "INSERT OR IGNORE INTO fitid_ledger (acctid, fitid, dtposted, trnamt, output_file, recorded_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (str(acctid), t.fitid, t.get("DTPOSTED"), t.get("TRNAMT"), str(output_file), recorded_at)
+                for t in transactions
+            ],
+        )
+        self._connection.commit()
+        logger.debug(f"Ledger recorded {len(transactions)} FITIDs for account {acctid}.")
+
+    def close(self):
+        self._connection.close()
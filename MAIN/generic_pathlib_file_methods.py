@@ -8,6 +8,7 @@ import re
 import os
 import time
 import unicodedata
+from generic_pipeline_sinks import get_sinks
 
 # List of valid SUFFIXs (expand as needed)
 VALID_SUFFIXS = {
@@ -98,6 +99,8 @@ def move_file(source: Path, destination: Path) -> bool:
     if not source.exists():
         logger.error(f"Source file {source} does not exist.")
         raise FileNotFoundError(f"Source file {source} does not exist.")
+    if not get_sinks().archive(source, destination):
+        return True
     
     try:
         destination.parent.mkdir(parents=True, exist_ok=True)
@@ -199,6 +202,8 @@ def move_file_with_check(source: Path, destination: Path, retries: int = 3, dela
     
     if not source.is_file():
         raise FileNotFoundError(f"Source file does not exist: {source}")
+    if not get_sinks().archive(source, destination):
+        return True
     
     attempt = 0
     while attempt < retries:
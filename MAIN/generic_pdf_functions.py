@@ -1,37 +1,177 @@
+import os
+import shutil
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from loguru import logger
 from pathlib import Path
 import pdfplumber
 import pandas as pd
+from generic_pipeline_sinks import get_sinks
+
+
+WKHTMLTOPDF_PATH_VARIABLE = "WKHTMLTOPDF_PATH"  # environment variable naming the executable
+WKHTMLTOPDF_WINDOWS_PATH = Path(r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe")
+HTML_RENDER_WORKERS = max(1, min(4, (os.cpu_count() or 1) // 2))  # renderer processes running at the same time
+HTML_RENDER_TIMEOUT = 60  # seconds allowed per page in a batch
+
+
+def find_wkhtmltopdf():
+    """
+    Locate wkhtmltopdf: the WKHTMLTOPDF_PATH environment variable, the PATH, then the default Windows install.
+
+    :return: The executable, None when it is not installed
+    :rtype: Path or None
+    """
+    configured = os.environ.get(WKHTMLTOPDF_PATH_VARIABLE)
+    if configured and Path(configured).exists():
+        return Path(configured)
+    found = shutil.which("wkhtmltopdf")
+    if found:
+        return Path(found)
+    return WKHTMLTOPDF_WINDOWS_PATH if WKHTMLTOPDF_WINDOWS_PATH.exists() else None
+
+
+def stdin_argument(path):
+    """
+    Quote a path for wkhtmltopdf --read-args-from-stdin, whose parser reads a backslash as an escape.
+    Without escaping, the separators of a Windows path such as D:\\Users\\Conrad would be lost.
+    """
+    escaped = str(Path(path)).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+class WkhtmltopdfRenderer:
+    """
+    Convert a batch of pages with one wkhtmltopdf process, which reads one conversion per line from stdin.
+    Process start up is paid once per batch instead of once per page.
+
+    :param executable: wkhtmltopdf, found with find_wkhtmltopdf() when not given
+    :type executable: str or Path or None
+    :param timeout: Seconds allowed per page
+    :type timeout: float
+    """
+
+    name = "wkhtmltopdf"
+
+    def __init__(self, executable=None, timeout=HTML_RENDER_TIMEOUT):
+        self.executable = Path(executable) if executable else find_wkhtmltopdf()
+        if self.executable is None:
+            raise FileNotFoundError(f"wkhtmltopdf was not found, install it or set {WKHTMLTOPDF_PATH_VARIABLE}")
+        self.timeout = timeout
+
+    def render_batch(self, pages):
+        """
+        :param pages: (html_file, output_pdf) pairs
+        :type pages: list of tuple
+        :return: Seconds spent on each page, keyed by output_pdf
+        :rtype: dict
+        """
+        arguments = "".join(f"{stdin_argument(html)} {stdin_argument(pdf)}\n" for html, pdf in pages)
+        started = time.time()
+        subprocess.run([str(self.executable), "--quiet", "--read-args-from-stdin"], input=arguments, text=True,
+                       check=True, timeout=self.timeout * len(pages))
+        # pages are rendered in order and each PDF is written when its page is done
+        timings, previous = {}, started
+        for html, pdf in pages:
+            finished = Path(pdf).stat().st_mtime
+            timings[Path(pdf)] = max(finished - previous, 0.0)
+            previous = max(finished, previous)
+        return timings
+
+
+class WeasyPrintRenderer:
+    """Convert pages in this process with WeasyPrint, no executable needed. Requires the weasyprint package."""
+
+    name = "weasyprint"
+
+    def __init__(self):
+        from weasyprint import HTML  # optional dependency, only needed when this renderer is chosen
+        self._html = HTML
+
+    def render_batch(self, pages):
+        timings = {}
+        for html, pdf in pages:
+            started = time.perf_counter()
+            self._html(filename=str(html)).write_pdf(str(pdf))
+            timings[Path(pdf)] = time.perf_counter() - started
+        return timings
+
+
+HTML_RENDERERS = {
+    "wkhtmltopdf": WkhtmltopdfRenderer,
+    "weasyprint": WeasyPrintRenderer,
+}
+
+
+def get_html_renderer(name=None):
+    """
+    The named renderer, or the first one that is installed.
+
+    :param name: A key of HTML_RENDERERS
+    :type name: str or None
+    :rtype: WkhtmltopdfRenderer or WeasyPrintRenderer
+    """
+    if name:
+        return HTML_RENDERERS[name]()
+    for renderer in HTML_RENDERERS.values():
+        try:
+            return renderer()
+        except (FileNotFoundError, ImportError) as e:
+            logger.debug(f"HTML renderer {renderer.name} is not available: {e}")
+    raise FileNotFoundError(f"No HTML to PDF renderer is installed, install wkhtmltopdf or weasyprint")
+
+
+def convert_html_batch(pages, renderer=None, workers=HTML_RENDER_WORKERS):
+    """
+    Convert many HTML files to PDF. The pages are split into one batch per worker and the batches run in parallel.
+
+    :param pages: (html_file, output_pdf) pairs
+    :type pages: list of tuple
+    :param renderer: From get_html_renderer(), the first installed renderer when not given
+    :param workers: Batches converted at the same time
+    :type workers: int
+    :return: Seconds spent on each page, keyed by output_pdf. Failed batches are logged and left out. Pages the
+        sinks keep from being written, as in a dry run, count as done in 0 seconds.
+    :rtype: dict
+    """
+    for html, pdf in pages:
+        if not Path(html).exists():
+            raise FileNotFoundError(f"The file {html} does not exist.")
+    skipped = {Path(pdf): 0.0 for html, pdf in pages if not get_sinks().output(pdf)}
+    pages = [(Path(html), Path(pdf)) for html, pdf in pages if Path(pdf) not in skipped]
+    if not pages:
+        return skipped
+    renderer = renderer or get_html_renderer()
+    workers = max(1, min(workers, len(pages)))
+    batches = [pages[start::workers] for start in range(workers)]
+    timings = {}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="html-to-pdf") as pool:
+        futures = {pool.submit(renderer.render_batch, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            try:
+                timings.update(future.result())
+            except (subprocess.SubprocessError, OSError) as e:
+                logger.error(f"Failed to convert {[str(html) for html, pdf in futures[future]]} to PDF. Error: {e}")
+    elapsed = time.perf_counter() - started
+    for pdf, seconds in timings.items():
+        logger.debug(f"Rendered {pdf.name} in {seconds:.3f}s")
+    logger.info(f"Converted {len(timings)} of {len(pages)} HTML pages with {renderer.name} in {elapsed:.2f}s "
+                f"using {workers} workers")
+    return {**skipped, **timings}
 
 
 @logger.catch()
-def convert_html_to_pdf(html_file, output_pdf):
+def convert_html_to_pdf(html_file, output_pdf, renderer=None):
     """
-    Converts an HTML file to a PDF using wkhtmltopdf.
+    Converts an HTML file to a PDF using wkhtmltopdf, or WeasyPrint when wkhtmltopdf is not installed.
     
     :param html_file: Path to the HTML file.
     :param output_pdf: Path where the PDF will be saved.
     """
-    wkhtmltopdf_path = r"C:\\Program Files\\wkhtmltopdf\\bin\\wkhtmltopdf.exe"  # Update this if your wkhtmltopdf is in a different location
-    
-    # Verify that the HTML file exists
-    html_path = Path(html_file)
-    if not html_path.exists():
-        raise FileNotFoundError(f"The file {html_file} does not exist.")
-    
-    # Convert HTML to PDF
-    command = [
-        wkhtmltopdf_path,
-        str(html_path),
-        str(output_pdf)
-    ]
-    
-    try:
-        subprocess.run(command, check=True)
-        print(f"Successfully converted {html_file} to {output_pdf}.")
-    except subprocess.CalledProcessError as e:
-        print(f"Failed to convert {html_file} to PDF. Error: {e}")
+    if convert_html_batch([(html_file, output_pdf)], renderer, workers=1):
+        logger.info(f"Successfully converted {html_file} to {output_pdf}.")
 
 
 @logger.catch()
@@ -47,6 +187,8 @@ def print_pdf(file_path, printer_name, page_range="1-2"):
     
     # Verify that the file exists
     pdf_path = Path(file_path)
+    if not get_sinks().print_job(pdf_path, printer_name):
+        return  # checked first, a dry run never wrote the PDF
     if not pdf_path.exists():
         raise FileNotFoundError(f"The file {file_path} does not exist.")
     
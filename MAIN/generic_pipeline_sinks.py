@@ -0,0 +1,162 @@
+"""
+Injectable destinations for everything a handler does besides parsing.
+
+Handlers write spreadsheets and PDFs, send them to a printer, move the source file into an archive and
+append to the local stores. The generic functions that do those things ask the current sinks first:
+every sink method returns True when the real side effect should happen.
+
+SystemSinks, the default, lets everything happen. DryRunSinks keeps the outputs in memory and records
+the print jobs, moves and store writes without doing them, so a handler can run in a tight loop for
+profiling or regression tests and its results can be inspected as DataFrames.
+
+    with use_sinks(DryRunSinks()) as sinks:
+        Handler_PayRange.data_handler_process(path)
+    sinks.frames()[Path("temp.xlsx")]
+"""
+
+from loguru import logger
+from pathlib import Path
+from contextlib import contextmanager
+from contextvars import ContextVar
+import pandas as pd
+
+
+class SystemSinks:
+    """The normal pipeline: files are written, printed, moved and stored."""
+
+    writes_files = True  # callers skip waits that only exist for slow disks and spreadsheet programs
+
+    def output(self, path, content=None):
+        """
+        A file is about to be written.
+
+        :param path: Where the file would be written
+        :type path: Path
+        :param content: The DataFrame or text being written, when the caller has it
+        :return: True to write the file
+        :rtype: bool
+        """
+        return True
+
+    def print_job(self, path, printer=None):
+        """
+        A file is about to be sent to a printer.
+
+        :return: True to print
+        :rtype: bool
+        """
+        return True
+
+    def archive(self, source, destination):
+        """
+        A file is about to be moved.
+
+        :return: True to move the file
+        :rtype: bool
+        """
+        return True
+
+    def record(self, store, payload):
+        """
+        A persistent store such as the revenue history is about to be written.
+
+        :param store: Name of the store
+        :type store: str
+        :param payload: What would be written
+        :return: True to write to the store
+        :rtype: bool
+        """
+        return True
+
+
+class DryRunSinks(SystemSinks):
+    """
+    In-memory output, a null printer and a no-op mover.
+    Everything the handler tried to do is kept in 'events' in the order it happened.
+    """
+
+    writes_files = False
+
+    def __init__(self):
+        self.outputs = {}  # path -> content, the last write to a path wins
+        self.printed = []
+        self.moves = []
+        self.records = []
+        self.events = []
+
+    def output(self, path, content=None):
+        path = Path(path)
+        self.outputs[path] = content.copy() if isinstance(content, pd.DataFrame) else content
+        self.events.append(("output", path))
+        logger.debug(f"Dry run: captured output {path}")
+        return False
+
+    def print_job(self, path, printer=None):
+        self.printed.append((Path(path), printer))
+        self.events.append(("print", Path(path)))
+        logger.debug(f"Dry run: skipped printing {path}")
+        return False
+
+    def archive(self, source, destination):
+        self.moves.append((Path(source), Path(destination)))
+        self.events.append(("archive", Path(source)))
+        logger.debug(f"Dry run: skipped moving {source} to {destination}")
+        return False
+
+    def record(self, store, payload):
+        self.records.append((store, payload))
+        self.events.append(("record", store))
+        return False
+
+    def frames(self):
+        """
+        The DataFrames the handler produced.
+
+        :return: {output path: DataFrame}
+        :rtype: dict
+        """
+        return {path: content for path, content in self.outputs.items() if isinstance(content, pd.DataFrame)}
+
+
+_current_sinks = ContextVar("pipeline_sinks", default=SystemSinks())
+
+
+def get_sinks():
+    """
+    The sinks side effects should be checked against.
+
+    :rtype: SystemSinks
+    """
+    return _current_sinks.get()
+
+
+@contextmanager
+def use_sinks(sinks):
+    """
+    Route side effects to the given sinks for the duration of the with block.
+
+    :param sinks: Usually a DryRunSinks
+    :type sinks: SystemSinks
+    :return: The sinks, for inspection after the block
+    """
+    token = _current_sinks.set(sinks)
+    try:
+        yield sinks
+    finally:
+        _current_sinks.reset(token)
+
+
+def dry_run(handler_process, file_path):
+    """
+    Run one handler on one file without any side effects.
+
+    :param handler_process: A handler's data_handler_process
+    :type handler_process: callable
+    :param file_path: The report to process
+    :type file_path: Path
+    :return: The sinks holding the outputs. The handler's return value is in 'result'.
+    :rtype: DryRunSinks
+    """
+    with use_sinks(DryRunSinks()) as sinks:
+        sinks.result = handler_process(Path(file_path))
+    return sinks
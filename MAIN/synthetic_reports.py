@@ -0,0 +1,332 @@
+"""
+Synthetic vendor reports for benchmarks and tests.
+
+Each writer produces files laid out like the real downloads, named so the matching handler's FileMatcher
+accepts them, with realistic value formats ("$1,234.50", "(12.50)", padded machine IDs, declined rows...).
+Values come from a seeded generator so the same scale always produces the same files.
+
+Large files are written block by block so a 10 million row report never has to fit in memory.
+"""
+
+from loguru import logger
+from pathlib import Path
+from datetime import date, datetime, timedelta
+import zipfile
+import numpy as np
+import pandas as pd
+
+BLOCK_ROWS = 250_000  # rows generated and written at a time
+REPORT_DATE = date(2024, 6, 30)
+PERIOD_START = date(2024, 6, 1)
+TOUCHTUNES_CATEGORIES = [
+    "1 Credit Jukebox", "Multi-Credit Jukebox", "Mobile", "Karaoke", "Photobooth", "Unused credits",
+    "Cleared credits", "Total Revenue Breakdown", "Bill", "Coin", "Subtotal (Bill + Coin)", "Linked",
+    "CC/3rd Party", "Mobile", "Total Revenue", "1 Credit Jukebox (music)", "Multi-Credit Jukebox (music)",
+    "Mobile", "Karaoke service", "Karaoke BGM", "Karaoke plays", "Photobooth print", "Other fees",
+    "Total Revenues", "Total fees", "Total to split", "Location split", "Operator split",
+]
+TOUCHTUNES_MAX_FILES = 1000  # one jukebox per file, so large scales are capped at this many files
+TOUCHTUNES_JUKEBOX_IDS = ["CAD5EC", "B2EC1F", "42E849", "0A94D3", "0A7F11", "0A8A0B"]
+PDF_LINES_PER_PAGE = 60
+QBO_MEMOS = [
+    "POS DB KROGER #{n} LOUISVILLE KY",
+    "ACH NAYAX REIM {n}",
+    "DEBIT {n} SPEEDWAY {n} SELLERSBURG",
+    "CKCD 5542 CIRCLE K {n}",
+    "ONLINE TRANSFER TO SAVINGS {n}",
+    "AC-PAYRANGE INC DEPOSIT {n}",
+]
+
+
+def _money_text(values, parentheses_for_negative=False):
+    """Format amounts the way vendor CSV exports do, '$1,234.50'."""
+    text = pd.Series(np.abs(values)).map("${:,.2f}".format)
+    negative = values < 0
+    if parentheses_for_negative:
+        text[negative] = "(" + text[negative] + ")"
+    else:
+        text[negative] = "-" + text[negative]
+    return text.to_numpy()
+
+
+def _write_csv_blocks(path, rows, make_block, seed, header=True):
+    """
+    Write a CSV made of generated blocks.
+
+    :param make_block: Called with (rng, first_row, row_count), returns a DataFrame
+    :type make_block: callable
+    """
+    rng = np.random.default_rng(seed)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", newline="") as f:
+        for start in range(0, rows, BLOCK_ROWS):
+            block = make_block(rng, start, min(BLOCK_ROWS, rows - start))
+            block.to_csv(f, index=False, header=header and start == 0)
+    logger.debug(f"Wrote {rows} synthetic rows to {path.name}")
+    return path
+
+
+def _location_names(numbers):
+    return np.char.add("Location ", np.char.zfill(numbers.astype(str), 5))
+
+
+def write_pai_float_report(directory, rows, seed=0):
+    """PAI 'Terminal Status(w_FLOAT)' report, one terminal per row."""
+    def block(rng, start, n):
+        balance = rng.normal(2500, 900, n).round(2)
+        return pd.DataFrame({
+            "Device Number": np.char.add("L", (np.arange(start, start + n) + 100000).astype(str)),
+            "Location": _location_names(np.arange(start, start + n)),
+            "Reject Balance": _money_text(rng.choice([0.0, 20.0, 40.0], n, p=[0.9, 0.07, 0.03])),
+            "Balance": _money_text(balance, parentheses_for_negative=True),
+            "Today's Float": _money_text(rng.integers(0, 40, n) * 20.0),
+            "Route": rng.choice(["North", "South", "Downtown"], n),
+        })
+    name = f"Terminal Status(w_FLOAT)automated{REPORT_DATE:%m%d%Y}.csv"
+    return [_write_csv_blocks(Path(directory) / name, rows, block, seed)]
+
+
+def write_monthly_revenue_report(directory, rows, seed=0):
+    """PAI 'MonthlyRevenueByDevice' report. Terminals repeat once per month covered."""
+    terminals = max(1, rows // 3)
+
+    def block(rng, start, n):
+        terminal = np.arange(start, start + n) % terminals
+        withdrawals = rng.integers(0, 400, n)
+        surcharge = (withdrawals * 3.0).round(2)
+        return pd.DataFrame({
+            "Bill to Business Code": "CFSIV",
+            "Terminal": np.char.add("L", (terminal + 100000).astype(str)),
+            "Location": _location_names(terminal),
+            "SurWD Trxs": withdrawals,
+            "Inq Trxs": rng.integers(0, 50, n),
+            "Denial Trxs": rng.integers(0, 30, n),
+            "Reversal Trxs": rng.integers(0, 5, n),
+            "Total Trxs": withdrawals + 60,
+            "Total Surcharge": surcharge,
+            "Business Surcharge": (surcharge * 0.8).round(2),
+            "Total Interchange": (withdrawals * 0.15).round(2),
+            "Business Interchange": (withdrawals * 0.05).round(2),
+            "Business Addl Revenue": 0.0,
+            "Business Credits/Debits": 0.0,
+            "Business Total Income": (surcharge * 0.85).round(2),
+            "Non-Sur WD Trxs": rng.integers(0, 10, n),
+            "Total Dispensed Amount": (withdrawals * rng.normal(80, 20, n)).round(2),
+        })
+    name = f"MonthlyRevenueByDevice_{REPORT_DATE:%Y%m%d}.csv"
+    return [_write_csv_blocks(Path(directory) / name, rows, block, seed)]
+
+
+def write_atm_commission_report(directory, rows, seed=0):
+    """PAI 'ATM activity report for commissions', one location per row."""
+    def block(rng, start, n):
+        withdrawals = rng.integers(0, 600, n)
+        rate = rng.choice(["0.25", "0.50", "$1.00"], n)
+        return pd.DataFrame({
+            "Location": _location_names(np.arange(start, start + n)),
+            "WD Trxs": withdrawals,
+            "Surcharge WDs": (withdrawals * 0.9).astype(int),
+            "Settlement": _money_text((withdrawals * rng.normal(90, 25, n)).round(2)),
+            "Group": np.char.add("Commission Group, ", rate.astype(str)),
+        })
+    name = f"ATMActivityReportforcommissions_{REPORT_DATE:%Y%m%d}.csv"
+    return [_write_csv_blocks(Path(directory) / name, rows, block, seed)]
+
+
+def write_kiosoft_log(directory, rows, seed=0, machines=40):
+    """Kiosoft 'pay_at_machine_log', one card transaction per row."""
+    period_seconds = int((REPORT_DATE - PERIOD_START).days * 86400)
+
+    def block(rng, start, n):
+        when = pd.Timestamp(PERIOD_START) + pd.to_timedelta(np.sort(rng.integers(0, period_seconds, n)), unit="s")
+        return pd.DataFrame({
+            "Date Time": when.strftime("%Y-%m-%d %H:%M:%S"),
+            "Ultra S/N": 1,
+            "Machine": rng.choice(["W", "D"], n),
+            "Machine ID": np.char.zfill(rng.integers(1, machines + 1, n).astype(str), 3),
+            "Location ID": 9,
+            "Bank Card Number": "xxxx1234",
+            "Card Type": rng.choice(["V", "M", "A"], n),
+            "Location": " Laundry A ",
+            "Transaction Type": "Sale",
+            "Total Amount ($)": rng.choice([1.75, 2.50, 3.00, 4.25], n),
+            "Pre-Auth Amount ($)": 0,
+            "Set Pre-Auth Amount ($)": 0,
+            "Discount": 0,
+            "Special Amt": 0,
+            "Response Code": rng.choice([" APPROVAL ", "DECLINED", "Declined - insufficient funds"], n, p=[0.93, 0.05, 0.02]),
+        })
+    name = f"pay_at_machine_log_{PERIOD_START.isoformat()}_to_{REPORT_DATE.isoformat()}.csv"
+    return [_write_csv_blocks(Path(directory) / name, rows, block, seed)]
+
+
+def write_payrange_report(directory, rows, seed=0, machines=30):
+    """PayRange 'device_detail' report, one machine day per row followed by 5 summary rows."""
+    def block(rng, start, n):
+        mobile, cash, card = (rng.integers(0, 4000, (3, n)) / 100.0)
+        days = PERIOD_START + (np.arange(start, start + n) // machines) % 30 * timedelta(days=1)
+        return pd.DataFrame({
+            "date": [day.isoformat() for day in days],
+            "machine": np.char.add(" Washer ", (np.arange(start, start + n) % machines + 1).astype(str)),
+            "location": "Laundry A",
+            "mob_sales": _money_text(mobile),
+            "cash_sales": _money_text(cash),
+            "card_sales": _money_text(card),
+            "tot_sales": _money_text(mobile + cash + card),
+            "net": _money_text((mobile + cash + card) * 0.95),
+            "txn_count": rng.integers(0, 20, n),
+        })
+    path = Path(directory) / f"Laundry_A-device_detail_({PERIOD_START.isoformat()}_{REPORT_DATE.isoformat()}).csv"
+    _write_csv_blocks(path, rows, block, seed)
+    with path.open("a", newline="") as f:
+        for label in ("Subtotal", "Fees", "Refunds", "Adjustments", "Total"):
+            f.write(f"{label},,,$0.00,$0.00,$0.00,$0.00,$0.00,0\n")
+    return [path]
+
+
+def write_touchtunes_collections(directory, rows, seed=0):
+    """
+    TouchTunes 'Collection Details' reports. Each file is one jukebox collection of description,value
+    lines, so 'rows' is spread over rows // len(TOUCHTUNES_CATEGORIES) files, at most TOUCHTUNES_MAX_FILES.
+    """
+    rng = np.random.default_rng(seed)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    files = min(max(1, rows // len(TOUCHTUNES_CATEGORIES)), TOUCHTUNES_MAX_FILES)
+    paths = []
+    for number in range(files):
+        jukebox = TOUCHTUNES_JUKEBOX_IDS[number % len(TOUCHTUNES_JUKEBOX_IDS)]
+        collected = REPORT_DATE - timedelta(days=number // len(TOUCHTUNES_JUKEBOX_IDS))
+        amounts = _money_text(rng.integers(0, 50000, len(TOUCHTUNES_CATEGORIES)) / 100.0)
+        path = directory / f"Collection Details ({jukebox}) {collected.isoformat()}.csv"
+        path.write_text("".join(f'{category},"{amount}"\n' for category, amount in zip(TOUCHTUNES_CATEGORIES, amounts)))
+        paths.append(path)
+    return paths
+
+
+def write_wesbanco_qbo(directory, rows, seed=0):
+    """Wesbanco QBO (OFX SGML) export with one transaction per row."""
+    rng = np.random.default_rng(seed)
+    path = Path(directory) / f"Export-{REPORT_DATE:%Y%m%d}.qbo"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    start = datetime.combine(PERIOD_START, datetime.min.time())
+    with path.open("w", newline="") as f:
+        f.write("OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\n\n<OFX>\n<BANKMSGSRSV1>\n<STMTTRNRS>\n<STMTRS>\n<CURDEF>USD\n"
+                "<BANKACCTFROM>\n<BANKID>043400036\n<ACCTID>123456\n<ACCTTYPE>CHECKING\n</BANKACCTFROM>\n"
+                f"<BANKTRANLIST>\n<DTSTART>{PERIOD_START:%Y%m%d}\n<DTEND>{REPORT_DATE:%Y%m%d}\n")
+        for first in range(0, rows, BLOCK_ROWS):
+            n = min(BLOCK_ROWS, rows - first)
+            amounts = rng.normal(-40, 120, n).round(2)
+            memos = rng.integers(0, len(QBO_MEMOS), n)
+            numbers = rng.integers(100, 9999, n)
+            minutes = rng.integers(0, 30 * 24 * 60, n)
+            f.write("".join(
+                f"<STMTTRN>\n<TRNTYPE>{'CREDIT' if amount > 0 else 'DEBIT'}\n"
+                f"<DTPOSTED>{start + timedelta(minutes=int(minute)):%Y%m%d%H%M%S}.000\n<TRNAMT>{amount:.2f}\n"
+                f"<FITID>{first + i + 1000000}\n<NAME>{first + i + 1000000}\n"
+                f"<MEMO>{QBO_MEMOS[memo].format(n=number)}\n</STMTTRN>\n"
+                for i, (amount, memo, number, minute) in enumerate(zip(amounts, memos, numbers, minutes))
+            ))
+        f.write("</BANKTRANLIST>\n</STMTRS>\n</STMTTRNRS>\n</BANKMSGSRSV1>\n</OFX>\n")
+    logger.debug(f"Wrote {rows} synthetic transactions to {path.name}")
+    return [path]
+
+
+def _pdf_text(line):
+    return "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") Tj T*"
+
+
+def _write_text_pdf(f, lines):
+    """
+    A minimal PDF 1.4 of Helvetica text pages, written to a binary stream that does not need to seek.
+
+    :param lines: The text, PDF_LINES_PER_PAGE lines to a page
+    :type lines: list of str
+    """
+    pages = [lines[start:start + PDF_LINES_PER_PAGE] for start in range(0, len(lines), PDF_LINES_PER_PAGE)] or [[]]
+    offsets = []
+    position = 0
+
+    def write(data):
+        nonlocal position
+        f.write(data)
+        position += len(data)
+
+    def write_object(body):
+        offsets.append(position)
+        write(f"{len(offsets)} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    write(b"%PDF-1.4\n")
+    kids = " ".join(f"{4 + 2 * page} 0 R" for page in range(len(pages)))  # page objects follow the first three
+    write_object(b"<< /Type /Catalog /Pages 2 0 R >>")
+    write_object(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    write_object(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for page, page_lines in enumerate(pages):
+        content = ("BT /F1 9 Tf 11 TL 40 800 Td\n" + "\n".join(_pdf_text(line) for line in page_lines) + "\nET").encode()
+        write_object(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 3 0 R >> >> "
+                     f"/Contents {5 + 2 * page} 0 R >>".encode())
+        write_object(f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+    xref = position
+    write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+    write("".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode())
+    write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+
+def write_nayax_zip(directory, rows, seed=0, machines=25):
+    """
+    Nayax notifier ZIP. Like the real ones it holds PDF statements, one per machine here, with one vend
+    per text line. Each PDF is streamed straight into the archive.
+    """
+    period_seconds = int((REPORT_DATE - PERIOD_START).days * 86400)
+    rng = np.random.default_rng(seed)
+    path = Path(directory) / f"notifiernayaxcom_report_{REPORT_DATE:%Y%m%d}.zip"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for machine in range(1, machines + 1):
+            n = rows // machines + (machine <= rows % machines)
+            when = pd.Timestamp(PERIOD_START) + pd.to_timedelta(np.sort(rng.integers(0, period_seconds, n)), unit="s")
+            vends = pd.DataFrame({
+                "when": when.strftime("%Y-%m-%d %H:%M:%S"),
+                "product": rng.choice(["Soda", "Chips", "Candy", "Water"], n),
+                "payment": rng.choice(["Credit Card", "Mobile", "Cash"], n),
+                "amount": _money_text(rng.choice([1.25, 1.50, 2.00, 2.75], n)),
+            })
+            lines = [f"Nayax sales statement, Vending {machine}, {PERIOD_START} to {REPORT_DATE}"]
+            lines += (vends["when"] + "  " + vends["product"] + "  " + vends["payment"] + "  " + vends["amount"]).tolist()
+            name = f"Sales_Statement_Vending_{machine}_{REPORT_DATE:%Y%m%d}.pdf"
+            with zf.open(name, "w", force_zip64=True) as member:
+                _write_text_pdf(member, lines)
+    logger.debug(f"Wrote {rows} synthetic vends in {machines} PDF statements to {path.name}")
+    return [path]
+
+
+GENERATORS = {
+    "pai_float": write_pai_float_report,
+    "monthly_revenue": write_monthly_revenue_report,
+    "atm_commissions": write_atm_commission_report,
+    "kiosoft": write_kiosoft_log,
+    "payrange": write_payrange_report,
+    "touchtunes": write_touchtunes_collections,
+    "wesbanco_qbo": write_wesbanco_qbo,
+    "nayax_zip": write_nayax_zip,
+}
+
+
+def generate_report(kind, directory, rows, seed=0):
+    """
+    Write one synthetic report of the given kind.
+
+    :param kind: A key of GENERATORS
+    :type kind: str
+    :param directory: Where to write the files
+    :type directory: str or Path
+    :param rows: Number of data rows
+    :type rows: int
+    :param seed: Seed for the values
+    :type seed: int
+    :return: The files written
+    :rtype: list of Path
+    """
+    if kind not in GENERATORS:
+        raise KeyError(f"No synthetic report named {kind}, choose from {sorted(GENERATORS)}")
+    return GENERATORS[kind](Path(directory), rows, seed)
@@ -0,0 +1,36 @@
+from pathlib import Path
+import backfill_history
+from generic_history_store import RevenueHistoryStore
+from test_kiosoft_aggregation import write_log
+
+SCRIPTS_DIRECTORY = Path(__file__).parent
+
+
+def make_archive(tmp_path):
+    archive = tmp_path / "Downloads" / "KioSoft_History"
+    archive.mkdir(parents=True)
+    write_log(archive / "pay_at_machine_log_2024-06-19_to_2024-06-21.csv")
+    write_log(archive / "pay_at_machine_log_2024-07-01_to_2024-07-31.csv")
+    (archive / "notes.txt").write_text("not a report")
+    return tmp_path / "Downloads"
+
+
+def test_backfill_is_resumable_and_has_no_side_effects(tmp_path):
+    downloads = make_archive(tmp_path)
+    database = tmp_path / "history.sqlite"
+
+    stats = backfill_history.backfill_history([downloads], database=database, max_workers=2,
+                                              scripts_directory=SCRIPTS_DIRECTORY)
+    assert stats["stored"] == 2 and stats["failed"] == 0 and stats["unmatched"] == 1
+    assert stats["rows"] == 12
+    assert len(list((downloads / "KioSoft_History").iterdir())) == 3  # nothing was moved
+
+    store = RevenueHistoryStore(database)
+    months = store.revenue_by_month(metric="Net Transactions Amount ($)")["period_month"].tolist()
+    assert months == ["2024-06", "2024-07"]
+    store.close()
+
+    # a second run finds everything already stored
+    stats = backfill_history.backfill_history([downloads], database=database, max_workers=1,
+                                              scripts_directory=SCRIPTS_DIRECTORY)
+    assert stats["stored"] == 0 and stats["already_stored"] == 2
@@ -0,0 +1,59 @@
+import json
+import pytest
+import benchmark_reports as bench
+import Handler_Kiosoft_revenue_detail_report as kiosoft
+import Handler_PayRange as payrange
+import Handler_Nayax_zip_files as nayax
+import Handler_wesbanco_QBO_fix as qbo
+from synthetic_reports import generate_report
+
+FAST_CASES = ["atm_commissions", "kiosoft", "payrange", "touchtunes", "wesbanco_qbo", "nayax_zip"]
+
+
+@pytest.mark.parametrize("kind, handler", [
+    ("kiosoft", kiosoft), ("payrange", payrange), ("nayax_zip", nayax), ("wesbanco_qbo", qbo),
+])
+def test_synthetic_reports_match_their_handler(tmp_path, kind, handler):
+    paths = generate_report(kind, tmp_path, 50)
+    assert all(handler.declaration.matches(path.name) for path in paths)
+
+
+def test_run_benchmarks_records_history(tmp_path):
+    history = tmp_path / "history.jsonl"
+    results = bench.run_benchmarks(FAST_CASES, [120], repeat=1, work_directory=tmp_path / "work", history_file=history)
+    assert [result["status"] for result in results] == ["ok"] * len(FAST_CASES)
+    recorded = [json.loads(line) for line in history.read_text().splitlines()]
+    assert [record["case"] for record in recorded] == FAST_CASES
+    assert all(record["commit"] and record["median_seconds"] > 0 for record in recorded)
+
+
+def test_find_regressions_compares_with_another_commit():
+    history = [
+        {"status": "ok", "case": "kiosoft", "rows": 1000, "commit": "aaa", "median_seconds": 1.0},
+        {"status": "ok", "case": "kiosoft", "rows": 1000, "commit": "bbb", "median_seconds": 2.0},
+    ]
+    slower = {"status": "ok", "case": "kiosoft", "rows": 1000, "commit": "bbb", "median_seconds": 1.5}
+    faster = {"status": "ok", "case": "kiosoft", "rows": 1000, "commit": "ccc", "median_seconds": 1.9}
+    bench.find_regressions([slower, faster], history)
+    assert slower["baseline_commit"] == "aaa" and slower["regression"]
+    assert faster["baseline_commit"] == "bbb" and not faster["regression"]
+
+
+def test_synthetic_nayax_zip_holds_pdf_statements(tmp_path):
+    import re
+    import zipfile
+
+    zip_path = generate_report("nayax_zip", tmp_path, 130)[0]
+    with zipfile.ZipFile(zip_path) as zf:
+        members = {name: zf.read(name) for name in zf.namelist()}
+    assert len(members) == 25 and all(name.endswith(".pdf") for name in members)
+    vends = 0
+    for data in members.values():
+        assert data.startswith(b"%PDF-1.4") and data.rstrip().endswith(b"%%EOF")
+        xref = int(re.search(rb"startxref\n(\d+)", data).group(1))
+        assert data[xref:].startswith(b"xref")
+        offsets = [int(offset) for offset in re.findall(rb"(\d{10}) 00000 n", data)]
+        assert all(data[offset:].startswith(f"{number} 0 obj".encode()) for number, offset in enumerate(offsets, 1))
+        vends += data.count(b" Tj T*") - 1  # the first line of each statement is its title
+    assert vends == 130
+    assert nayax.stream_zip_members(zip_path) == {}  # nothing tabular, only listed and checked
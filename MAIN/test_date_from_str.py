@@ -41,7 +41,7 @@ def test_extract_dates():
         dates1 = extract_dates(string)
         for indx, date in enumerate(dates1):
             if is_date_valid(date):
-                assert date == INPUT_STRINGS[string][indx]
+                assert date.isoformat() == INPUT_STRINGS[string][indx]
 
 
 def test_extract_date_from_filename_using_regularExpressions():
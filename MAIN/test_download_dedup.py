@@ -0,0 +1,78 @@
+import directory_watcher as watcher
+from generic_file_hash_functions import hash_file, ProcessedHashIndex
+
+
+class RecordingProcessor:
+    def __init__(self, result=True):
+        self.result = result
+        self.calls = []
+
+    def process(self, file_path):
+        self.calls.append(file_path.name)
+        if self.result:
+            file_path.unlink()  # handlers move the file away once done
+        return self.result
+
+
+def test_hash_file_streams_in_chunks(tmp_path):
+    data = tmp_path / "report.csv"
+    data.write_bytes(b"a,b\n1,2\n" * 1000)
+    assert hash_file(data, chunk_size=7) == hash_file(data)
+
+
+def test_duplicate_is_archived_without_processing(tmp_path, monkeypatch):
+    monkeypatch.setattr(watcher, "DUPLICATES_FOLDER", tmp_path / "duplicates")
+    index = ProcessedHashIndex(tmp_path / "index.sqlite")
+    processor = RecordingProcessor()
+
+    first = tmp_path / "report.csv"
+    first.write_text("a,b\n1,2\n")
+    assert watcher.dispatch_new_file(first, processor, index)
+
+    copy = tmp_path / "report (1).csv"
+    copy.write_text("a,b\n1,2\n")
+    assert not watcher.dispatch_new_file(copy, processor, index)
+    assert processor.calls == ["report.csv"]
+    assert (tmp_path / "duplicates" / "report (1).csv").exists()
+    index.close()
+
+
+def test_failed_file_is_not_recorded(tmp_path, monkeypatch):
+    monkeypatch.setattr(watcher, "DUPLICATES_FOLDER", tmp_path / "duplicates")
+    index = ProcessedHashIndex(tmp_path / "index.sqlite")
+    data = tmp_path / "report.csv"
+    data.write_text("a,b\n1,2\n")
+
+    assert not watcher.dispatch_new_file(data, RecordingProcessor(result=False), index)
+    assert hash_file(data) not in index
+    index.close()
+
+
+def test_handed_off_attachment_is_processed_without_polling(tmp_path, monkeypatch):
+    import queue
+    monkeypatch.setattr(watcher, "DUPLICATES_FOLDER", tmp_path / "duplicates")
+    index = ProcessedHashIndex(tmp_path / "index.sqlite")
+    data = tmp_path / "report.csv"
+    data.write_text("a,b\n1,2\n")
+    handoff_queue = queue.Queue()
+    handoff_queue.put((data, hash_file(data)))
+
+    assert watcher.wait_for_handoff(None, 0.2) is None
+    handed_off, content_hash = watcher.wait_for_handoff(handoff_queue, 60)  # returns at once
+    processor = RecordingProcessor()
+    assert watcher.dispatch_new_file(handed_off, processor, index, content_hash)
+    assert processor.calls == ["report.csv"] and content_hash in index
+    index.close()
+
+
+def test_named_handler_runs_the_module_an_email_rule_chose(tmp_path, monkeypatch):
+    import sys
+    from types import SimpleNamespace
+    handled = []
+    monkeypatch.setitem(sys.modules, "Handler_fake", SimpleNamespace(data_handler_process=lambda path: handled.append(path.name) or True))
+    index = ProcessedHashIndex(tmp_path / "index.sqlite")
+    data = tmp_path / "sender_report.csv"
+    data.write_text("a,b\n1,2\n")
+    assert watcher.dispatch_new_file(data, watcher.NamedHandler("Handler_fake"), index, hash_file(data))
+    assert handled == ["sender_report.csv"]
+    index.close()
@@ -1,11 +1,13 @@
 import pytest
 from unittest.mock import MagicMock, patch
 from pathlib import Path
+from types import SimpleNamespace
 from datetime import datetime
 import json
+import time
 
 # Assuming EmailFetcher is in FetchEmailClassModularized.py, adjust as needed
-from FetchEmailClassModularized import EmailFetcher
+from FetchEmailClassModularized import EmailFetcher, IDLE_TIMEOUT_SECONDS, IDLE_POLL_SECONDS
 
 # Mock for the email object
 @pytest.fixture
@@ -143,3 +145,179 @@ def test_process_email_integration(email_fetcher, mock_msg, mocker):
     mock_construct_data.assert_called_once()
     mock_save_content.assert_called_once()
     mock_process_attachments.assert_called_once()
+
+
+class FakeImapServer:
+    """Local IMAP stand-in: UID ordered messages and a script of what each IDLE wait sees."""
+
+    def __init__(self, uids, idle_script, quiet_when_done=False):
+        self.messages = {uid: False for uid in uids}  # uid -> seen
+        self.idle_script = list(idle_script)
+        self.quiet_when_done = quiet_when_done  # after the script, polls see no mail instead of ending the test
+        self.connections = 0
+        self.fetch_criteria = []
+
+    def __call__(self, server_address):
+        self.connections += 1
+        return FakeMailBox(self)
+
+
+class FakeMailBox:
+    def __init__(self, server):
+        self.server = server
+        self.idle = self
+
+    def login(self, username, password):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def fetch(self, criteria):
+        self.server.fetch_criteria.append(str(criteria))
+        uids = [uid for uid, seen in self.server.messages.items() if not seen]
+        if "UID " in str(criteria):
+            first = int(str(criteria).split("UID ")[1].split(":")[0])
+            uids = [uid for uid in uids if uid >= first] or uids[-1:]
+        for uid in uids:
+            self.server.messages[uid] = True
+            yield MagicMock(uid=str(uid))
+
+    def poll(self, timeout):
+        if not self.server.idle_script:
+            if self.server.quiet_when_done:
+                time.sleep(timeout)
+                return []
+            raise KeyboardInterrupt  # end of script, stops the test
+        step = self.server.idle_script.pop(0)
+        if isinstance(step, Exception):
+            raise step
+        self.server.messages.update({uid: False for uid in step})
+        return [f"* {uid} EXISTS".encode() for uid in step]
+
+
+def test_idle_processes_pushed_mail_and_reconnects(mocker):
+    server = FakeImapServer([1, 2], [[3], [], ConnectionResetError("dropped"), [4]])
+    fetcher = EmailFetcher("imap.server.com", "user", "password", use_idle=True, mailbox_factory=server,
+                           idle_timeout=1, reconnect_backoff=(0.01, 0.02))
+    processed = []
+    mocker.patch.object(fetcher, "process_email", side_effect=lambda msg: processed.append(int(msg.uid)))
+    with pytest.raises(KeyboardInterrupt):
+        fetcher.fetch_emails_idle()
+    assert processed == [1, 2, 3, 4]
+    assert server.connections == 2
+    assert server.fetch_criteria[1] == "((UNSEEN) UID 3:*)"
+
+
+def test_stop_fetching_ends_idle_with_the_default_timeout():
+    server = FakeImapServer([1], [], quiet_when_done=True)
+    fetcher = EmailFetcher("imap.server.com", "user", "password", use_idle=True, mailbox_factory=server)
+    fetcher.process_email = lambda msg: None
+    assert fetcher.idle_timeout == IDLE_TIMEOUT_SECONDS
+    fetcher.start_fetching()
+    time.sleep(0.5)  # let the fetcher log in and start its IDLE
+    started = time.monotonic()
+    fetcher.stop_fetching()
+    assert not fetcher.thread.is_alive()
+    assert time.monotonic() - started < IDLE_POLL_SECONDS + 2
+
+
+def test_saved_attachments_are_handed_off(email_fetcher, mocker):
+    import queue
+    saved = SimpleNamespace(destination=Path("/some/path/a.pdf"), size=4, content_hash="abc")
+    mocker.patch("FetchEmailClassModularized.EmailFetcher.save_attachment", side_effect=[saved, None])
+    email_fetcher.handoff_queue = queue.Queue()
+    attachments = []
+    email_fetcher.process_attachments(
+        [MagicMock(filename="a.pdf"), MagicMock(filename="huge.pdf")], "sender", attachments)
+    assert email_fetcher.handoff_queue.get_nowait() == (saved.destination, "abc")
+    assert email_fetcher.handoff_queue.empty()  # the attachment that was too large is not handed off
+    assert [a["content_hash"] for a in attachments] == ["abc"]
+
+
+def test_email_goes_to_the_archive_instead_of_json(email_fetcher, mock_msg, mocker, tmp_path):
+    from generic_mail_archive import MailArchive
+    mock_save_content = mocker.patch("FetchEmailClassModularized.EmailFetcher.save_email_content")
+    mock_msg.uid = "42"
+    email_fetcher.mail_archive = MailArchive(tmp_path / "mail.sqlite")
+    email_fetcher.process_email(mock_msg)
+    archived, = email_fetcher.mail_archive.find(rule={"from": "test@example.com"})
+    assert (archived["uid"], archived["body"], archived["account"]) == ("42", mock_msg.text, "your_email@example.com")
+    mock_save_content.assert_not_called()
+    email_fetcher.mail_archive.close()
+
+
+def test_mail_archive_needs_email_rules(tmp_path):
+    from generic_mail_archive import MailArchive
+    from generic_email_rules import EmailRuleEngine
+    archive = MailArchive(tmp_path / "mail.sqlite")
+    with pytest.raises(ValueError):  # no JSON file would reach Handler_email_json_files, rules would never run
+        EmailFetcher("imap.server.com", "user", "password", dld=str(tmp_path), mail_archive=archive)
+    fetcher = EmailFetcher("imap.server.com", "user", "password", dld=str(tmp_path), mail_archive=archive,
+                           email_rules=EmailRuleEngine([]))
+    assert fetcher.mail_archive is archive
+    archive.close()
+
+
+def test_email_rules_reuse_saved_attachments_and_hand_off(mocker, mock_msg, tmp_path):
+    import queue
+    from generic_email_rules import EmailRule, EmailRuleEngine
+    rules = EmailRuleEngine([EmailRule("csv to handler", "route_to_handler", attachment_types=["csv"], handler="Handler_fake")])
+    with pytest.raises(ValueError):
+        EmailFetcher("imap.server.com", "user", "password", dld=str(tmp_path), email_rules=rules)
+    handoff_queue = queue.Queue()
+    fetcher = EmailFetcher("imap.server.com", "user", "password", dld=str(tmp_path), handoff_queue=handoff_queue, email_rules=rules)
+    mocker.patch("FetchEmailClassModularized.EmailFetcher.save_email_content")
+    mock_msg.uid = "7"
+    mock_msg.attachments = [MagicMock(filename="r.csv", size=4, content_type="text/csv", payload=b"a,b\n"),
+                            MagicMock(filename="s.pdf", size=4, content_type="application/pdf", payload=b"%PDF")]
+    fetcher.process_email(mock_msg)
+    staging = fetcher.attachment_directory
+    csv_file, pdf_file = staging / "testexamplecom_r.csv", staging / "testexamplecom_s.pdf"
+    handed_off = [handoff_queue.get_nowait() for _ in range(2)]
+    assert [item[0] for item in handed_off] == [csv_file, pdf_file]
+    assert handed_off[0][2] == "Handler_fake" and len(handed_off[1]) == 2
+    assert handoff_queue.empty()
+    assert sorted(path.name for path in staging.iterdir()) == [csv_file.name, pdf_file.name]
+
+
+def test_handed_off_attachments_are_staged_where_the_directory_check_does_not_look(email_fetcher, tmp_path):
+    import queue
+    import directory_watcher
+    from FetchEmailClassModularized import HANDOFF_STAGING_DIRECTORY_NAME
+    email_fetcher.email_download_directory = str(tmp_path)
+    email_fetcher.handoff_queue = queue.Queue()
+    attachments = []
+    email_fetcher.process_attachments(
+        [MagicMock(filename="report.csv", size=4, content_type="text/csv", payload=b"a,b\n")], "sender", attachments)
+    assert directory_watcher.get_first_new_file(tmp_path, None) is None  # the scan runs before the handoff is taken
+    staged, content_hash = email_fetcher.handoff_queue.get_nowait()
+    assert staged == tmp_path / HANDOFF_STAGING_DIRECTORY_NAME / "sender_report.csv" and staged.read_bytes() == b"a,b\n"
+    assert attachments[0]["saved_to"] == str(staged)
+
+
+def test_rule_routed_attachment_reaches_its_handler_when_the_scan_runs_first(mocker, mock_msg, tmp_path, monkeypatch):
+    import queue
+    import sys
+    import directory_watcher
+    from generic_email_rules import EmailRule, EmailRuleEngine
+    from generic_file_hash_functions import ProcessedHashIndex
+    handled = []
+    monkeypatch.setitem(sys.modules, "Handler_fake", SimpleNamespace(data_handler_process=lambda path: handled.append(path.name) or True))
+    rules = EmailRuleEngine([EmailRule("csv to handler", "route_to_handler", attachment_types=["csv"], handler="Handler_fake")])
+    handoff_queue = queue.Queue()
+    fetcher = EmailFetcher("imap.server.com", "user", "password", dld=str(tmp_path), handoff_queue=handoff_queue, email_rules=rules)
+    mocker.patch("FetchEmailClassModularized.EmailFetcher.save_email_content")
+    mock_msg.uid = "8"
+    mock_msg.attachments = [MagicMock(filename="r.csv", size=4, content_type="text/csv", payload=b"a,b\n")]
+    fetcher.process_email(mock_msg)
+
+    assert directory_watcher.get_first_new_file(tmp_path, None) is None
+    handed_off_file, content_hash, handler = directory_watcher.wait_for_handoff(handoff_queue, 1)
+    index = ProcessedHashIndex(tmp_path / "index.sqlite")
+    assert directory_watcher.dispatch_new_file(handed_off_file, directory_watcher.NamedHandler(handler), index, content_hash)
+    assert handled == ["testexamplecom_r.csv"]
+    index.close()
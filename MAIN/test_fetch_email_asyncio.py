@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+from FetchEmailAsyncio import AsyncEmailFetcher, EmailAccount, AccountRateLimiter
+
+
+class FolderServer:
+    """Each folder holds its own unseen UIDs. Logins are recorded with the time they happened."""
+
+    def __init__(self, folders, fail_first_login=False):
+        self.folders = {name: list(uids) for name, uids in folders.items()}
+        self.logins = []
+        self.fail_first_login = fail_first_login
+        self.lock = threading.Lock()
+
+    def __call__(self, server_address):
+        return FolderMailBox(self)
+
+
+class FolderMailBox:
+    def __init__(self, server):
+        self.server = server
+        self.folder_name = None
+
+    def login(self, username, password, initial_folder="INBOX"):
+        with self.server.lock:
+            self.server.logins.append((initial_folder, time.monotonic()))
+            if self.server.fail_first_login:
+                self.server.fail_first_login = False
+                raise ConnectionResetError("dropped")
+        self.folder_name = initial_folder
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def fetch(self, criteria):
+        uids, self.server.folders[self.folder_name] = self.server.folders[self.folder_name], []
+        for uid in uids:
+            yield MagicMock(uid=str(uid), folder=self.folder_name)
+
+
+def test_every_folder_of_every_account_is_watched(mocker):
+    first = FolderServer({"INBOX": [1, 2], "Reports": [7]}, fail_first_login=True)
+    second = FolderServer({"INBOX": [3]})
+    accounts = [
+        EmailAccount("imap.one", "one", "pw", folders=["INBOX", "Reports"], interval=0.05, min_login_interval=0.05,
+                     mailbox_factory=first),
+        EmailAccount("imap.two", "two", "pw", interval=0.05, mailbox_factory=second),
+    ]
+    processed = []
+    mocker.patch("FetchEmailClassModularized.EmailFetcher.process_email",
+                 side_effect=lambda msg: processed.append((msg.folder, int(msg.uid))))
+    mocker.patch("FetchEmailAsyncio.RECONNECT_BACKOFF_INITIAL", 0.01)
+
+    fetcher = AsyncEmailFetcher(accounts)
+    fetcher.start()
+    deadline = time.monotonic() + 5
+    while len(processed) < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    fetcher.stop(timeout=5)
+
+    assert sorted(processed) == [("INBOX", 1), ("INBOX", 2), ("INBOX", 3), ("Reports", 7)]
+    assert not fetcher.thread.is_alive()
+    login_times = sorted(at for folder, at in first.logins)
+    assert all(later - earlier >= 0.045 for earlier, later in zip(login_times, login_times[1:]))
+
+
+def test_rate_limiter_bounds_connections():
+    async def scenario():
+        limiter = AccountRateLimiter(max_connections=1, min_interval=0)
+        cancel = asyncio.Event()
+        open_connections, peak = 0, 0
+
+        async def connect():
+            nonlocal open_connections, peak
+            async with limiter.connection(cancel):
+                open_connections += 1
+                peak = max(peak, open_connections)
+                await asyncio.sleep(0.01)
+                open_connections -= 1
+
+        await asyncio.gather(*(connect() for _ in range(4)))
+        return peak
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_each_folder_has_its_own_fetcher(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from generic_imap_functions import UIDWatermarkStore
+
+    store = UIDWatermarkStore(tmp_path / "watermarks.sqlite")
+    account = EmailAccount("imap.one", "one", "pw", folders=["INBOX", "Reports"], watermark_store=store)
+    inbox, reports = account.fetchers["INBOX"], account.fetchers["Reports"]
+    assert inbox is not reports and inbox.stop_thread is not reports.stop_thread
+    assert inbox.watermark_store is reports.watermark_store is store
+
+    # the shared store is written from several poll threads at once
+    def advance(folder):
+        for uid in range(1, 201):
+            store.advance("one", folder, 1, uid)
+            store.last_uid("one", folder, 1)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(advance, ["INBOX", "Reports", "Archive", "Sent"]))
+    assert [store.last_uid("one", folder, 1) for folder in ("INBOX", "Reports", "Archive", "Sent")] == [200] * 4
+    store.close()
@@ -0,0 +1,51 @@
+import base64
+import quopri
+import pytest
+from generic_attachment_functions import write_attachment, AttachmentTooLarge, PARTIAL_SUFFIX
+from generic_file_hash_functions import hash_file
+
+
+def chunked(data, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("encoding, encode", [
+    ("base64", base64.encodebytes),  # 76 character lines, chunks split groups and line ends
+    ("quoted-printable", quopri.encodestring),
+    (None, lambda data: data),
+])
+def test_chunks_are_decoded_into_place(tmp_path, encoding, encode):
+    content = bytes(range(256)) * 300 + b"=tail"
+    destination = tmp_path / "statement.pdf"
+    writer = write_attachment(chunked(encode(content), 1000 + 3), destination, encoding)
+    assert destination.read_bytes() == content
+    assert writer.size == len(content)
+    assert writer.content_hash == hash_file(destination)
+    assert not list(tmp_path.glob(f"*{PARTIAL_SUFFIX}"))
+
+
+def test_too_large_attachment_leaves_nothing(tmp_path):
+    destination = tmp_path / "huge.pdf"
+    with pytest.raises(AttachmentTooLarge):
+        write_attachment(chunked(b"x" * 5000, 1000), destination, max_bytes=4096)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_streamed_attachment_uses_partial_fetches(tmp_path):
+    from types import SimpleNamespace
+    from generic_imap_functions import MessagePart, StreamedAttachment
+    encoded = base64.b64encode(b"%PDF-1.7 " * 100)
+    requests = []
+
+    def uid(command, uids, items):
+        requests.append(items)
+        offset, size = map(int, items.split("<")[1].rstrip(">)").split("."))
+        chunk = encoded[offset:offset + size]
+        return "OK", [(b"1 (UID 5 BODY[2]<%d> {%d}" % (offset, len(chunk)), chunk), b")"]
+
+    part = MessagePart("2", "application/pdf", "base64", len(encoded), "stmt.pdf")
+    attachment = StreamedAttachment(SimpleNamespace(client=SimpleNamespace(uid=uid)), "5", part)
+    write_attachment(attachment.chunks(chunk_size=500), tmp_path / "stmt.pdf", attachment.encoding)
+    assert (tmp_path / "stmt.pdf").read_bytes() == b"%PDF-1.7 " * 100
+    assert requests[:2] == ["(UID BODY.PEEK[2]<0.500>)", "(UID BODY.PEEK[2]<500.500>)"]
+    assert len(requests) == 3  # the last chunk is short
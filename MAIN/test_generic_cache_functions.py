@@ -0,0 +1,85 @@
+import pytest
+from generic_cache_functions import PersistentLRUCache, ruleset_hash
+import Handler_wesbanco_QBO_fix as qbo
+
+
+def test_ruleset_hash_changes_with_rules():
+    assert ruleset_hash(["POS "], 1) == ruleset_hash(["POS "], 1)
+    assert ruleset_hash(["POS "], 1) != ruleset_hash(["POS ", "ACH "], 1)
+
+
+def test_get_or_compute_only_computes_once(tmp_path):
+    calls = []
+    cache = PersistentLRUCache(tmp_path / "cache.sqlite", "memo_cache", "rules-a")
+
+    def compute(raw):
+        calls.append(raw)
+        return raw.lower()
+
+    assert cache.get_or_compute("KROGER", compute) == "kroger"
+    assert cache.get_or_compute("KROGER", compute) == "kroger"
+    assert calls == ["KROGER"]
+    cache.close()
+
+
+def test_values_persist_between_runs(tmp_path):
+    database = tmp_path / "cache.sqlite"
+    cache = PersistentLRUCache(database, "memo_cache", "rules-a")
+    cache.put("POS DB KROGER #123", "KROGER #123")
+    cache.close()
+
+    cache = PersistentLRUCache(database, "memo_cache", "rules-a")
+    assert cache.get("POS DB KROGER #123") == "KROGER #123"
+    cache.close()
+
+
+def test_changed_rules_invalidate_cache(tmp_path):
+    database = tmp_path / "cache.sqlite"
+    cache = PersistentLRUCache(database, "memo_cache", "rules-a")
+    cache.put("POS DB KROGER #123", "KROGER #123")
+    cache.close()
+
+    cache = PersistentLRUCache(database, "memo_cache", "rules-b")
+    assert cache.get("POS DB KROGER #123") is None
+    cache.close()
+
+
+def test_memory_is_bounded(tmp_path):
+    cache = PersistentLRUCache(tmp_path / "cache.sqlite", "memo_cache", "rules-a", maxsize=2)
+    for key in ["a", "b", "c"]:
+        cache.put(key, key.upper())
+    assert list(cache._memory) == ["b", "c"]
+    # evicted values are still found on disk once flushed
+    cache.flush()
+    assert cache.get("a") == "A"
+    cache.close()
+
+
+def test_invalid_table_name_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        PersistentLRUCache(tmp_path / "cache.sqlite", "memo; DROP TABLE x", "rules-a")
+
+
+def test_normalize_memo_uses_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(qbo, "MEMO_CACHE_FILE", tmp_path / "memo.sqlite")
+    monkeypatch.setattr(qbo, "_memo_cache", None)
+    assert qbo.normalize_memo("POS DB KROGER #123") == "KROGER #123"
+    assert qbo.get_memo_cache().get("POS DB KROGER #123") == "KROGER #123"
+    qbo.get_memo_cache().close()
+
+
+def test_failed_compute_is_not_cached(tmp_path):
+    cache = PersistentLRUCache(tmp_path / "cache.sqlite", "memo_cache", "rules-a")
+    assert cache.get_or_compute("BROKEN", lambda raw: None) is None
+    assert cache.get_or_compute("BROKEN", str.lower) == "broken"
+    cache.flush()  # would fail the NOT NULL constraint if None had been cached
+    cache.close()
+
+
+def test_get_sees_values_evicted_before_flush(tmp_path):
+    cache = PersistentLRUCache(tmp_path / "cache.sqlite", "memo_cache", "rules-a", maxsize=1)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert "a" not in cache._memory
+    assert cache.get("a") == "A"
+    cache.close()
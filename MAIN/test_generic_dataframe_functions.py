@@ -0,0 +1,82 @@
+import io
+import math
+from decimal import Decimal
+import pandas as pd
+import pytest
+from generic_dataframe_functions import (
+    parse_money_series,
+    parse_money_columns,
+    money_converter,
+    money_converters,
+    load_csv_with_schema,
+    schema_read_options,
+)
+
+MONEY_TEXT = ["$1,234.50", "(12.50)", "-$3", "$-1,234.876", "", None, "n/a"]
+
+
+def test_parse_money_series_float():
+    result = parse_money_series(pd.Series(MONEY_TEXT))
+    assert result.dtype == "float64"
+    assert result.tolist()[:4] == [1234.5, -12.5, -3.0, -1234.876]
+    assert all(math.isnan(v) for v in result.tolist()[4:])
+
+
+def test_parse_money_series_decimal():
+    result = parse_money_series(pd.Series(MONEY_TEXT), as_decimal=True)
+    assert result.tolist() == [Decimal("1234.50"), Decimal("-12.50"), Decimal("-3"), Decimal("-1234.876"), None, None, None]
+
+
+def test_parse_money_series_raise():
+    with pytest.raises(ValueError):
+        parse_money_series(pd.Series(["$1.00", "n/a"]), errors="raise")
+
+
+def test_parse_money_columns_whole_frame():
+    df = pd.DataFrame({"Surch": ["$1.00", "(2.00)"], "Settlement": ["$1,000", ""], "WD Trxs": [3, 4], "Location": ["a", "b"]})
+    parse_money_columns(df, ["Surch", "Settlement", "WD Trxs"])
+    assert df["Surch"].tolist() == [1.0, -2.0]
+    assert df["Settlement"].tolist()[0] == 1000.0 and math.isnan(df["Settlement"].tolist()[1])
+    assert df["WD Trxs"].dtype == "float64"
+    assert df["Location"].tolist() == ["a", "b"]
+    with pytest.raises(KeyError):
+        parse_money_columns(df, ["Missing"])
+
+
+def test_money_converters_at_read_time():
+    csv = io.StringIO('Balance,Count\n"$1,000.00",1\n(2.50),2\n')
+    df = pd.read_csv(csv, converters=money_converters(["Balance"]))
+    assert df["Balance"].tolist() == [1000.0, -2.5]
+    assert money_converter("(2.50)", as_decimal=True) == Decimal("-2.50")
+
+
+SCHEMA = {
+    "columns": {"Machine ID": "string", "Total Amount ($)": "string", "Date Time": "string"},
+    "money": ["Total Amount ($)"],
+    "dates": ["Date Time"],
+    "strip": ["Machine ID"],
+    "rename": {"Total Amount ($)": "Amount"},
+}
+
+
+def test_load_csv_with_schema_reads_only_declared_columns(tmp_path):
+    data = tmp_path / "log.csv"
+    data.write_text('Date Time,Unused,Machine ID,Total Amount ($)\n2024-06-19 10:00, x , 01 ,"$1,002.50"\n2024-06-20 10:00,y,02,(2.50)\n')
+    df = load_csv_with_schema(data, SCHEMA)
+    assert df.columns.tolist() == ["Date Time", "Machine ID", "Amount"]
+    assert df["Machine ID"].tolist() == ["01", "02"]  # leading zeros survive as strings
+    assert df["Amount"].tolist() == [1002.5, -2.5]
+    assert str(df["Date Time"].dtype).startswith("datetime64")
+
+
+def test_load_csv_with_schema_missing_column(tmp_path):
+    data = tmp_path / "log.csv"
+    data.write_text("Machine ID,Total Amount ($)\n01,1\n")
+    with pytest.raises(KeyError):
+        load_csv_with_schema(data, SCHEMA)
+
+
+def test_schema_read_options_without_header():
+    options = schema_read_options({"names": ["Category", "Value"], "columns": {"Category": str, "Value": str}}, chunksize=10)
+    assert options["header"] is None and options["names"] == ["Category", "Value"]
+    assert options["engine"] == "c"  # chunked reads are not supported by pyarrow
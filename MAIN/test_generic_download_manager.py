@@ -0,0 +1,155 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from generic_download_manager import DownloadManager, DownloadError, summarize_downloads
+from generic_file_hash_functions import hash_file
+
+CONTENT = bytes(range(256)) * 400  # 100 KiB
+OTHER_CONTENT = bytes(reversed(CONTENT))
+
+
+class ReportServer(BaseHTTPRequestHandler):
+    """
+    Serves CONTENT, or OTHER_CONTENT for '?id=2', with an ETag and Range support honouring If-Range.
+    A '#break' failure breaks off the next transfer of that path, 'busy' answers 503 once.
+    """
+
+    requests_seen = []
+    failures = {}
+    etags = {}  # path to its ETag when not '"v1"', None for no validator at all
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get("Range")))
+        if self.path == "/missing.csv":
+            self.send_error(404)
+            return
+        if self.failures.pop(self.path, None) == "busy":
+            self.send_error(503)
+            return
+        etag = self.etags.get(self.path, '"v1"')
+        start = int(self.headers["Range"].split("=")[1].rstrip("-")) if self.headers.get("Range") else 0
+        if self.headers.get("If-Range") != etag:
+            start = 0  # RFC 9110: a validator that does not match gets the whole representation
+        body = (OTHER_CONTENT if "id=2" in self.path else CONTENT)[start:]
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        if self.path == "/named":
+            self.send_header("Content-Disposition", 'attachment; filename="report 2024-06.csv"')
+        if self.path == "/named-flaky":
+            self.send_header("Content-Disposition", 'attachment; filename="june.csv"')
+        self.end_headers()
+        if self.failures.pop(self.path + "#break", None):
+            self.wfile.write(body[:30_000])  # then the connection drops
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    ReportServer.requests_seen = []
+    ReportServer.failures = {}
+    ReportServer.etags = {}
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ReportServer)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def manager():
+    with DownloadManager(max_workers=3, retries=2, backoff=0.01, chunk_size=8192) as manager:
+        yield manager
+
+
+def test_download_is_renamed_into_place_with_its_hash(server, manager, tmp_path):
+    result = manager.download(f"{server}/reports/daily.csv", tmp_path)
+    assert result.path == tmp_path / "daily.csv" and result.path.read_bytes() == CONTENT
+    assert result.content_hash == hash_file(result.path) and result.size == len(CONTENT)
+    assert result.seconds >= result.first_byte_seconds > 0
+    assert [p.name for p in tmp_path.iterdir()] == ["daily.csv"]
+
+
+def test_broken_transfer_resumes_with_range(server, manager, tmp_path):
+    ReportServer.failures["/flaky#break"] = True
+    result = manager.download(f"{server}/flaky", tmp_path, filename="flaky.csv")
+    assert result.path.read_bytes() == CONTENT and result.attempts == 2
+    assert result.content_hash == hash_file(result.path)
+    assert ReportServer.requests_seen == [("/flaky", None), ("/flaky", "bytes=24576-")]  # three whole chunks were kept
+
+
+def test_retry_checksum_and_errors(server, manager, tmp_path):
+    ReportServer.failures["/busy"] = "busy"
+    assert manager.download(f"{server}/busy", tmp_path, filename="busy.csv").path.read_bytes() == CONTENT
+    with pytest.raises(DownloadError):
+        manager.download(f"{server}/missing.csv", tmp_path)
+    with pytest.raises(DownloadError):
+        manager.download(f"{server}/bad.csv", tmp_path, expected_hash="0" * 64)
+    assert not (tmp_path / "bad.csv").exists() and not list(tmp_path.glob(".*"))
+
+
+def test_download_all_reports_throughput(server, manager, tmp_path):
+    results = manager.download_all([f"{server}/a.csv", f"{server}/named", f"{server}/missing.csv"], tmp_path)
+    assert results[1].path.name == "report_2024_06.csv"
+    assert isinstance(results[2], DownloadError)
+    summary = summarize_downloads(results)
+    assert summary["downloaded"] == 2 and summary["failed"] == 1 and summary["bytes"] == 2 * len(CONTENT)
+
+
+def test_resume_keeps_the_partial_when_the_server_renames_the_file(server, manager, tmp_path):
+    ReportServer.failures["/named-flaky#break"] = True
+    result = manager.download(f"{server}/named-flaky", tmp_path)
+    assert result.path == tmp_path / "june.csv" and result.path.read_bytes() == CONTENT
+    assert result.attempts == 2 and ReportServer.requests_seen[1] == ("/named-flaky", "bytes=24576-")
+    assert result.content_hash == hash_file(result.path)
+
+
+def test_existing_file_is_not_replaced(server, manager, tmp_path):
+    (tmp_path / "daily.csv").write_bytes(b"yesterday")
+    result = manager.download(f"{server}/reports/daily.csv", tmp_path)
+    assert result.path == tmp_path / "daily(1).csv" and result.path.read_bytes() == CONTENT
+    assert (tmp_path / "daily.csv").read_bytes() == b"yesterday"
+
+
+def test_links_that_differ_in_their_query_do_not_share_a_partial(server, tmp_path):
+    with DownloadManager(retries=0, chunk_size=8192) as manager:
+        ReportServer.failures["/download?id=1#break"] = True
+        with pytest.raises(DownloadError):
+            manager.download(f"{server}/download?id=1", tmp_path)
+        assert len(list(tmp_path.glob(".*.part"))) == 2  # the partial and its validator stay for a retry
+        result = manager.download(f"{server}/download?id=2", tmp_path)
+        assert result.path.read_bytes() == OTHER_CONTENT and result.resumed_from == 0
+        resumed = manager.download(f"{server}/download?id=1", tmp_path)
+    assert resumed.path.read_bytes() == CONTENT and resumed.resumed_from == 24576
+    assert not list(tmp_path.glob(".*"))
+
+
+def test_partial_of_a_changed_resource_is_not_resumed(server, manager, tmp_path):
+    ReportServer.failures["/flaky#break"] = True
+    with DownloadManager(retries=0, chunk_size=8192) as impatient:
+        with pytest.raises(DownloadError):
+            impatient.download(f"{server}/flaky", tmp_path)
+    ReportServer.etags["/flaky"] = '"v2"'  # the report was regenerated in the meantime
+    result = manager.download(f"{server}/flaky", tmp_path)
+    assert result.path.read_bytes() == CONTENT and result.resumed_from == 0
+    assert ReportServer.requests_seen[-1] == ("/flaky", "bytes=24576-")  # asked, and got the whole file
+
+
+def test_without_a_validator_a_broken_transfer_starts_over(server, manager, tmp_path):
+    ReportServer.etags["/flaky"] = None
+    ReportServer.failures["/flaky#break"] = True
+    result = manager.download(f"{server}/flaky", tmp_path)
+    assert result.path.read_bytes() == CONTENT and result.attempts == 2 and result.resumed_from == 0
+    assert ReportServer.requests_seen == [("/flaky", None), ("/flaky", None)]
+
+
+def test_parallel_downloads_of_one_url_do_not_share_a_partial(server, manager, tmp_path):
+    results = manager.download_all([f"{server}/reports/daily.csv"] * 3, tmp_path)
+    assert sorted(result.path.name for result in results) == ["daily(1).csv", "daily(2).csv", "daily.csv"]
+    assert all(result.path.read_bytes() == CONTENT for result in results)
@@ -0,0 +1,118 @@
+import sys
+import random
+import string
+import time
+from types import SimpleNamespace
+import pytest
+from generic_email_rules import EmailRule, EmailRuleEngine, EMAIL_ROUTING_RULES_FILE, required_literal
+
+PAYRANGE_BODY = "Your report is ready.\r\nDownload\r\n<https://reports.payrange.com/r/123.csv>\r\nThanks"
+
+
+def attachment(filename, payload=b"data"):
+    return SimpleNamespace(filename=filename, payload=payload)
+
+
+def test_shipped_rules_download_the_payrange_link(tmp_path):
+    downloads = []
+    engine = EmailRuleEngine.from_file(EMAIL_ROUTING_RULES_FILE, download_directory=tmp_path,
+                                       downloader=lambda url, directory: downloads.append(url))
+    engine.route("noreply@payrange.com", "Daily report", PAYRANGE_BODY)
+    engine.route("friend@example.com", "Lunch", "Pizza today?")
+    assert downloads == ["https://reports.payrange.com/r/123.csv"]
+
+
+def test_every_condition_of_a_rule_must_match():
+    engine = EmailRuleEngine([
+        EmailRule("statements", "save_attachment", sender=r"@wesbanco\.com$", attachment_types=["pdf"]),
+        EmailRule("any csv", "save_attachment", attachment_types=[".csv"]),
+        EmailRule("alerts", "download_link", subject=r"^alert\b", body="urgent"),
+    ])
+    names = lambda rules: [rule.name for rule in rules]
+    assert names(engine.match("bank@wesbanco.com", "Statement", "", ["june.pdf"])) == ["statements"]
+    assert names(engine.match("bank@wesbanco.com", "Statement", "", ["june.csv"])) == ["any csv"]
+    assert names(engine.match("someone@else.com", "Statement", "", ["june.pdf", "a.CSV"])) == ["any csv"]
+    assert names(engine.match("x", "ALERT: disk", "not urgent")) == ["alerts"]
+    assert names(engine.match("x", "Re: alert", "urgent")) == []
+
+
+def test_attachments_are_saved_and_routed(tmp_path, monkeypatch):
+    handled = []
+    monkeypatch.setitem(sys.modules, "Handler_fake", SimpleNamespace(data_handler_process=lambda path: handled.append(path.name)))
+    engine = EmailRuleEngine([
+        EmailRule("keep pdf", "save_attachment", attachment_types=["pdf"], directory=str(tmp_path / "pdf")),
+        EmailRule("csv to handler", "route_to_handler", attachment_types=["csv"], handler="Handler_fake"),
+    ], download_directory=tmp_path)
+    results = engine.route("a@b.com", "Reports", "", [attachment("r.csv"), attachment("s.pdf", b"%PDF")])
+    assert (tmp_path / "pdf" / "abcom_s.pdf").read_bytes() == b"%PDF"
+    assert handled == ["abcom_r.csv"]
+    assert [(name, action) for name, action, result in results] == [("keep pdf", "save_attachment"), ("csv to handler", "route_to_handler")]
+
+
+def test_invalid_rules_are_rejected():
+    with pytest.raises(ValueError):
+        EmailRule("bad", "forward")
+    with pytest.raises(ValueError):
+        EmailRule("bad", "save_attachment", subject="(unclosed")
+
+
+def test_required_literal():
+    assert required_literal(r"@WesBanco\.com$") == "@wesbanco.com"
+    assert required_literal(r"Download\s*<\s*https://") == "download"
+    assert required_literal(r"^alert\b") == "alert"
+    assert required_literal(r"pdf|csv") == ""
+
+
+def test_overlapping_literals_are_all_found():
+    engine = EmailRuleEngine([
+        EmailRule("report", "save_attachment", body="report"),
+        EmailRule("port", "save_attachment", body="port"),
+        EmailRule("reportage", "save_attachment", body="reportage"),
+        EmailRule("rep", "save_attachment", body=r"\brep"),
+        EmailRule("any digits", "save_attachment", body=r"\d+"),
+    ])
+    assert [rule.name for rule in engine.match(body="The PREPORTAGE 7")] == ["report", "port", "reportage", "any digits"]
+
+
+def test_only_rules_whose_literal_appears_are_searched():
+    rules = [EmailRule(f"vendor {i}", "save_attachment", body=rf"vendor{i:04d}\s+report") for i in range(500)]
+    engine = EmailRuleEngine(rules)
+    body = "Hello,\r\nVendor0042 Report attached. vendor0043 is late."
+    assert engine._matchers["body"].candidates(body) == {42, 43}
+    assert [rule.name for rule in engine.match(body=body)] == ["vendor 42"]
+
+
+def test_matching_cost_does_not_follow_the_rule_count():
+    rnd = random.Random(7)
+    word = lambda: "".join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(4, 9)))
+    body = " ".join(word() for _ in range(16_000))  # about 120 KB, the size of a long report email
+
+    def seconds(rule_count):
+        engine = EmailRuleEngine([EmailRule(f"r{i}", "save_attachment", body=rf"{word()}\s+report #{i}\b")
+                                  for i in range(rule_count)])
+        runs = []
+        for _ in range(5):
+            started = time.perf_counter()
+            engine.match(body=body)
+            runs.append(time.perf_counter() - started)
+        return min(runs)
+
+    assert seconds(1000) < 4 * seconds(10)
+
+
+def test_saved_attachments_are_handed_off_to_the_rule_handler(tmp_path, monkeypatch):
+    import queue
+    from generic_email_rules import SavedAttachment
+    monkeypatch.setitem(sys.modules, "Handler_fake", SimpleNamespace(data_handler_process=lambda path: pytest.fail("ran on this thread")))
+    saved = tmp_path / "abcom_r.csv"
+    saved.write_text("a,b\n")
+    engine = EmailRuleEngine([
+        EmailRule("keep csv", "save_attachment", attachment_types=["csv"]),
+        EmailRule("csv to handler", "route_to_handler", attachment_types=["csv"], handler="Handler_fake"),
+    ])  # no download directory, saved attachments stay where they are
+    handoff_queue = queue.Queue()
+    results = engine.route("a@b.com", "Reports", "", [SavedAttachment("abcom_r.csv", saved, "abc")], handoff_queue)
+    assert results == [("keep csv", "save_attachment", [saved]), ("csv to handler", "route_to_handler", [saved])]
+    assert handoff_queue.get_nowait() == (saved, "abc", "Handler_fake")
+    assert handoff_queue.empty()
+    assert [path.name for path in tmp_path.iterdir()] == ["abcom_r.csv"]  # nothing written again
@@ -0,0 +1,69 @@
+from datetime import date
+import pandas as pd
+import generic_history_store as history
+from generic_history_store import RevenueHistoryStore, frame_to_history_rows
+import Handler_Kiosoft_revenue_detail_report as kiosoft
+from test_kiosoft_aggregation import write_log
+
+
+def test_frame_to_history_rows():
+    df = pd.DataFrame({"Machine": ["W1", "W2"], "Total$": [2.5, None], "Date": ["2024-06-20", "not a date"]})
+    rows = frame_to_history_rows(df, ["Total$", "Missing$"], report_date=date(2024, 6, 19), date_column="Date",
+                                 location="Laundry A", entity_column="Machine")
+    assert rows == [{"report_date": "2024-06-20", "period_end": None, "location": "Laundry A",
+                     "entity": "W1", "metric": "Total$", "amount": 2.5}]
+
+
+def test_append_is_idempotent_per_source(tmp_path):
+    store = RevenueHistoryStore(tmp_path / "history.sqlite")
+    rows = [{"report_date": "2024-06-19", "location": "A", "entity": "1", "metric": "Net", "amount": 5.0},
+            {"report_date": "2024-07-02", "location": "A", "entity": "1", "metric": "Net", "amount": 7.0}]
+    store.append("Kiosoft", "log.csv", rows, content_hash="abc")
+    store.append("Kiosoft", "log.csv", rows, content_hash="abc")
+    store.append("PayRange", "device.csv", [{"report_date": "2024-06-01", "metric": "Net", "amount": 1.0}])
+    monthly = store.revenue_by_month(metric="Net")
+    assert monthly.to_dict("records") == [
+        {"vendor": "Kiosoft", "period_month": "2024-06", "metric": "Net", "amount": 5.0},
+        {"vendor": "PayRange", "period_month": "2024-06", "metric": "Net", "amount": 1.0},
+        {"vendor": "Kiosoft", "period_month": "2024-07", "metric": "Net", "amount": 7.0},
+    ]
+    assert store.has_source("log.csv", "abc") and not store.has_source("log.csv", "other")
+    store.close()
+
+
+def test_kiosoft_history_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_DATABASE", tmp_path / "history.sqlite")
+    log = write_log(tmp_path / "pay_at_machine_log_2024-06-19_to_2024-06-21.csv")
+    rows = kiosoft.extract_history_rows(log)
+    assert {row["report_date"] for row in rows} == {"2024-06-19"}
+    assert {row["period_end"] for row in rows} == {"2024-06-21"}
+    assert history.append_history("Kiosoft", log, rows) == 6
+    assert log.exists()  # extracting and storing history has no side effects on the report
+
+    store = RevenueHistoryStore(tmp_path / "history.sqlite")
+    net = store.query("SELECT entity, amount FROM revenue_history WHERE metric = ? ORDER BY entity", (kiosoft.NET_LABEL,))
+    assert net.to_dict("records") == [{"entity": "101", "amount": 4.5}, {"entity": "102", "amount": 4.0}]
+    store.close()
+
+
+def test_atm_history_rows_reuse_the_processed_frame(tmp_path, monkeypatch):
+    import Handler_ATM_commissions as atm
+
+    monkeypatch.setattr(history, "HISTORY_DATABASE", tmp_path / "history.sqlite")
+    monkeypatch.setattr(atm, "save_dataframe_as_csv_and_print", lambda *args: True)
+    report = tmp_path / "ATMActivityReportforcommissions-2024-08-01.csv"
+    report.write_text('Location,WD Trxs,Surcharge WDs,Settlement,Group\n'
+                      'Laundry A,10,8,"$20.00",Comm 0.5\nLaundry B,4,4,"$6.00",Comm 0.5\n')
+    parses = []
+    process = atm.process_commission_report
+    monkeypatch.setattr(atm, "process_commission_report", lambda *args: parses.append(args) or process(*args))
+
+    assert atm.data_handler_process(report)
+    assert len(parses) == 1  # the history rows come from the frame that was printed
+    assert parses[0][1] == "20240801"  # the filedate comes from the same date lookup
+    store = RevenueHistoryStore(tmp_path / "history.sqlite")
+    stored = store.query("SELECT DISTINCT location, report_date FROM revenue_history ORDER BY location")
+    assert stored.to_dict("records")[0] == {"location": "Laundry A", "report_date": "2024-08-01"}
+    store.close()
+    rows = atm.extract_history_rows(report)  # the backfill reads the report itself
+    assert rows and {row["report_date"] for row in rows} == {"2024-08-01"}
@@ -0,0 +1,134 @@
+from types import SimpleNamespace
+import pytest
+from generic_imap_functions import UIDWatermarkStore, fetch_new_messages
+
+
+class FakeFolderMailBox:
+    """Just enough of imap_tools.MailBox for UID searches in one folder."""
+
+    def __init__(self, uids, uidvalidity=7):
+        self.uids = list(uids)
+        self.uidvalidity = uidvalidity
+        self.searches = []
+        self.folder = SimpleNamespace(
+            get=lambda: "INBOX",
+            status=lambda folder, options: {"UIDVALIDITY": self.uidvalidity},
+        )
+
+    def fetch(self, criteria, **kwargs):
+        self.searches.append(str(criteria))
+        first = int(str(criteria).split("UID ")[1].split(":")[0])
+        for uid in [uid for uid in self.uids if uid >= first] or self.uids[-1:]:
+            yield SimpleNamespace(uid=str(uid))
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = UIDWatermarkStore(tmp_path / "watermarks.sqlite")
+    yield store
+    store.close()
+
+
+def test_watermark_only_moves_forward(store):
+    store.advance("me", "INBOX", 7, 10)
+    store.advance("me", "INBOX", 7, 4)
+    assert store.get("me", "INBOX") == (7, 10)
+    assert store.last_uid("me", "INBOX", 7) == 10
+    assert store.last_uid("me", "INBOX", 8) == 0  # UIDs were reset on the server
+    store.advance("me", "INBOX", 8, 2)
+    assert store.get("me", "INBOX") == (8, 2)
+
+
+def test_fetch_new_messages_is_incremental(store):
+    mailbox = FakeFolderMailBox([3, 5, 9])
+    assert [msg.uid for msg in fetch_new_messages(mailbox, store, "me")] == ["3", "5", "9"]
+    assert [msg.uid for msg in fetch_new_messages(mailbox, store, "me")] == []  # '10:*' matches the newest, 9
+    mailbox.uids.append(12)
+    assert [msg.uid for msg in fetch_new_messages(mailbox, store, "me")] == ["12"]
+    assert mailbox.searches == ["(UID 1:*)", "(UID 10:*)", "(UID 10:*)"]
+
+
+def test_failed_message_is_fetched_again(store):
+    mailbox = FakeFolderMailBox([3, 5, 9])
+    for msg in fetch_new_messages(mailbox, store, "me"):
+        if msg.uid == "5":
+            break  # processing 5 failed
+    assert store.last_uid("me", "INBOX", 7) == 3
+    assert [msg.uid for msg in fetch_new_messages(mailbox, store, "me")] == ["5", "9"]
+
+
+STRUCTURE = (
+    b'(("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 5 1 NIL NIL NIL)'
+    b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "QUOTED-PRINTABLE" 12 1 NIL NIL NIL) "ALTERNATIVE")'
+    b'("APPLICATION" "PDF" ("NAME" "stmt.pdf") NIL NIL "BASE64" 8 NIL ("ATTACHMENT" ("FILENAME" "stmt.pdf")) NIL)'
+    b' "MIXED"'
+)
+HEADER = b"From: reports@payrange.com\r\nSubject: Daily report\r\nTo: me@example.com\r\n\r\n"
+
+
+class FakeImapClient:
+    """Answers UID FETCH the way imaplib returns it: literals as (prefix, bytes) tuples."""
+
+    def __init__(self):
+        self.commands = []
+
+    def uid(self, command, uids, items):
+        self.commands.append(items)
+        if "BODYSTRUCTURE" in items:
+            return "OK", [
+                (b"1 (UID 5 RFC822.SIZE 900 BODYSTRUCTURE (" + STRUCTURE + b") BODY[HEADER.FIELDS (FROM)] {%d}" % len(HEADER), HEADER),
+                b")",
+            ]
+        return "OK", [
+            (b"1 (UID 5 BODY[1.1] {5}", b"hello"),
+            (b" BODY[2] {8}", b"JVBERi0x"),
+            b")",
+        ]
+
+
+def test_headers_first_downloads_only_relevant_parts():
+    from generic_imap_functions import fetch_message_summaries, select_relevant_parts, fetch_parts
+    mailbox = SimpleNamespace(uids=lambda criteria: ["5"], client=FakeImapClient())
+    summary, = fetch_message_summaries(mailbox, "ALL")
+    assert summary.uid == "5" and summary.size == 900
+    assert summary.from_ == "reports@payrange.com" and summary.subject == "Daily report"
+    assert [(part.section, part.content_type) for part in summary.parts] == [
+        ("1.1", "text/plain"), ("1.2", "text/html"), ("2", "application/pdf")]
+    assert [part.filename for part in summary.attachment_parts] == ["stmt.pdf"]
+
+    assert select_relevant_parts(summary, attachment_matcher=lambda name: False, message_rules=[]) == []
+    assert select_relevant_parts(summary, message_rules=[], attachment_matcher=lambda name: True,
+                                 ignore_file_types=["pdf"]) == []
+    parts = select_relevant_parts(summary, attachment_matcher=lambda name: name.endswith(".pdf"))
+    assert [part.section for part in parts] == ["1.1", "1.2", "2"]
+
+    message = fetch_parts(mailbox, summary, [parts[0], parts[2]])
+    assert mailbox.client.commands[-1] == "(UID BODY.PEEK[1.1] BODY.PEEK[2])"
+    assert message.text == "hello" and message.subject == "Daily report"
+    assert [(a.filename, a.payload) for a in message.attachments] == [("stmt.pdf", b"%PDF-1")]
+
+
+def test_only_the_first_watermark_sync_is_limited_by_date(tmp_path, monkeypatch):
+    import FetchEmailFunctionally as functionally
+    mailbox = FakeFolderMailBox([3, 5])
+    monkeypatch.setattr(functionally, "MailBox", lambda server: SimpleNamespace(login=lambda username, password: ContextMailBox(mailbox)))
+    monkeypatch.setattr(functionally, "process_email", lambda msg, download_dir, ignore_file_types: None)
+    database = tmp_path / "watermarks.sqlite"
+    functionally.fetch_emails_since_watermark("imap", "me", "pw", tmp_path, database, [])
+    mailbox.uids.append(8)  # arrives after a long outage with an old Date header
+    functionally.fetch_emails_since_watermark("imap", "me", "pw", tmp_path, database, [])
+    assert "SINCE" in mailbox.searches[0] and mailbox.searches[1] == "(UID 6:*)"
+    store = UIDWatermarkStore(database)
+    assert store.get("me", "INBOX") == (7, 8)
+    store.close()
+
+
+class ContextMailBox:
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+
+    def __enter__(self):
+        return self.mailbox
+
+    def __exit__(self, *args):
+        return False
@@ -0,0 +1,44 @@
+import pytest
+from generic_mail_archive import MailArchive
+from generic_pipeline_sinks import DryRunSinks, use_sinks
+
+
+def email(subject, sender, body, message_id, date="2024-06-30T08:00:00"):
+    return {"subject": subject, "from": sender, "to": ("me@example.com",), "date": date, "body": body,
+            "headers": {"Message-ID": (message_id,)}, "attachments": []}
+
+
+@pytest.fixture(params=[True, False], ids=["fts5", "like"])
+def archive(tmp_path, request):
+    archive = MailArchive(tmp_path / "mail.sqlite", full_text=request.param)
+    archive.append(email("Daily report", "reports@payrange.com", "Download <https://x/report.csv>", "<1@p>"), "me", 11)
+    archive.append(email("Lunch", "friend@example.com", "Pizza today?", "<2@e>", "2024-07-01T12:00:00"), "me", 12)
+    yield archive
+    archive.close()
+
+
+def test_message_is_archived_once(archive):
+    assert not archive.append(email("Daily report", "reports@payrange.com", "again", "<1@p>"))
+    assert len(archive) == 2
+
+
+def test_find_by_rule_text_and_date(archive):
+    assert [m["uid"] for m in archive.find(rule={"from": "PAYRANGE.com"})] == ["11"]
+    assert [m["subject"] for m in archive.find(text="download report")] == ["Daily report"]
+    assert [m["subject"] for m in archive.find(since="2024-07-01")] == ["Lunch"]
+    assert [m["subject"] for m in archive.find()] == ["Lunch", "Daily report"]  # newest first
+    assert archive.find(text='pizza "quoted') == [] and archive.find(text="pizza")[0]["recipients"] == "me@example.com"
+
+
+def test_handled_messages_are_not_offered_again(archive):
+    message, = archive.find(rule={"subject": "daily"}, unhandled=True)
+    archive.mark_handled(message["id"], "download_link")
+    assert archive.find(rule={"subject": "daily"}, unhandled=True) == []
+
+
+def test_dry_run_does_not_write(tmp_path):
+    archive = MailArchive(tmp_path / "mail.sqlite")
+    with use_sinks(DryRunSinks()) as sinks:
+        assert not archive.append(email("Daily report", "a@b", "", "<1@p>"))
+    assert len(archive) == 0 and sinks.records[0][0] == "mail_archive"
+    archive.close()
@@ -1,13 +1,17 @@
 import pytest
 from pathlib import Path
-from datetime import datetime
+from datetime import date, datetime
 from generic_munge_functions import (
     print_pdf_using_os_subprocess,
     archive_original_file,
     is_date_valid,
     extract_dates,
     extract_date_from_filename,
+    find_report_dates,
+    DATE_HINT_SINGLE,
+    DATE_HINT_RANGE,
 )
+import generic_munge_functions
 
 def test_is_date_valid():
     assert is_date_valid("2023-09-21") is True
@@ -20,7 +24,7 @@ def test_extract_dates():
     # Test with a string containing multiple date formats
     test_string = "The date is 2023-09-21, and also 09-21-2023 or 20230921"
     result = extract_dates(test_string)
-    expected = ["2023-09-21"]
+    expected = [date(2023, 9, 21)]
     assert result == expected
 
     # Test with an invalid date string
@@ -34,11 +38,27 @@ def test_extract_dates():
     expected = []
     assert result == expected
 
+
+def test_extract_dates_from_timestamps():
+    # a report date leading a longer run of digits, as in YYYYMMDDhhmmss
+    assert extract_dates("report_20240918103000") == [date(2024, 9, 18)]
+    assert find_report_dates("notifiernayaxcom_report_20240918103000") == [date(2024, 9, 18)]
+    assert extract_dates("report_20241318103000") == []  # month 13
+    assert is_date_valid("20240918103000") is False  # a timestamp is not a date on its own
+
+
+def test_date_benchmark_runs():
+    import benchmark_date_extraction as bench
+
+    rows = bench.run_benchmark(["report_20240918103000"], number=5, repeat=1)
+    assert rows[0]["legacy_us"] > 0 and rows[0]["current_us"] > 0
+    assert bench.legacy_extract_dates("report_20240918103000") == ["2024-09-18"]
+
 def test_extract_date_from_filename():
     # Test with a filename that contains multiple date formats
     filename = "report_2023-09-21_final_09212023.txt"
     result = extract_date_from_filename(filename)
-    expected = "20240921"
+    expected = "20230921"
     assert result == expected
 
     # Test with no valid date in the filename
@@ -46,6 +66,28 @@ def test_extract_date_from_filename():
     result = extract_date_from_filename(filename)
     assert result == 'xxxxxxxx'
 
+def test_find_report_dates_hints():
+    name = "pay_at_machine_log_2024-06-19_to_2024-08-02"
+    assert find_report_dates(name) == [date(2024, 6, 19), date(2024, 8, 2)]
+    assert find_report_dates(name, hint=DATE_HINT_SINGLE) == [date(2024, 6, 19)]
+    assert find_report_dates(name, hint=DATE_HINT_RANGE) == [date(2024, 6, 19), date(2024, 8, 2)]
+    # a range hint with one date uses it as both start and end
+    assert find_report_dates("pay_at_machine_log_2024-06-19", hint=DATE_HINT_RANGE) == [date(2024, 6, 19)] * 2
+    with pytest.raises(ValueError):
+        find_report_dates(name, hint="weekly")
+
+def test_find_report_dates_fallback_only_when_needed(monkeypatch):
+    calls = []
+    original = generic_munge_functions._dates_from_dateutil
+    monkeypatch.setattr(generic_munge_functions, "_dates_from_dateutil", lambda fname: calls.append(fname) or original(fname))
+    generic_munge_functions._cached_report_dates.cache_clear()
+
+    assert find_report_dates("Revenue_2024-08-01") == [date(2024, 8, 1)]
+    assert find_report_dates("Revenue_5 August 2024") == [date(2024, 8, 5)]
+    assert find_report_dates("Revenue_5 August 2024") == [date(2024, 8, 5)]  # second lookup is cached
+    assert find_report_dates("Revenue_2024") == []  # a bare year is not a date
+    assert calls == ["Revenue_5 August 2024", "Revenue_2024"]
+
 def test_archive_original_file(tmp_path):
     # Set up test paths using pytest's tmp_path fixture
     input_file = tmp_path / "test_input.txt"
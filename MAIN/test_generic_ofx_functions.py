@@ -0,0 +1,198 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import pytest
+from generic_ofx_functions import parse_qbo, parse_ofx_datetime, merge_qbo_documents, FITIDLedger
+
+HEADER = "OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\n\n"
+
+
+def make_qbo(transactions, dtstart="20240101", dtend="20240131", acctid="123456"):
+    body = "".join(
+        f"<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>{posted}\n<TRNAMT>{amount}\n<FITID>{fitid}\n<NAME>{name}\n<MEMO>{memo}\n</STMTTRN>\n"
+        for fitid, posted, amount, name, memo in transactions
+    )
+    return (
+        HEADER
+        + "<OFX>\n<BANKMSGSRSV1>\n<STMTTRNRS>\n<STMTRS>\n<CURDEF>USD\n"
+        + f"<BANKACCTFROM>\n<BANKID>043400036\n<ACCTID>{acctid}\n<ACCTTYPE>CHECKING\n</BANKACCTFROM>\n"
+        + f"<BANKTRANLIST>\n<DTSTART>{dtstart}\n<DTEND>{dtend}\n{body}</BANKTRANLIST>\n"
+        + "</STMTRS>\n</STMTTRNRS>\n</BANKMSGSRSV1>\n</OFX>\n"
+    )
+
+
+SAMPLE = make_qbo([
+    ("1001", "20240105120000.000", "-12.50", "1001", "POS DB KROGER #123"),
+    ("1002", "20240110", "250.00", "1002", "ACH NAYAX REIM"),
+])
+
+
+def test_parse_ofx_datetime():
+    assert parse_ofx_datetime("20240131") == datetime(2024, 1, 31)
+    assert parse_ofx_datetime("20240131120501.250") == datetime(2024, 1, 31, 12, 5, 1, 250000)
+    assert parse_ofx_datetime("20240131120000[-5:EST]") == datetime(2024, 1, 31, 12, tzinfo=timezone(timedelta(hours=-5)))
+    assert parse_ofx_datetime("not a date") is None
+
+
+def test_parse_typed_transactions():
+    document = parse_qbo(SAMPLE)
+    assert document.account_id == "123456"
+    assert document.statement_end == "20240131"
+    first, second = document.transactions
+    assert first.fitid == "1001"
+    assert first.trnamt == Decimal("-12.50")
+    assert first.dtposted == datetime(2024, 1, 5, 12)
+    assert second.memo == "ACH NAYAX REIM"
+    assert set(document.fitid_index) == {"1001", "1002"}
+
+
+def test_round_trip_keeps_tags_and_order():
+    document = parse_qbo(SAMPLE)
+    assert parse_qbo(document.serialize()).serialize() == document.serialize()
+    assert document.serialize().startswith("OFXHEADER:100")
+    tags = [child.tag for child in document.transactions[0].element.children]
+    assert tags == ["TRNTYPE", "DTPOSTED", "TRNAMT", "FITID", "NAME", "MEMO"]
+
+
+def test_xml_style_closing_tags_are_kept():
+    document = parse_qbo("<OFX><STMTTRN><FITID>9</FITID><NAME>A</NAME><MEMO></STMTTRN></OFX>")
+    transaction = document.transactions[0]
+    assert transaction.fitid == "9"
+    assert transaction.memo == ""
+    assert "<FITID>9</FITID>" in document.serialize()
+
+
+def test_filter_and_deduplicate():
+    document = parse_qbo(SAMPLE)
+    credits = document.filter(lambda transaction: transaction.trnamt > 0)
+    assert [transaction.fitid for transaction in credits.transactions] == ["1002"]
+    assert len(document.transactions) == 2  # original untouched
+    assert [transaction.fitid for transaction in document.deduplicate({"1001"}).transactions] == ["1002"]
+
+
+def test_merge_overlapping_downloads():
+    january = parse_qbo(SAMPLE)
+    overlap = parse_qbo(make_qbo([
+        ("1002", "20240110", "250.00", "1002", "ACH NAYAX REIM"),
+        ("1003", "20240203", "-5.00", "1003", "CKCD FREIGHT TOOLS"),
+    ], dtstart="20240110", dtend="20240205"))
+    merged = merge_qbo_documents([january, overlap])
+    assert [transaction.fitid for transaction in merged.transactions] == ["1001", "1002", "1003"]
+    assert merged.statement_start == "20240101"
+    assert merged.statement_end == "20240205"
+
+
+def test_merge_refuses_different_accounts():
+    with pytest.raises(ValueError):
+        merge_qbo_documents([parse_qbo(SAMPLE), parse_qbo(make_qbo([], acctid="999"))])
+
+
+def test_ledger_tracks_written_fitids(tmp_path):
+    ledger = FITIDLedger(tmp_path / "ledger.sqlite")
+    document = parse_qbo(SAMPLE)
+    ledger.record("123456", document.transactions[:1], "20240131_123456.qbo")
+    ledger.close()
+
+    ledger = FITIDLedger(tmp_path / "ledger.sqlite")
+    assert ledger.seen_fitids("123456") == {"1001"}
+    assert ledger.seen_fitids("999") == set()
+    ledger.close()
+
+
+def test_handler_writes_only_new_transactions(tmp_path, monkeypatch):
+    import Handler_wesbanco_QBO_fix as qbo
+
+    output_directory = tmp_path / "out"
+    output_directory.mkdir()
+    monkeypatch.setattr(qbo, "QBO_MODIFIED_DIRECTORY", output_directory)
+    monkeypatch.setattr(qbo, "QBO_FITID_LEDGER_FILE", tmp_path / "ledger.sqlite")
+    monkeypatch.setattr(qbo, "MEMO_CACHE_FILE", tmp_path / "memo.sqlite")
+    monkeypatch.setattr(qbo, "_memo_cache", None)
+
+    checking = tmp_path / "Export-checking.qbo"
+    savings = tmp_path / "Export-savings.qbo"
+    checking.write_text(SAMPLE)
+    savings.write_text(make_qbo([("2001", "20240111", "10.00", "2001", "BOOK TRANSFER")], acctid="777"))
+    results = qbo.process_qbo_exports([checking, savings], max_workers=2)
+    assert all(results.values())
+    # the workers hand their cleaned memos back and only the parent writes them
+    assert qbo.get_memo_cache().get("POS DB KROGER #123") == "KROGER #123"
+    assert not qbo.get_memo_cache()._pending
+    written = sorted(f.name for f in output_directory.iterdir())
+    assert written == ["20240131_123456.qbo", "20240131_777.qbo"]
+    cleaned = parse_qbo((output_directory / "20240131_123456.qbo").read_text())
+    assert cleaned.transactions[0].name == "KROGER #123"
+    assert cleaned.transactions[0].memo == "1001"
+
+    # a re-download overlapping the first one only produces the new transaction
+    redownload = tmp_path / "Export-checking-again.qbo"
+    redownload.write_text(make_qbo([
+        ("1002", "20240110", "250.00", "1002", "ACH NAYAX REIM"),
+        ("1003", "20240125", "-5.00", "1003", "CKCD FREIGHT TOOLS"),
+    ]))
+    assert qbo.process_qbo_exports([redownload])[redownload]
+    incremental = parse_qbo((output_directory / "20240131_123456_2.qbo").read_text())
+    assert [transaction.fitid for transaction in incremental.transactions] == ["1003"]
+
+
+def test_handler_records_siblings_and_skips_processed_ones(tmp_path, monkeypatch):
+    import Handler_wesbanco_QBO_fix as qbo
+    import generic_file_hash_functions as hashes
+
+    output_directory = tmp_path / "out"
+    output_directory.mkdir()
+    downloads = tmp_path / "downloads"
+    downloads.mkdir()
+    monkeypatch.setattr(qbo, "QBO_MODIFIED_DIRECTORY", output_directory)
+    monkeypatch.setattr(qbo, "QBO_FITID_LEDGER_FILE", tmp_path / "ledger.sqlite")
+    monkeypatch.setattr(qbo, "MEMO_CACHE_FILE", tmp_path / "memo.sqlite")
+    monkeypatch.setattr(qbo, "_memo_cache", None)
+    monkeypatch.setattr(hashes, "DOWNLOAD_HASH_INDEX_FILE", tmp_path / "index.sqlite")
+
+    checking = downloads / "Export-checking.qbo"
+    savings = downloads / "Export-savings.qbo"
+    checking.write_text(SAMPLE)
+    savings.write_text(make_qbo([("2001", "20240111", "10.00", "2001", "BOOK TRANSFER")], acctid="777"))
+    assert qbo.data_handler_process(checking)
+    assert not savings.exists()
+    index = hashes.ProcessedHashIndex(tmp_path / "index.sqlite")
+    sibling_hash = hashes.hash_file(downloads / "QBO_file_history" / "Export-savings.qbo")
+    assert index.lookup(sibling_hash)[0] == "Export-savings.qbo"
+    index.close()
+
+    # a re-sent sibling is left for the directory watcher to archive as a duplicate
+    resent = downloads / "Export-savings-resent.qbo"
+    resent.write_text(savings.parent.joinpath("QBO_file_history", "Export-savings.qbo").read_text())
+    checking.write_text(SAMPLE)
+    assert hashes.new_sibling_files(checking, qbo.declaration.matches) == {}
+    qbo.get_memo_cache().close()
+
+
+def test_dry_run_leaves_the_hash_index_and_memo_cache_alone(tmp_path, monkeypatch):
+    import sqlite3
+    import Handler_wesbanco_QBO_fix as qbo
+    import generic_file_hash_functions as hashes
+    from generic_pipeline_sinks import dry_run
+
+    downloads = tmp_path / "downloads"
+    downloads.mkdir()
+    monkeypatch.setattr(qbo, "QBO_MODIFIED_DIRECTORY", tmp_path / "out")
+    monkeypatch.setattr(qbo, "QBO_FITID_LEDGER_FILE", tmp_path / "ledger.sqlite")
+    monkeypatch.setattr(qbo, "MEMO_CACHE_FILE", tmp_path / "memo.sqlite")
+    monkeypatch.setattr(qbo, "_memo_cache", None)
+    monkeypatch.setattr(hashes, "DOWNLOAD_HASH_INDEX_FILE", tmp_path / "index.sqlite")
+
+    checking = downloads / "Export-checking.qbo"
+    savings = downloads / "Export-savings.qbo"
+    checking.write_text(SAMPLE)
+    savings.write_text(make_qbo([("2001", "20240111", "10.00", "2001", "BOOK TRANSFER")], acctid="777"))
+    sinks = dry_run(qbo.data_handler_process, checking)
+    assert sinks.result and checking.exists() and savings.exists()
+    assert {store for store, payload in sinks.records} == {"download_hash_index", "qbo_memo_cache"}
+    index = hashes.ProcessedHashIndex(tmp_path / "index.sqlite")
+    assert hashes.hash_file(checking) not in index and hashes.hash_file(savings) not in index
+    index.close()
+    assert hashes.new_sibling_files(checking, qbo.declaration.matches) == {savings: hashes.hash_file(savings)}
+    qbo.get_memo_cache().close()
+    with sqlite3.connect(tmp_path / "memo.sqlite") as connection:
+        tables = [name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        assert tables and all(connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 0 for table in tables)
@@ -0,0 +1,127 @@
+import os
+import sys
+import pytest
+import generic_pdf_functions as pdf_functions
+from generic_pdf_functions import WkhtmltopdfRenderer, convert_html_batch, find_wkhtmltopdf, stdin_argument
+from generic_pipeline_sinks import DryRunSinks, use_sinks
+
+# Stands in for wkhtmltopdf --read-args-from-stdin: one "input output" pair per line, one process per batch
+FAKE_WKHTMLTOPDF = f"""#!{sys.executable}
+import os, shlex, sys
+with open(os.environ["FAKE_WKHTMLTOPDF_LOG"], "a") as log:
+    log.write(" ".join(sys.argv[1:]) + "\\n")
+for line in sys.stdin:
+    source, target = shlex.split(line)
+    with open(target, "w") as pdf:
+        pdf.write("%PDF " + open(source).read())
+"""
+
+
+@pytest.fixture
+def fake_wkhtmltopdf(tmp_path, monkeypatch):
+    executable = tmp_path / "wkhtmltopdf"
+    executable.write_text(FAKE_WKHTMLTOPDF)
+    executable.chmod(0o755)
+    log = tmp_path / "invocations.log"
+    monkeypatch.setenv("FAKE_WKHTMLTOPDF_LOG", str(log))
+    monkeypatch.setenv(pdf_functions.WKHTMLTOPDF_PATH_VARIABLE, str(executable))
+    return executable, log
+
+
+@pytest.mark.skipif(os.name == "nt", reason="the stand-in executable is a script with a shebang")
+def test_batches_share_one_process_per_worker(tmp_path, fake_wkhtmltopdf):
+    executable, log = fake_wkhtmltopdf
+    assert find_wkhtmltopdf() == executable
+    pages = []
+    for number in range(5):
+        html = tmp_path / f"sales activity {number}.html"
+        html.write_text(f"page {number}")
+        pages.append((html, tmp_path / f"sales activity {number}.pdf"))
+
+    timings = convert_html_batch(pages, WkhtmltopdfRenderer(), workers=2)
+    assert sorted(timings) == sorted(pdf for html, pdf in pages)
+    assert all(seconds >= 0 for seconds in timings.values())
+    assert (tmp_path / "sales activity 3.pdf").read_text() == "%PDF page 3"
+    assert log.read_text().splitlines() == ["--quiet --read-args-from-stdin"] * 2
+
+
+def test_missing_renderer_and_dry_run(tmp_path, monkeypatch):
+    monkeypatch.delenv(pdf_functions.WKHTMLTOPDF_PATH_VARIABLE, raising=False)
+    monkeypatch.setattr(pdf_functions.shutil, "which", lambda name: None)
+    monkeypatch.setattr(pdf_functions, "WKHTMLTOPDF_WINDOWS_PATH", tmp_path / "missing.exe")
+    assert find_wkhtmltopdf() is None
+    with pytest.raises(FileNotFoundError):
+        WkhtmltopdfRenderer()
+
+    html = tmp_path / "report.html"
+    html.write_text("page")
+    with use_sinks(DryRunSinks()) as sinks:
+        assert convert_html_batch([(html, tmp_path / "report.pdf")]) == {tmp_path / "report.pdf": 0.0}  # no renderer is needed
+    assert list(sinks.outputs) == [tmp_path / "report.pdf"]
+
+
+def test_html_handler_prints_and_archives_only_converted_pages(tmp_path, monkeypatch):
+    import Handler_html_munge as html_munge
+    import generic_file_hash_functions as hashes
+    monkeypatch.setattr(hashes, "DOWNLOAD_HASH_INDEX_FILE", tmp_path / "index.sqlite")
+    downloads = tmp_path / "downloads"
+    downloads.mkdir()
+    report, sibling, failing = (downloads / f"sales_activity_by_batch_{day}.html" for day in ("01", "02", "03"))
+    for number, html in enumerate((report, sibling, failing)):
+        html.write_text(f"page {number}")
+    resent = downloads / "sales_activity_by_batch_01 (1).html"
+    resent.write_text("page 9")
+    hashes.record_processed_files({resent: hashes.hash_file(resent)}, tmp_path / "index.sqlite")
+
+    batches, printed = [], []
+    def convert(pages):
+        batches.append([html.name for html, pdf in pages])
+        for html, pdf in pages[:2]:
+            pdf.write_text("%PDF")
+        return {pdf: 0.1 for html, pdf in pages[:2]}  # the batch holding the last page failed
+    monkeypatch.setattr(html_munge, "convert_html_batch", convert)
+    monkeypatch.setattr(html_munge, "print_pdf", lambda pdf, printer: printed.append(pdf))
+
+    assert html_munge.data_handler_process(report)
+    archive = downloads / html_munge.ARCHIVE_DIRECTORY_NAME
+    assert batches == [[report.name, sibling.name, failing.name]]  # the re-sent copy is left for the watcher
+    assert printed == [archive / f"{report.stem}.pdf", archive / f"{sibling.stem}.pdf"]
+    assert sorted(path.name for path in downloads.iterdir()) == sorted([html_munge.ARCHIVE_DIRECTORY_NAME, resent.name, failing.name])
+    assert (archive / sibling.name).exists()
+    index = hashes.ProcessedHashIndex(tmp_path / "index.sqlite")
+    assert index.lookup(hashes.hash_file(archive / sibling.name))[0] == sibling.name
+    assert hashes.hash_file(failing) not in index
+    index.close()
+
+
+def test_stdin_lines_escape_windows_separators_and_quotes(tmp_path, monkeypatch):
+    assert stdin_argument(r'D:\Users\Conrad\Downloads\a "b".html') == r'"D:\\Users\\Conrad\\Downloads\\a \"b\".html"'
+    html = tmp_path / r"D:\Users\Conrad\sales.html"  # a plain file name on Linux, backslashes and all
+    pdf = tmp_path / r"D:\Users\Conrad\sales.pdf"
+    html.write_text("page")
+    sent = []
+
+    def run(command, input, **kwargs):
+        sent.append(input)
+        pdf.write_text("%PDF")
+    monkeypatch.setattr(pdf_functions.subprocess, "run", run)
+    WkhtmltopdfRenderer(executable=tmp_path / "wkhtmltopdf").render_batch([(html, pdf)])
+    escaped = str(tmp_path).replace("\\", "\\\\")
+    assert sent == [rf'"{escaped}/D:\\Users\\Conrad\\sales.html" "{escaped}/D:\\Users\\Conrad\\sales.pdf"' + "\n"]
+
+
+def test_html_handler_dry_run_succeeds_without_side_effects(tmp_path, monkeypatch):
+    import Handler_html_munge as html_munge
+    import generic_file_hash_functions as hashes
+    from generic_pipeline_sinks import dry_run
+    monkeypatch.setattr(hashes, "DOWNLOAD_HASH_INDEX_FILE", tmp_path / "index.sqlite")
+    report = tmp_path / "sales_activity_by_batch_01.html"
+    sibling = tmp_path / "sales_activity_by_batch_02.html"
+    report.write_text("page 1")
+    sibling.write_text("page 2")
+    sinks = dry_run(html_munge.data_handler_process, report)
+    archive = tmp_path / html_munge.ARCHIVE_DIRECTORY_NAME
+    assert sinks.result
+    assert [pdf for pdf, printer in sinks.printed] == [archive / f"{report.stem}.pdf", archive / f"{sibling.stem}.pdf"]
+    assert [source for source, destination in sinks.moves] == [report, sibling]
+    assert report.exists() and sibling.exists() and not list(archive.glob("*.pdf"))
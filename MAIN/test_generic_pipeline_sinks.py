@@ -0,0 +1,39 @@
+from pathlib import Path
+import Handler_Kiosoft_revenue_detail_report as kiosoft
+from generic_pipeline_sinks import DryRunSinks, SystemSinks, dry_run, get_sinks, use_sinks
+from generic_pathlib_file_methods import move_file_with_check
+from test_kiosoft_aggregation import write_log
+
+
+def test_use_sinks_restores_the_system_sinks():
+    with use_sinks(DryRunSinks()) as sinks:
+        assert get_sinks() is sinks
+    assert type(get_sinks()) is SystemSinks
+
+
+def test_dry_run_moves_nothing(tmp_path):
+    source = tmp_path / "report.csv"
+    source.write_text("a,b\n")
+    with use_sinks(DryRunSinks()) as sinks:
+        assert move_file_with_check(source, tmp_path / "archive" / "report.csv")
+    assert source.exists()
+    assert not (tmp_path / "archive").exists()
+    assert sinks.moves == [(source, tmp_path / "archive" / "report.csv")]
+
+
+def test_kiosoft_handler_dry_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    log = write_log(tmp_path / "pay_at_machine_log_2024-06-19_to_2024-06-21.csv")
+    sinks = dry_run(kiosoft.data_handler_process, log)
+
+    assert sinks.result is True
+    assert log.exists()
+    assert not (tmp_path / kiosoft.ARCHIVE_DIRECTORY_NAME).exists()
+    assert not Path("temp.xlsx").exists()
+    frame = sinks.frames()[Path("temp.xlsx")]
+    assert frame.columns.tolist()[1:] == ["101", "102"]
+    assert frame.iloc[2, 1:].tolist() == [4.5, 4.0]
+    assert sinks.printed == [(Path("temp.xlsx"), None)]
+    store, payload = sinks.records[0]
+    assert store == "revenue_history" and payload["source_file"] == log.name and payload["rows"]
+    assert [kind for kind, _ in sinks.events] == ["record", "output", "print", "archive"]
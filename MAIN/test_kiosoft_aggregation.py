@@ -0,0 +1,47 @@
+import pandas as pd
+import Handler_Kiosoft_revenue_detail_report as kiosoft
+
+HEADER = ("Date Time,Ultra S/N,Machine,Machine ID,Location ID,Bank Card Number,Card Type,Location,"
+          "Transaction Type,Total Amount ($),Pre-Auth Amount ($),Set Pre-Auth Amount ($),Discount,Special Amt,Response Code")
+ROWS = [
+    ("2024-06-19 10:00:00", " 101 ", "2.50", " APPROVAL "),
+    ("2024-06-19 11:00:00", " 101 ", "3.00", " DECLINED "),
+    ("2024-06-20 09:00:00", "102", "4.00", "APPROVAL"),
+    ("2024-06-20 12:00:00", "102", "1.25", "Declined - insufficient funds"),
+    ("2024-06-21 08:00:00", "101", "2.00", "APPROVAL"),
+]
+
+
+def write_log(path):
+    lines = [HEADER] + [f"{when},1,W,{machine},9,x,V, Laundry A ,Sale,{amount},0,0,0,0,{code}" for when, machine, amount, code in ROWS]
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+def test_streaming_matches_in_memory(tmp_path):
+    log = write_log(tmp_path / "pay_at_machine_log_2024-06-19_to_2024-06-21.csv")
+    in_memory = kiosoft.process_kiosoft_csv(log)
+    streamed = kiosoft.process_kiosoft_csv(log, chunksize=2)
+    pd.testing.assert_frame_equal(in_memory, streamed, check_dtype=False)
+
+
+def test_single_pass_totals_and_breakdowns(tmp_path):
+    log = write_log(tmp_path / "log.csv")
+    for chunksize in (None, 2):
+        summaries, location = kiosoft.summarize_kiosoft_log(log, chunksize, breakdowns=("machine", "location", "day"))
+        assert location == "Laundry A"
+        machines = summaries["machine"]
+        assert machines.loc["101"].tolist() == [7.5, 3.0, 4.5]
+        assert machines.loc["102"].tolist() == [5.25, 1.25, 4.0]
+        assert summaries["location"].loc["Laundry A"].tolist() == [12.75, 4.25, 8.5]
+        assert summaries["day"][kiosoft.NET_LABEL].tolist() == [2.5, 4.0, 2.0]
+
+
+def test_machine_01_is_reported(tmp_path):
+    log = tmp_path / "pay_at_machine_log_2024-06-19_to_2024-06-21.csv"
+    lines = [HEADER] + [f"{when},1,W,{machine},9,x,V, Laundry A ,Sale,{amount},0,0,0,0,{code}" for when, machine, amount, code in ROWS]
+    lines.append("2024-06-21 09:00:00,1,W,01,9,x,V, Laundry A ,Sale,6.00,0,0,0,0,APPROVAL")
+    log.write_text("\n".join(lines) + "\n")
+    report = kiosoft.process_kiosoft_csv(log)
+    assert report.columns.tolist() == ["index", "01", "101", "102"]
+    assert report["01"].tolist()[:3] == [6.0, 0.0, 6.0]
@@ -0,0 +1,68 @@
+import io
+import pytest
+import zipfile
+import pandas as pd
+import Handler_Nayax_zip_files as nayax
+
+
+def make_zip(path, members):
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return path
+
+
+def xlsx_bytes(frame):
+    buffer = io.BytesIO()
+    frame.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def test_is_safe_member_name():
+    assert nayax.is_safe_member_name("report/sales.csv")
+    assert not nayax.is_safe_member_name("../sales.csv")
+    assert not nayax.is_safe_member_name("/etc/passwd")
+    assert not nayax.is_safe_member_name("C:\\Windows\\sales.csv")
+
+
+def test_members_are_parsed_without_extraction(tmp_path, monkeypatch):
+    monkeypatch.setattr(nayax, "CSV_CHUNK_ROWS", 10)
+    csv_text = "Machine,Amount\n" + "".join(f"M{i},{i}.50\n" for i in range(95))
+    zip_path = make_zip(tmp_path / "notifiernayaxcom_report_20240918.zip", {
+        "sales.csv": csv_text,
+        "summary.xlsx": xlsx_bytes(pd.DataFrame({"Total": [1.5, 2.5]})),
+        "logo.png": b"not tabular",
+    })
+    summaries = nayax.stream_zip_members(zip_path)
+    assert sorted(summaries) == ["sales.csv", "summary.xlsx"]
+    assert summaries["sales.csv"].rows == 95
+    assert summaries["sales.csv"].columns == ["Machine", "Amount"]
+    assert (summaries["summary.xlsx"].rows, summaries["summary.xlsx"].columns) == (2, ["Total"])
+    assert sorted(p.name for p in tmp_path.iterdir()) == [zip_path.name]  # nothing extracted
+
+
+def test_streaming_limit_rejects_oversized_member(tmp_path, monkeypatch):
+    monkeypatch.setattr(nayax, "MAX_FILE_SIZE", 1000)
+    monkeypatch.setattr(nayax, "STREAM_READ_SIZE", 256)
+    zip_path = make_zip(tmp_path / "bomb.zip", {
+        "big.csv": "a,b\n" + "1,2\n" * 5000,  # compresses to almost nothing
+        "small.csv": "a,b\n1,2\n",
+    })
+    summaries = nayax.stream_zip_members(zip_path)
+    assert list(summaries) == ["small.csv"]
+
+
+def test_archive_budget_is_shared(tmp_path):
+    budget = nayax.StreamBudget(20)
+    zip_path = make_zip(tmp_path / "two.zip", {"one.csv": "a,b\n1,2\n3,4\n", "two.csv": "a,b\n5,6\n7,8\n"})
+    nayax.read_zip_member(zip_path, "one.csv", budget)  # 12 bytes
+    with pytest.raises(ValueError):
+        nayax.read_zip_member(zip_path, "two.csv", budget)  # 24 bytes in total
+
+
+def test_csv_chunks_are_not_concatenated(tmp_path, monkeypatch):
+    monkeypatch.setattr(nayax, "CSV_CHUNK_ROWS", 10)
+    monkeypatch.setattr(nayax.panda, "concat", lambda *args, **kwargs: pytest.fail("member was concatenated"))
+    zip_path = make_zip(tmp_path / "rows.zip", {"sales.csv": "a,b\n" + "1,2\n" * 45})
+    summary = nayax.read_zip_member(zip_path, "sales.csv", nayax.StreamBudget(10_000))
+    assert (summary.rows, summary.columns) == (45, ["a", "b"])